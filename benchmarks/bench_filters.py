@@ -0,0 +1,113 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Measure how many filter strings per second are parsed.
+
+Compares the recursive descent parser of :mod:`cardbox.utils.filters`
+with the pyparsing grammar it replaced, if pyparsing is installed.
+Only the parsing is measured, not building the Q objects.  Run it
+from the repository root with::
+
+   python benchmarks/bench_filters.py [seconds per parser]
+
+"""
+import os
+import sys
+import time
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cardboxsite.settings')
+os.environ.setdefault('DJANGO_CARDBOX_SECRET_KEY', 'benchmark')
+django.setup()
+
+from cardbox.utils.filters import (
+    BINOPS,
+    NOT,
+    UNOPS,
+    _tokenise_filter_string,
+)
+
+FILTERS = [
+    'Sphinx',
+    'Sphinx & ~ ~(>=Pro "Sphinx of the")',
+    r"='Sphinx\'s Revelation' | ~Sphinx",
+    '=Instant = Sorcery | (Legendary & (Artifact | Creature))',
+    '>=2 <4',
+    '(Devoid ingest) | (exile & Planeswalker)',
+    "r'^Sphinx.*' | ~(Pro & =Sorcery)",
+    '=M | =R',
+    "='2+*'",
+    '>=2WU <=XX{2/W}{BP}',
+]
+
+
+def pyparsing_grammar():
+    """Return the pyparsing grammar of the filter language or ``None``."""
+    try:
+        import pyparsing as pp
+    except ImportError:
+        return None
+    fg_not = pp.Literal(NOT).setResultsName('not')
+    fg_word = pp.Word(pp.alphanums + '*/{}+-\'').setResultsName('word')
+    fg_binop = pp.oneOf(BINOPS).setResultsName('binop')
+    fg_unop = pp.oneOf(list(UNOPS.keys())).setResultsName('unop')
+    fg_regex = pp.Or([
+        pp.QuotedString("r'", endQuoteChar="'", escChar='\\'),
+        pp.QuotedString('r"', endQuoteChar='"', escChar='\\'),
+    ]).setResultsName('regex')
+    fg_literal = pp.Or([
+        pp.QuotedString("'", escChar='\\'),
+        pp.QuotedString('"', escChar='\\'),
+    ]).setResultsName('literal')
+    fg_atom = pp.Optional(fg_unop) + (fg_regex ^ fg_literal ^ fg_word)
+    fg_expr_part = (pp.ZeroOrMore(pp.Group(fg_not)) + pp.Group(fg_atom) +
+                    pp.Optional(pp.Group(fg_binop)))
+    fg_nested = pp.nestedExpr(content=pp.OneOrMore(fg_expr_part))
+    fg_syntax_part = (pp.ZeroOrMore(pp.Group(fg_not)) +
+                      (pp.Group(fg_atom) ^ fg_nested) +
+                      pp.Optional(pp.Group(fg_binop)))
+    return pp.OneOrMore(fg_syntax_part)
+
+
+def filters_per_second(parse, duration):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for fstr in FILTERS:
+            parse(fstr)
+        count += len(FILTERS)
+    return count/(time.perf_counter() - start)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    print('{0} filter strings, {1:.1f}s per parser'
+          .format(len(FILTERS), duration))
+    fast = filters_per_second(_tokenise_filter_string, duration)
+    grammar = pyparsing_grammar()
+    if grammar is None:
+        print('{0:<14} {1:>10.1f} filters/s'.format('descent', fast))
+        print('pyparsing is not installed, nothing to compare with.')
+        return
+    base = filters_per_second(grammar.parseString, duration)
+    print('{0:<14} {1:>10.1f} filters/s'.format('pyparsing', base))
+    print('{0:<14} {1:>10.1f} filters/s  ({2:.1f}x)'
+          .format('descent', fast, fast/base))
+
+
+if __name__ == '__main__':
+    main()
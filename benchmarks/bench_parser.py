@@ -0,0 +1,78 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Measure how many card pages per second the parser engines handle.
+
+Only the HTML parsing is measured; the pages are read from the
+recorded pages in ``tests/pages`` beforehand.  Run it from the
+repository root with::
+
+   python benchmarks/bench_parser.py [seconds per engine]
+
+"""
+import glob
+import os
+import sys
+import time
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cardboxsite.settings')
+os.environ.setdefault('DJANGO_CARDBOX_SECRET_KEY', 'benchmark')
+django.setup()
+
+from cardbox.utils.parser import (
+    FAST_HTML_PARSER,
+    MCIParser,
+    FastMCIParser,
+)
+
+
+def load_pages():
+    pages = []
+    pattern = os.path.join(BASE_DIR, 'tests', 'pages', '*', 'en', '*.html')
+    for path in sorted(glob.glob(pattern)):
+        setcode = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        number = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding='utf-8') as f:
+            pages.append((f.read(), setcode, number))
+    return pages
+
+
+def pages_per_second(parser, pages, duration):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for html, setcode, number in pages:
+            parser._parse_card_html(html, setcode, number)
+        count += len(pages)
+    return count/(time.perf_counter() - start)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    pages = load_pages()
+    print('{0} recorded card pages, {1:.1f}s per engine'
+          .format(len(pages), duration))
+    base = pages_per_second(MCIParser, pages, duration)
+    print('{0:<14} {1:>8.1f} pages/s'.format('MCIParser', base))
+    fast = pages_per_second(FastMCIParser, pages, duration)
+    print('{0:<14} {1:>8.1f} pages/s  ({2:.1f}x, {3})'
+          .format('FastMCIParser', fast, fast/base, FAST_HTML_PARSER))
+
+
+if __name__ == '__main__':
+    main()
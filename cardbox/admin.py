@@ -23,6 +23,7 @@ from cardbox.models import (
     CardEdition,
     Collection,
     CollectionEntry,
+    CollectionImport,
 )
 
 
@@ -125,3 +126,12 @@ class CollectionAdmin(admin.ModelAdmin):
     )
     filter_horizontal = ('viewers', 'editors',)
     list_display = ('name', 'owner', 'date_created',)
+
+
+@admin.register(CollectionImport)
+class CollectionImportAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'collection', 'user', 'status',
+                    'rows_imported', 'error_count', 'date_created',)
+    list_filter = ('status',)
+    readonly_fields = ('size', 'bytes_done', 'rows_done', 'rows_imported',
+                       'error_count', 'errors', 'date_finished',)
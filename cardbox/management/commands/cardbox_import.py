@@ -0,0 +1,89 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from django.core.management.base import BaseCommand, CommandError
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+from cardbox.utils.pipeline import (
+    UnknownSetError,
+    run_pipeline,
+)
+
+
+class Command(BaseCommand):
+    help = ("Import blocks, sets and cards from magiccards.info, "
+            "fetching, parsing and writing at the same time.")
+
+    # The parser used for the import.
+    PARSER = MCIParser
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sets', nargs='+', metavar='CODE',
+            help="Only import the cards of these sets.")
+        parser.add_argument(
+            '--update', action='store_true',
+            help="Update existing rows instead of skipping them.")
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Delete links to rulings and multi card parts that "
+                 "disappeared from the source.")
+        parser.add_argument(
+            '--workers', type=int, metavar='N',
+            help="Number of pages downloaded at the same time.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Fetch and parse everything but don't write to the "
+                 "database.")
+        parser.add_argument(
+            '--report', metavar='FILE',
+            help="Write the report of the run as JSON to FILE.")
+
+    def _print_progress(self, pipeline):
+        status = pipeline.status()
+        self.stdout.write(
+            "\r{sets}/{sets_total} sets, {cards} cards, {pages} pages "
+            "({pages_per_second:.1f} pages/s, {cards_per_second:.1f} "
+            "cards/s), queued {fetched}/{parsed}  ".format(**status),
+            ending='')
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        progress = self._print_progress if options['verbosity'] else None
+        try:
+            report = run_pipeline(self.PARSER, setcodes=options['sets'],
+                                  update=options['update'],
+                                  workers=options['workers'],
+                                  dry_run=options['dry_run'],
+                                  prune=options['prune'],
+                                  progress=progress)
+        except UnknownSetError as e:
+            raise CommandError(str(e))
+        finally:
+            if progress is not None:
+                self.stdout.write('')
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                f.write(report.to_json(indent=2))
+        totals = report.totals()
+        self.stdout.write(
+            "{0} pages in {1:.1f}s: {2} rows inserted, {3} updated, "
+            "{4} unchanged.".format(report.pages, report.elapsed(),
+                                    totals['inserted'], totals['updated'],
+                                    totals['unchanged']))
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import datetime
+import hashlib
 import re
 
 from django.contrib.auth.models import User
@@ -29,13 +30,30 @@ class Artist(models.Model):
 
 
 class Ruling(models.Model):
-    """Model for rulings that affect certain `cardbox.models.Card`s."""
-    ruling = models.TextField(unique=True)
+    """Model for rulings that affect certain `cardbox.models.Card`s.
+
+    Rulings are unique by the SHA-256 digest of their text, which is
+    set on save.  An index on the digest stays small, unlike one on
+    the text.
+
+    """
+    ruling = models.TextField()
     date = models.DateField("date of the ruling")
+    digest = models.CharField(max_length=64, unique=True, null=True,
+                              editable=False)
 
     def __str__(self):
         return '{0}: {1}'.format(self.date, self.ruling)
 
+    def save(self, *args, **kwargs):
+        self.digest = self.get_digest(self.ruling)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_digest(text):
+        """Return the digest identifying the ruling ``text``."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
 
 class Block(models.Model):
     """Model for a block in Magic The Gathering.  Used to group
@@ -78,6 +96,10 @@ class Set(models.Model):
     name = models.CharField("full name", max_length=100, unique=True)
     release_date = models.DateField(blank=True, default=datetime.date(1, 1, 1))
 
+    # Digest of the imported fields, see `cardbox.utils.db`.
+    import_digest = models.CharField(max_length=40, blank=True, default='',
+                                     editable=False)
+
     class Meta:
         ordering = ['-release_date']
 
@@ -172,6 +194,10 @@ class Card(models.Model):
     legal_modern = models.CharField(max_length=1, choices=LEGALITIES,
                                     default=LEGALITY_NONE, blank=True)
 
+    # Digest of the imported fields, see `cardbox.utils.db`.
+    import_digest = models.CharField(max_length=40, blank=True, default='',
+                                     editable=False)
+
     # === META =======================================================
     class Meta:
         ordering = ['name']
@@ -366,6 +392,10 @@ class CardEdition(models.Model):
     rarity = models.CharField(max_length=1, choices=RARITIES,
                               default=RARITY_COMMON)
 
+    # Digest of the imported fields, see `cardbox.utils.db`.
+    import_digest = models.CharField(max_length=40, blank=True, default='',
+                                     editable=False)
+
     class Meta:
         unique_together = ('number', 'number_suffix', 'mtgset',)
         ordering = ('-mtgset__release_date',)
@@ -433,3 +463,65 @@ class CollectionEntry(models.Model):
 
     def __str__(self):
         return '{0} in {1}'.format(self.edition, self.collection.name)
+
+
+class CollectionImport(models.Model):
+    """Model the import of an uploaded file into a `Collection`.
+
+    The file is imported in the background, see
+    `cardbox.utils.uploads`; the progress is stored here so the user
+    can poll it.
+
+    """
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+
+    # === status =====================================================
+    STATUS_PENDING = 'P'
+    STATUS_RUNNING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+    STATUSES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    status = models.CharField(max_length=1, choices=STATUSES,
+                              default=STATUS_PENDING)
+
+    # === progress ===================================================
+    size = models.PositiveIntegerField("size of the file in bytes",
+                                       default=0)
+    bytes_done = models.PositiveIntegerField("bytes of the file read",
+                                             default=0)
+    rows_done = models.PositiveIntegerField("rows read", default=0)
+    rows_imported = models.PositiveIntegerField("rows added to the "
+                                                "collection", default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # The first errors, one per line.
+    errors = models.TextField(blank=True, default='')
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    # Saved with every chunk, so an import that stopped making
+    # progress can be told apart from a running one.
+    date_updated = models.DateTimeField(auto_now=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+    def __str__(self):
+        return '{0} into {1}'.format(self.filename, self.collection.name)
+
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def get_progress(self):
+        """Return the share of the file read in percent."""
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.size:
+            return 0
+        return min(100, 100 * self.bytes_done // self.size)
@@ -33,6 +33,12 @@ urlpatterns = [
         views.collection, name='collection'),
     url(r'^collection/(?P<collection_id>[0-9]+)/add$',
         views.add_collection_entry, name='add_collection_entry'),
+    url(r'^collection/(?P<collection_id>[0-9]+)/export$',
+        views.export_collection, name='export_collection'),
+    url(r'^collection/(?P<collection_id>[0-9]+)/upload$',
+        views.upload_collection, name='upload_collection'),
+    url(r'^ajax/collectionimport/(?P<import_id>[0-9]+)/status$',
+        views.collection_import_status, name='collection_import_status'),
     url(r'^ajax/collectionentries/(?P<collection_id>[0-9]+)/update$',
         views.update_collection_entries, name='update_collection_entries'),
     url(r'^collection/(?P<collection_id>[0-9]+)/card/(?P<card_id>[0-9]+)/$',
@@ -0,0 +1,177 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import requests
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PageArchive:
+    """Compressed, content addressed archive of downloaded pages.
+
+    Every page body is stored gzipped under the SHA-256 hash of its
+    content in ``objects/``, so a page that didn't change between two
+    crawls is only stored once.  ``index.jsonl`` maps the URLs to
+    these hashes; a line is appended whenever the content of a URL
+    changes and the last line of a URL wins.
+
+    """
+    INDEX_NAME = 'index.jsonl'
+
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.path, self.INDEX_NAME), 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line of an interrupted write.
+                        logger.warning("Ignoring broken line in '%s'.",
+                                       self.path)
+                        continue
+                    self._index[entry['url']] = entry
+        except FileNotFoundError:
+            pass
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2],
+                            digest + '.gz')
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def urls(self):
+        """Return all archived URLs."""
+        return list(self._index)
+
+    def put(self, url, content, encoding=None):
+        """Store the body ``content`` of the page at ``url``.
+
+        :rtype: str
+        :returns: The hash of the content.
+
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(content))
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            entry = self._index.get(url)
+            if (entry is None or entry['sha256'] != digest or
+                entry['encoding'] != encoding):
+                now = datetime.datetime.now(datetime.timezone.utc)
+                entry = {
+                    'url': url,
+                    'sha256': digest,
+                    'encoding': encoding,
+                    'date': now.isoformat(),
+                }
+                with open(os.path.join(self.path, self.INDEX_NAME),
+                          'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+                self._index[url] = entry
+        return digest
+
+    def get(self, url):
+        """Return the body and encoding of the page at ``url``.
+
+        :raises KeyError: If the page isn't archived.
+
+        """
+        entry = self._index[url]
+        with open(self._object_path(entry['sha256']), 'rb') as f:
+            return gzip.decompress(f.read()), entry['encoding']
+
+
+class ArchivingClient:
+    """HTTP client storing every page it downloads in an archive.
+
+    Wraps a :class:`cardbox.utils.http.HTTPClient`.  Only successful
+    responses of the given content types are archived, so card images
+    don't end up in the archive.
+
+    """
+    CONTENT_TYPES = ('text/html',)
+
+    def __init__(self, client, archive, content_types=None):
+        self.client = client
+        self.archive = archive
+        self.content_types = content_types or self.CONTENT_TYPES
+
+    def get(self, url):
+        response = self.client.get(url)
+        content_type = response.headers.get('Content-Type', '')
+        if (response.status_code == 200 and
+            content_type.split(';')[0].strip() in self.content_types):
+            self.archive.put(url, response.content, response.encoding)
+        return response
+
+
+class ReplayClient:
+    """HTTP client answering all requests from an archive.
+
+    Never touches the network, so the whole catalog can be parsed
+    again offline, e.g. with::
+
+       MCIParser.CLIENT = ReplayClient(PageArchive(path))
+
+    """
+    def __init__(self, archive):
+        self.archive = archive
+
+    def get(self, url):
+        """Return the archived page at ``url`` as a response.
+
+        Pages that aren't archived (e.g. card images, which usually
+        aren't) are answered with an empty ``404 Not Found`` response,
+        just like a missing page on the network.
+
+        """
+        response = requests.Response()
+        try:
+            content, encoding = self.archive.get(url)
+        except KeyError:
+            logger.warning("Page '%s' is not in the archive.", url)
+            content, encoding = b'', None
+            response.status_code = 404
+        else:
+            response.status_code = 200
+        response.url = url
+        response.encoding = encoding
+        response._content = content
+        response.from_cache = True
+        return response
@@ -0,0 +1,226 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import aiohttp
+import asyncio
+import copy
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+from cardbox.utils.report import (
+    timer,
+)
+
+
+class AsyncMCIParser:
+    """magiccards.info engine running on an asyncio event loop.
+
+    Offers the same methods as :class:`cardbox.utils.parser.MCIParser`
+    but as coroutines and async generators.  All requests of one
+    parser share a single HTTP session and at most ``concurrency``
+    of them are in flight at any time, no matter how many sets are
+    crawled at once.
+
+    Use :class:`SyncMCIParser` to pass it to the functions in
+    :mod:`cardbox.utils.db`.
+
+    """
+    # The HTML is parsed by the MCIParser engine, so we only have to
+    # take care of the network here.
+    ENGINE = MCIParser
+    URL = MCIParser.URL
+    CONCURRENCY = 20
+    # See `cardbox.utils.parser.MCIParser.REPORT`.
+    REPORT = None
+
+    def __init__(self, concurrency=None, url=None):
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.url = url or self.URL
+        if self.url == self.ENGINE.URL:
+            self.engine = self.ENGINE
+        else:
+            self.engine = type(self.ENGINE.__name__, (self.ENGINE,),
+                               {'URL': self.url})
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _open(self):
+        """Create the HTTP session, unless it's open already."""
+        # The session and the semaphore have to be created inside the
+        # event loop they are used in.
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def _get(self, url):
+        """Return the text of the page at ``url``."""
+        await self._open()
+        async with self._semaphore:
+            with timer(self.REPORT, 'fetch'):
+                async with self._session.get(url) as response:
+                    text = await response.text()
+        if self.REPORT is not None:
+            self.REPORT.add_page()
+        return text
+
+    async def parse_blocks_sets(self):
+        """Parse all MTG blocks and their sets."""
+        html = await self._get(self.engine._sitemap_url())
+        for block, sets in self.engine._parse_blocks_sets_html(html):
+            yield block, sets
+
+    async def parse_card(self, setcode, number):
+        """Parse a card from it's detail page on magiccards.info.
+
+        See :meth:`cardbox.utils.parser.MCIParser.parse_card`.
+
+        """
+        html = await self._get(self.engine._card_url(setcode, number))
+        with timer(self.REPORT, 'parse'):
+            return self.engine._parse_card_html(html, setcode.lower(),
+                                                number)
+
+    async def parse_set_table(self, setcode):
+        """Parse the table of all cards in a set.
+
+        See :meth:`cardbox.utils.parser.MCIParser.parse_set_table`.
+
+        """
+        html = await self._get(self.engine._set_url(setcode))
+        return [edition for edition, _
+                in self.engine._parse_set_table_html(html)]
+
+    async def parse_cards_by_set(self, setcode, numbers=None):
+        """Parse all cards in a set.
+
+        The detail pages of all cards are requested at once, but the
+        cards are yielded in the order of the set table.
+
+        :param numbers: (optional) Only parse the cards with these
+            numbers (including the suffix, e.g. ``'60a'``).
+
+        """
+        html = await self._get(self.engine._set_url(setcode))
+        with timer(self.REPORT, 'parse'):
+            rows = self.engine._parse_set_table_html(html)
+        if numbers is not None:
+            rows = [row for row in rows if row[1] in numbers]
+        tasks = [asyncio.ensure_future(self.parse_card(setcode, number_str))
+                 for _, number_str in rows]
+        try:
+            for (edition, _), task in zip(rows, tasks):
+                card, artist, rulings = await task
+                yield edition, card, artist, rulings
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def parse_sets(self, setcodes):
+        """Parse all cards of several sets at once.
+
+        :rtype: dict
+        :returns: The list of ``(edition, card, artist, rulings)``
+            tuples of each set keyed by it's code.
+
+        """
+        async def parse_set(setcode):
+            return [entry async for entry in self.parse_cards_by_set(setcode)]
+
+        results = await asyncio.gather(*[parse_set(setcode)
+                                         for setcode in setcodes])
+        return dict(zip(setcodes, results))
+
+
+class SyncMCIParser:
+    """Run an :class:`AsyncMCIParser` from synchronous code.
+
+    The adapter owns a private event loop and offers the plain
+    generator interface expected by :mod:`cardbox.utils.db`, e.g.::
+
+       insert_blocks_sets_cards_from_parser(parser=SyncMCIParser())
+
+    """
+    def __init__(self, parser=None):
+        self.parser = parser or AsyncMCIParser()
+        self._loop = asyncio.new_event_loop()
+
+    @property
+    def REPORT(self):
+        return self.parser.REPORT
+
+    @REPORT.setter
+    def REPORT(self, report):
+        self.parser.REPORT = report
+
+    def __copy__(self):
+        """Return an adapter with a ``REPORT`` of its own.
+
+        The copy shares the event loop and the HTTP session, so only
+        the original has to be closed.
+
+        """
+        self._loop.run_until_complete(self.parser._open())
+        other = type(self).__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.parser = copy.copy(self.parser)
+        return other
+
+    def close(self):
+        """Close the async parser and the event loop."""
+        self._loop.run_until_complete(self.parser.close())
+        self._loop.close()
+
+    def _iterate(self, agen):
+        """Yield the items of the async generator ``agen``."""
+        try:
+            while True:
+                try:
+                    yield self._loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._loop.run_until_complete(agen.aclose())
+
+    def parse_blocks_sets(self):
+        yield from self._iterate(self.parser.parse_blocks_sets())
+
+    def parse_card(self, setcode, number):
+        return self._loop.run_until_complete(
+            self.parser.parse_card(setcode, number))
+
+    def parse_set_table(self, setcode):
+        return self._loop.run_until_complete(
+            self.parser.parse_set_table(setcode))
+
+    def parse_cards_by_set(self, setcode, numbers=None):
+        yield from self._iterate(
+            self.parser.parse_cards_by_set(setcode, numbers=numbers))
+
+    def parse_sets(self, setcodes):
+        return self._loop.run_until_complete(self.parser.parse_sets(setcodes))
@@ -0,0 +1,73 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Progress of an import stored in a JSON file.
+
+    Remembers which sets have been imported completely, so an
+    interrupted import can be resumed with the first set not done.
+    Every set is written in one transaction, so a set in progress is
+    rolled back as a whole and imported again.  The file is rewritten
+    after every set.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._sets = set()
+        self.load()
+
+    def load(self):
+        """Read the progress from the file, if it exists."""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        self._sets = set(data['sets'])
+        logger.info("Resuming from checkpoint '%s' with %s sets done.",
+                    self.path, len(self._sets))
+
+    def save(self):
+        """Atomically replace the file with the current progress."""
+        data = {
+            'sets': sorted(self._sets),
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Forget all progress and remove the file."""
+        self._sets = set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def is_set_done(self, setcode):
+        return setcode in self._sets
+
+    def mark_set_done(self, setcode):
+        self._sets.add(setcode)
+        self.save()
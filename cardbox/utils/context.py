@@ -0,0 +1,212 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+
+from collections import OrderedDict
+
+from cardbox.models import (
+    Artist,
+    Ruling,
+    Set,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.report import (
+    ImportReport,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMap:
+    """Least recently used map from natural keys to model instances.
+
+    Holds at most ``max_size`` instances.  As long as nothing was
+    evicted and the map was filled with all rows of its table, it is
+    ``complete`` and a missing key means there is no such row.
+
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+        self._objs = OrderedDict()
+
+    def __len__(self):
+        return len(self._objs)
+
+    def get(self, key):
+        obj = self._objs.get(key)
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._objs.move_to_end(key)
+        return obj
+
+    def put(self, key, obj):
+        self._objs[key] = obj
+        self._objs.move_to_end(key)
+        if len(self._objs) > self.max_size:
+            self._objs.popitem(last=False)
+            self.complete = False
+
+    def discard(self, key):
+        self._objs.pop(key, None)
+        # The row might still exist in the database.
+        self.complete = False
+
+    def forget(self, key):
+        """Remove ``key`` whose row is known not to exist."""
+        self._objs.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._objs),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ImportContext:
+    """In-memory maps of the rows touched during one import run.
+
+    The same artists, rulings and cards come up in hundreds of sets.
+    Passed to the ``insert_*`` functions of :mod:`cardbox.utils.db`,
+    the context answers their lookups by natural key from memory
+    and only queries the database for rows it doesn't know.
+
+    With ``preload`` all existing rows are loaded up front (as long
+    as they fit into ``max_size``), so even the lookups of new rows
+    don't need a query.  Each map holds at most ``max_size`` rows.
+
+    All rows added, updated or looked up are journaled, so the maps
+    can be rolled back together with a database transaction (see
+    :meth:`savepoint`).
+
+    The rows inserted, updated and left unchanged by the run are
+    counted in ``import_report``.
+
+    """
+    MAX_SIZE = 100000
+
+    # Map name => (model, function returning an instance's key)
+    MAPS = OrderedDict([
+        ('artists', (Artist, lambda a: a.name)),
+        ('rulings', (Ruling, lambda r: r.digest)),
+        ('sets', (Set, lambda s: s.code)),
+        ('cards', (Card, lambda c: c.name)),
+        ('editions', (CardEdition,
+                      lambda e: (e.mtgset_id, e.number, e.number_suffix))),
+    ])
+
+    def __init__(self, max_size=None, preload=False):
+        self.max_size = max_size or self.MAX_SIZE
+        self.maps = OrderedDict((name, IdentityMap(self.max_size))
+                                for name in self.MAPS)
+        self._journal = []
+        self.import_report = ImportReport()
+        if preload:
+            self.preload()
+
+    def preload(self):
+        """Load all existing rows that fit into the maps."""
+        for name, (model, get_key) in self.MAPS.items():
+            identity_map = self.maps[name]
+            # One more row than fits tells us if the map is complete.
+            objs = list(model.objects.all()[:self.max_size + 1])
+            for obj in objs[:self.max_size]:
+                identity_map.put(get_key(obj), obj)
+            identity_map.complete = len(objs) <= self.max_size
+            logger.info("Preloaded %s %s.", len(identity_map), name)
+
+    def get(self, map_name, key, **lookup):
+        """Return the instance with the natural ``key``.
+
+        Falls back to the database (with ``lookup`` as filter) if the
+        map is not complete.
+
+        :raises DoesNotExist: If there is no such row.
+
+        """
+        model, _ = self.MAPS[map_name]
+        identity_map = self.maps[map_name]
+        obj = identity_map.get(key)
+        if obj is not None:
+            return obj
+        if identity_map.complete:
+            raise model.DoesNotExist()
+        obj = model.objects.get(**lookup)
+        identity_map.put(key, obj)
+        # The row might have been written by the current transaction.
+        self._journal.append((map_name, key, False))
+        return obj
+
+    def put(self, map_name, obj, created=False):
+        """Remember the saved instance ``obj``.
+
+        :param bool created: (optional) Whether the current
+            transaction created the row.  Only then the row is known
+            not to exist after a rollback.
+
+        """
+        _, get_key = self.MAPS[map_name]
+        key = get_key(obj)
+        self.maps[map_name].put(key, obj)
+        self._journal.append((map_name, key, created))
+
+    def savepoint(self):
+        """Return the current position of the journal.
+
+        Pass it to :meth:`rollback` to forget all rows added since,
+        e.g. after the transaction that created them was rolled back.
+
+        """
+        return len(self._journal)
+
+    def rollback(self, savepoint):
+        """Forget all rows added or changed since ``savepoint``.
+
+        Created rows are gone with the transaction.  The other rows
+        are looked up again, as their changes were rolled back.
+
+        """
+        for map_name, key, created in reversed(self._journal[savepoint:]):
+            if created:
+                self.maps[map_name].forget(key)
+            else:
+                self.maps[map_name].discard(key)
+        del self._journal[savepoint:]
+
+    def commit(self):
+        """Empty the journal once no rollback can happen anymore."""
+        self._journal = []
+
+    def report(self):
+        """Return the size, hits, misses and hit rate of every map."""
+        return OrderedDict((name, identity_map.stats())
+                           for name, identity_map in self.maps.items())
+
+    def log_report(self):
+        for name, stats in self.report().items():
+            logger.info("%s: %d cached, %d hits, %d misses "
+                        "(%.1f%% hit rate).", name, stats['size'],
+                        stats['hits'], stats['misses'],
+                        stats['hit_rate'] * 100)
+        self.import_report.log()
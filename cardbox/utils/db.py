@@ -12,9 +12,22 @@
 
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import django
+import hashlib
+import io
+import json
 import logging
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    OperationalError,
+    connection,
+    connections,
+    transaction,
+)
 from django.db.models import F
 
 from cardbox.models import (
@@ -28,6 +41,16 @@ from cardbox.models import (
     CollectionEntry,
 )
 
+from cardbox.utils.context import (
+    ImportContext,
+)
+
+from cardbox.utils.report import (
+    ImportReport,
+    bind_report,
+    timer,
+)
+
 from cardbox.utils.parser import (
     MCIParser,
 )
@@ -36,41 +59,127 @@ from cardbox.utils.parser import (
 logger = logging.getLogger(__name__)
 
 
-def insert_artist(artist, update=False):
+def _get(context, map_name, key, model, **lookup):
+    """Return a row from the ``context`` or the database.
+
+    :raises DoesNotExist: If there is no such row.
+
+    """
+    if context is None:
+        return model.objects.get(**lookup)
+    return context.get(map_name, key, **lookup)
+
+
+def _remember(context, map_name, obj, created=False):
+    if context is not None:
+        context.put(map_name, obj, created)
+
+
+def _save_new(obj, **lookup):
+    """Save the new ``obj`` unless another process created it first.
+
+    Parallel imports may create the same artist, ruling or card at the
+    same time.  The insert of the loser fails on the unique index and
+    the row of the winner is returned instead.
+
+    :rtype: tuple
+    :returns: The saved row and if it was created.
+
+    """
+    try:
+        with transaction.atomic():
+            obj.save()
+        return obj, True
+    except IntegrityError as error:
+        model = type(obj)
+        try:
+            return model.objects.get(**lookup), False
+        except model.DoesNotExist:
+            # Not a duplicate, but an invalid row.
+            raise error
+
+
+def _count(context, model, outcome, count=1):
+    if context is not None:
+        context.import_report.add(model.__name__, outcome, count)
+
+
+def _start_set(context, set_):
+    """Attribute the following phases of the run to ``set_``.
+
+    :returns: The report of the context, if any.
+
+    """
+    if context is None:
+        return None
+    context.import_report.start_set(set_.code)
+    return context.import_report
+
+
+def get_import_digest(obj, fields):
+    """Return a stable digest of the imported ``fields`` of ``obj``.
+
+    Foreign keys are included by id, so the related rows have to be
+    saved first.  Comparing the digest stored with a row to the digest
+    of the freshly parsed object tells if the row has to be updated.
+
+    :rtype: str
+
+    """
+    values = [getattr(obj, obj._meta.get_field(field).attname)
+              for field in fields]
+    data = json.dumps(values, default=str, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def insert_artist(artist, update=False, context=None):
     """Create/update a single artist."""
     try:
-        a = Artist.objects.get(name=artist.name)
+        a = _get(context, 'artists', artist.name, Artist, name=artist.name)
         if update:
-            logger.info("Updating artist '{0}'.".format(a))
+            logger.info("Updating artist '%s'.", a)
             # a.save()
         else:
-            logger.info("Skipping existing artist '{0}'.".format(a))
+            logger.info("Skipping existing artist '%s'.", a)
+        _count(context, Artist, 'unchanged')
 
         artist = a
     except Artist.DoesNotExist:
-        logger.info("Creating new artist '{0}'.".format(artist))
-        artist.save()
+        logger.info("Creating new artist '%s'.", artist)
+        artist, created = _save_new(artist, name=artist.name)
+        _remember(context, 'artists', artist, created)
+        _count(context, Artist, 'inserted' if created else 'unchanged')
 
     return artist
 
 
-def insert_ruling(ruling, update=False):
-    """Create/update a single ruling."""
+def insert_ruling(ruling, update=False, context=None):
+    """Create/update a single ruling.
+
+    The ruling is looked up by the digest of its text.
+
+    """
+    digest = Ruling.get_digest(ruling.ruling)
     try:
-        r = Ruling.objects.get(ruling=ruling.ruling)
+        r = _get(context, 'rulings', digest, Ruling, digest=digest)
 
-        if update:
+        if update and r.date != ruling.date:
             r.date = ruling.date
 
-            logger.info("Updating ruling '{0}'.".format(r))
+            logger.info("Updating ruling '%s'.", r)
             r.save()
+            _remember(context, 'rulings', r)
+            _count(context, Ruling, 'updated')
         else:
-            logger.info("Skipping existing ruling '{0}'.".format(r))
+            logger.info("Skipping existing ruling '%s'.", r)
+            _count(context, Ruling, 'unchanged')
 
         ruling = r
     except Ruling.DoesNotExist:
-        logger.info("Creating new ruling '{0}'.".format(ruling))
-        ruling.save()
+        logger.info("Creating new ruling '%s'.", ruling)
+        ruling, created = _save_new(ruling, digest=digest)
+        _remember(context, 'rulings', ruling, created)
+        _count(context, Ruling, 'inserted' if created else 'unchanged')
 
     return ruling
 
@@ -79,21 +188,21 @@ def insert_block(block, update=False):
     """Create/update a single block."""
     try:
         b = Block.objects.get(name=block.name)
-        if update:
+        if update and b.category != block.category:
             b.category = block.category
-            logger.info("Updating block '{0}'.".format(b))
+            logger.info("Updating block '%s'.", b)
             b.save()
         else:
-            logger.info("Skipping existing block '{0}'.".format(b))
+            logger.info("Skipping existing block '%s'.", b)
 
         block = b
     except Block.DoesNotExist:
-        logger.info("Creating new block '{0}'.".format(block))
+        logger.info("Creating new block '%s'.", block)
         block.save()
     return block
 
 
-def insert_set(block, set_, update=False):
+def insert_set(block, set_, update=False, context=None):
     """Create/update a single set.
 
     :type block: `cardbox.models.Block`
@@ -102,30 +211,40 @@ def insert_set(block, set_, update=False):
     :type set_: `cardbox.models.Set`
     :param set_: The set to create or update.
 
+    :type context: `cardbox.utils.context.ImportContext`
+    :param context: (optional) Look up the set in the context
+        instead of the database.  The same holds for the other
+        ``insert_*`` functions.
+
     """
+    set_.block = block
+    set_.import_digest = get_import_digest(set_, SET_UPDATE_FIELDS)
     try:
-        s = Set.objects.get(code=set_.code)
-        if update:
+        s = _get(context, 'sets', set_.code, Set, code=set_.code)
+        if update and s.import_digest != set_.import_digest:
             s.release_date = set_.release_date
             s.name = set_.name
             s.block = block
+            s.import_digest = set_.import_digest
 
-            logger.info("Updating set '{0}'.".format(s))
+            logger.info("Updating set '%s'.", s)
             s.save()
+            _remember(context, 'sets', s)
+            _count(context, Set, 'updated')
         else:
-            logger.info("Skipping existing set '{0}'."
-                        .format(s))
+            logger.info("Skipping existing set '%s'.", s)
+            _count(context, Set, 'unchanged')
 
         set_ = s
     except Set.DoesNotExist:
-        set_.block = block
-        logger.info("Creating new set '{0}' in block '{1}'."
-                    .format(set_, block))
+        logger.info("Creating new set '%s' in block '%s'.", set_, block)
         set_.save()
+        _remember(context, 'sets', set_, True)
+        _count(context, Set, 'inserted')
     return set_
 
 
-def insert_card(card, update=False):
+def insert_card(card, update=False, context=None):
     """Create/update a single card.
 
     :type card: `cardbox.models.Card`
@@ -135,9 +254,10 @@ def insert_card(card, update=False):
     :returns: The created/updated card with a valid id.
 
     """
+    card.import_digest = get_import_digest(card, CARD_UPDATE_FIELDS)
     try:
-        c = Card.objects.get(name=card.name)
-        if update:
+        c = _get(context, 'cards', card.name, Card, name=card.name)
+        if update and c.import_digest != card.import_digest:
             c.name = card.name
             c.types = card.types
             c.rules = card.rules
@@ -164,48 +284,63 @@ def insert_card(card, update=False):
             c.legal_classic = card.legal_classic
             c.legal_commander = card.legal_commander
             c.legal_modern = card.legal_modern
+            c.import_digest = card.import_digest
 
-            logger.info("Updating card '{0}'.".format(c))
+            logger.info("Updating card '%s'.", c)
             c.save()
+            _remember(context, 'cards', c)
+            _count(context, Card, 'updated')
         else:
-            logger.info("Skipping existing card '{0}'.".format(c))
+            logger.info("Skipping existing card '%s'.", c)
+            _count(context, Card, 'unchanged')
 
         card = c
     except Card.DoesNotExist:
-        logger.info("Creating new card '{0}'."
-                    .format(card))
-        card.save()
+        logger.info("Creating new card '%s'.", card)
+        card, created = _save_new(card, name=card.name)
+        _remember(context, 'cards', card, created)
+        _count(context, Card, 'inserted' if created else 'unchanged')
     return card
 
 
-def insert_card_edition(set_, card, artist, edition, update=False):
+def insert_card_edition(set_, card, artist, edition, update=False,
+                        context=None):
     """Create/update a single card edition."""
+    edition.mtgset = set_
+    edition.card = card
+    edition.artist = artist
+    edition.import_digest = get_import_digest(edition, EDITION_UPDATE_FIELDS)
     try:
-        e = CardEdition.objects.get(number=edition.number,
-                                    number_suffix=edition.number_suffix,
-                                    mtgset_id=set_.id)
-        if update:
+        e = _get(context, 'editions',
+                 (set_.id, edition.number, edition.number_suffix),
+                 CardEdition, number=edition.number,
+                 number_suffix=edition.number_suffix, mtgset_id=set_.id)
+        if update and e.import_digest != edition.import_digest:
             e.card = card
             e.artist = artist
             e.rarity = edition.rarity
+            e.import_digest = edition.import_digest
 
-            logger.info("Updating edition '{0}'.".format(e))
+            logger.info("Updating edition '%s'.", e)
             e.save()
+            _remember(context, 'editions', e)
+            _count(context, CardEdition, 'updated')
         else:
-            logger.info("Skipping existing edition '{0}'.".format(e))
+            logger.info("Skipping existing edition '%s'.", e)
+            _count(context, CardEdition, 'unchanged')
 
         edition = e
     except CardEdition.DoesNotExist:
-        edition.mtgset = set_
-        edition.card = card
-        edition.artist = artist
-        logger.info("Creating new edition '{0}'.".format(edition))
+        logger.info("Creating new edition '%s'.", edition)
         edition.save()
+        _remember(context, 'editions', edition, True)
+        _count(context, CardEdition, 'inserted')
 
     return edition
 
 
-def insert_blocks_sets_from_parser(parser=MCIParser, update=False):
+def insert_blocks_sets_from_parser(parser=MCIParser, update=False,
+                                   context=None):
     """Create/update all blocks and sets.
 
     Existing blocks and sets will be skipped.
@@ -214,48 +349,996 @@ def insert_blocks_sets_from_parser(parser=MCIParser, update=False):
     for block, sets in parser.parse_blocks_sets():
         block = insert_block(block, update)
         for set_ in sets:
-            insert_set(block, set_, update)
+            insert_set(block, set_, update, context)
 
 
-def insert_cards_by_set_from_parser(set_, parser=MCIParser, update=False):
-    """Create/update all  cards from all sets.
+def _parse_cards_by_set(set_, parser, numbers):
+    if numbers is None:
+        return parser.parse_cards_by_set(set_.code)
+    return parser.parse_cards_by_set(set_.code, numbers=numbers)
 
-    Existing cards will be updated or skipped.
+
+def _insert_card_entry(set_, edition, card, artist, rulings, update,
+                       context):
+    """Create/update the card, artist, edition and rulings of one card.
+
+    The rulings are not linked to the card yet.
+
+    :rtype: tuple
+    :returns: The saved edition, card and rulings.
 
     """
-    ECPair = namedtuple('ECPair', 'edition card')
-    multi_pairs = []
-    for edition, card, artist, rulings in parser.parse_cards_by_set(set_.code):
-        artist = insert_artist(artist, update)
-        card = insert_card(card, update)
-        edition = insert_card_edition(set_, card, artist, edition,
-                                      update)
+    artist = insert_artist(artist, update, context)
+    card = insert_card(card, update, context)
+    edition = insert_card_edition(set_, card, artist, edition,
+                                  update, context)
+    rulings = [insert_ruling(ruling, update, context) for ruling in rulings]
+    return edition, card, rulings
+
+
+def backfill_ruling_digests():
+    """Set the digest of the rulings saved before it existed.
+
+    Rulings are looked up by their digest only, so this runs before
+    every set is written; without a digest an existing ruling would be
+    inserted again.  Once all digests are set it is a single query.
+
+    :rtype: int
+    :returns: The number of rulings updated.
+
+    """
+    rulings = list(Ruling.objects.filter(digest__isnull=True))
+    for ruling in rulings:
+        ruling.digest = Ruling.get_digest(ruling.ruling)
+    _bulk_update(Ruling, rulings, ['digest'])
+    if rulings:
+        logger.info("Backfilled the digests of %s rulings.", len(rulings))
+    return len(rulings)
+
+
+def _set_ruling_digests(entries):
+    """Set the digests of the parsed rulings in ``entries``.
+
+    Only :meth:`cardbox.models.Ruling.save` sets them otherwise.
+
+    """
+    for _, _, _, rulings in entries:
         for ruling in rulings:
-            ruling = insert_ruling(ruling, update)
-            # Rulings already added to the card will be ignored.
-            card.rulings.add(ruling)
-
-        # All multi cards belonging together have the same edition
-        # number (as we are only looking at one set).
-        if (len(multi_pairs) > 0 and
-            (multi_pairs[0].edition.number != edition.number)):
+            ruling.digest = Ruling.get_digest(ruling.ruling)
+
+
+def _get_multi_links(entries):
+    """Return the links between the parts of the multi cards.
+
+    All multi cards belonging together have the same edition number
+    (as we are only looking at one set).
+
+    :param entries: ``(edition, card)`` tuples in the order parsed.
+
+    :rtype: set
+    :returns: ``(card, card)`` tuples in both directions.
+
+    """
+    multi_pairs = []
+    links = set()
+    for edition, card in entries:
+        if multi_pairs and multi_pairs[0][0] != edition.number:
             multi_pairs = []
         if card.multi_type != Card.MULTI_NONE:
-            for pair in multi_pairs:
-                pair.card.multi_cards.add(card)
-                card.multi_cards.add(pair.card)
-            multi_pairs.append(ECPair(edition, card))
+            for _, other in multi_pairs:
+                links.add((other, card))
+                links.add((card, other))
+            multi_pairs.append((edition.number, card))
+    return links
+
+
+def _link_cards(cards, ruling_links, multi_links, prune):
+    """Write the rulings and multi card links of ``cards`` in bulk.
+
+    :param ruling_links: ``(card_id, ruling_id)`` tuples.
+
+    :param multi_links: ``(card_id, card_id)`` tuples.
+
+    :param bool prune: Also delete the links of ``cards`` missing in
+        the given links.
+
+    """
+    card_ids = set(card.id for card in cards)
+    _bulk_add_relations(Card.rulings.through, ruling_links,
+                        'card_id', 'ruling_id',
+                        card_ids if prune else None)
+    _bulk_add_relations(Card.multi_cards.through, multi_links,
+                        'from_card_id', 'to_card_id',
+                        card_ids if prune else None)
+
+
+def insert_cards_by_set_from_parser(set_, parser=MCIParser, update=False,
+                                    numbers=None, checkpoint=None,
+                                    context=None, prune=False):
+    """Create/update all  cards from all sets.
+
+    Existing cards will be updated or skipped.
+
+    The whole set is written in one transaction, so a set is either
+    imported completely or not at all.  Every card is written in its
+    own savepoint; a card the database refuses is logged and skipped
+    without aborting the set.  Errors of the parser abort the set.
+
+    :param numbers: (optional) Only create/update the cards with
+        these numbers (including the suffix, e.g. ``'60a'``).  All
+        parts of a multi card have to be included to link them.
+
+    :type checkpoint: `cardbox.utils.checkpoint.Checkpoint`
+    :param checkpoint: (optional) Mark the set as done in the
+        checkpoint once it is committed.
+
+    :type context: `cardbox.utils.context.ImportContext`
+    :param context: (optional) Look up existing rows in the context.
+
+    :param bool prune: (optional) Delete the links to rulings and
+        multi card parts of the parsed cards that disappeared from the
+        source.
+
+    :rtype: int
+    :returns: The number of cards parsed.
+
+    """
+    report = _start_set(context, set_)
+    # Fetch and parse all cards before the transaction is opened, so
+    # no locks are held while waiting for the source.  The parser
+    # times these phases itself.
+    entries = list(_parse_cards_by_set(set_, parser, numbers))
+
+    saved = []
+    ruling_links = set()
+    count = 0
+    set_savepoint = context.savepoint() if context is not None else None
+    try:
+        with transaction.atomic():
+            backfill_ruling_digests()
+            for edition, card, artist, rulings in entries:
+                count += 1
+                card_savepoint = (context.savepoint()
+                                  if context is not None else None)
+                try:
+                    with timer(report, 'write'), transaction.atomic():
+                        edition, card, rulings = _insert_card_entry(
+                            set_, edition, card, artist, rulings, update,
+                            context)
+                except OperationalError:
+                    # E.g. a deadlock, retrying might help.
+                    raise
+                except DatabaseError:
+                    logger.exception("Skipping card '%s' in set '%s'.",
+                                     card, set_)
+                    if context is not None:
+                        context.rollback(card_savepoint)
+                    continue
+                saved.append((edition, card))
+                ruling_links.update((card.id, r.id) for r in rulings)
+
+            # The links of all cards are written at once.
+            with timer(report, 'write'):
+                multi_links = set((a.id, b.id)
+                                  for a, b in _get_multi_links(saved))
+                _link_cards([card for _, card in saved], ruling_links,
+                            multi_links, prune)
+
+            if checkpoint is not None:
+                transaction.on_commit(
+                    lambda: checkpoint.mark_set_done(set_.code))
+    except BaseException:
+        if context is not None:
+            context.rollback(set_savepoint)
+        raise
+    if context is not None:
+        transaction.on_commit(context.commit)
+    return count
+
+
+# How often a worker process retries a set that failed with an
+# operational error, e.g. a deadlock with another worker.
+WORKER_RETRIES = 3
+
+# State of a worker process of `insert_cards_from_parser`.
+_worker = {}
+
+
+def _init_worker(insert_by_set, parser, update, prune):
+    django.setup()
+    # The connections of the parent must not be used here.
+    connections.close_all()
+    _worker.update(insert_by_set=insert_by_set, parser=parser,
+                   update=update, prune=prune,
+                   # Not preloaded, since the other workers add rows.
+                   context=ImportContext())
+
+
+def _insert_set_in_worker(set_id):
+    """Create/update the cards of one set in a worker process.
+
+    :rtype: tuple
+    :returns: The set code, the number of cards parsed and the
+        report of the set as a dict.
+
+    """
+    set_ = Set.objects.get(id=set_id)
+    context = _worker['context']
+    parser = _worker['parser']
+    for attempt in range(WORKER_RETRIES + 1):
+        context.import_report = ImportReport()
+        try:
+            count = _worker['insert_by_set'](
+                set_, bind_report(parser, context.import_report),
+                _worker['update'], context=context, prune=_worker['prune'])
+            break
+        except OperationalError:
+            if attempt == WORKER_RETRIES:
+                raise
+            logger.warning("Retrying set '%s'.", set_,
+                           exc_info=True)
+    return set_.code, count, context.import_report.as_dict()
+
+
+def _insert_sets_in_processes(sets, insert_by_set, parser, update, prune,
+                              workers, checkpoint, context):
+    """Farm the sets out to ``workers`` processes.
+
+    Every process has its own database connection and writes whole
+    sets in their own transactions.  Rows shared between sets are
+    created race free, see :func:`_save_new`.
+
+    """
+    if connection.in_atomic_block:
+        raise RuntimeError("Parallel imports can't run in a transaction.")
+    # Forked processes must not share the connections of the parent.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(insert_by_set, parser, update,
+                                       prune)) as executor:
+        futures = [executor.submit(_insert_set_in_worker, set_.id)
+                   for set_ in sets]
+        for future in as_completed(futures):
+            code, count, report = future.result()
+            logger.info("Set '%s' done with %s cards.", code, count)
+            context.import_report.merge(report)
+            if checkpoint is not None:
+                checkpoint.mark_set_done(code)
+
+
+def insert_cards_from_parser(parser=MCIParser, update=False,
+                             checkpoint=None, bulk=False, context=None,
+                             copy=False, prune=False, workers=None):
+    """Create/update the cards of all sets in the database.
+
+    :type checkpoint: `cardbox.utils.checkpoint.Checkpoint`
+    :param checkpoint: (optional) Skip the sets done in an earlier,
+        interrupted run.  The checkpoint is cleared once all
+        sets are done.
+
+    :param bool bulk: (optional) Write the cards of each set with
+        :func:`bulk_insert_cards_by_set_from_parser`.
+
+    :param bool copy: (optional) Write the cards of each set with
+        :func:`copy_insert_cards_by_set_from_parser`.  Only faster
+        than ``bulk`` on PostgreSQL.
+
+    :param bool prune: (optional) Delete the links to rulings and
+        multi card parts that disappeared from the source.
+
+    :type context: `cardbox.utils.context.ImportContext`
+    :param context: (optional) The context to look up existing rows
+        in.  Defaults to a new, preloaded context for this run.
+
+    :param int workers: (optional) Import the sets in this many
+        processes at once.  Must not be called in a transaction.
+        Unless processes are forked, ``parser`` has to be importable
+        by the workers.
+
+    :rtype: `cardbox.utils.report.ImportReport`
+    :returns: The report of the run, see :meth:`ImportReport.to_json`.
+
+    """
+    parallel = workers is not None and workers > 1
+    if context is None:
+        backfill_ruling_digests()
+        # The workers have their own contexts.
+        context = ImportContext(preload=not parallel)
+    if copy:
+        insert_by_set = copy_insert_cards_by_set_from_parser
+    elif bulk:
+        insert_by_set = bulk_insert_cards_by_set_from_parser
+    else:
+        insert_by_set = insert_cards_by_set_from_parser
+    sets = []
+    for set_ in Set.objects.all():
+        if checkpoint is not None and checkpoint.is_set_done(set_.code):
+            logger.info("Skipping set '%s' done before.", set_)
+            continue
+        sets.append(set_)
+    if parallel:
+        _insert_sets_in_processes(sets, insert_by_set, parser, update,
+                                  prune, workers, checkpoint, context)
+    else:
+        parser = bind_report(parser, context.import_report)
+        for set_ in sets:
+            insert_by_set(set_, parser, update, checkpoint=checkpoint,
+                          context=context, prune=prune)
+    if checkpoint is not None:
+        checkpoint.clear()
+    context.import_report.finish()
+    context.log_report()
+    return context.import_report
+
+
+def insert_blocks_sets_cards_from_parser(parser=MCIParser, update=False,
+                                         checkpoint=None, bulk=False,
+                                         context=None, copy=False,
+                                         prune=False, workers=None):
+    if context is None:
+        backfill_ruling_digests()
+        context = ImportContext(preload=workers is None or workers <= 1)
+    bound = bind_report(parser, context.import_report)
+    if bulk or copy:
+        bulk_insert_blocks_sets(bound.parse_blocks_sets(), update, context)
+    else:
+        insert_blocks_sets_from_parser(bound, update, context)
+    return insert_cards_from_parser(parser, update, checkpoint, bulk,
+                                    context, copy, prune, workers)
+
+
+def _get_numbers_with_multi_parts(editions, predicate):
+    """Return the numbers of the editions matching ``predicate``.
+
+    If one part of a multi card matches, the numbers of all its
+    parts are returned, since they have to be parsed together.
+
+    """
+    matching = set(e.number for e in editions
+                   if predicate('{0}{1}'.format(e.number, e.number_suffix)))
+    return set('{0}{1}'.format(e.number, e.number_suffix)
+               for e in editions if e.number in matching)
+
+
+def get_missing_numbers(set_, editions):
+    """Return the numbers of the editions missing in the database.
+
+    If one part of a multi card is missing, the numbers of all its
+    parts are returned, since they share the edition number.
+
+    :type editions: list
+    :param editions: The editions of ``set_`` as returned by
+        ``parser.parse_set_table``.
+
+    :rtype: set
+    :returns: The numbers including the suffix, e.g. ``'60a'``.
+
+    """
+    existing = set('{0}{1}'.format(number, number_suffix)
+                   for number, number_suffix
+                   in CardEdition.objects.filter(mtgset_id=set_.id)
+                   .values_list('number', 'number_suffix'))
+    return _get_numbers_with_multi_parts(
+        editions, lambda number: number not in existing)
+
+
+def sync_cards_by_set_from_parser(set_, parser=MCIParser, stale=False,
+                                  context=None):
+    """Create the cards of a set that are missing in the database.
+
+    Only the set table is parsed for sets that are already complete.
+    The cards of stale sets are all parsed and updated again.
+
+    :rtype: int
+    :returns: The number of cards parsed.
+
+    """
+    if stale:
+        logger.info("Updating stale set '%s'.", set_)
+        numbers = None
+        update = True
+    else:
+        editions = parser.parse_set_table(set_.code)
+        numbers = get_missing_numbers(set_, editions)
+        update = False
+        if not numbers:
+            logger.info("Skipping complete set '%s'.", set_)
+            return 0
+        logger.info("Adding %s of %s cards to set '%s'.",
+                    len(numbers), len(editions), set_)
+
+    return insert_cards_by_set_from_parser(set_, parser, update, numbers,
+                                           context=context)
+
+
+def sync_cards_from_parser(parser=MCIParser, stale=()):
+    """Create all blocks, sets and cards missing in the database.
+
+    Unlike :func:`insert_blocks_sets_cards_from_parser` this only
+    parses the card pages of new sets, of new cards in existing sets
+    and of all sets in ``stale``.
+
+    :param stale: (optional) Codes of the sets to parse and update
+        completely.
+
+    :rtype: int
+    :returns: The number of cards parsed.
+
+    """
+    stale = set(code.upper() for code in stale)
+    backfill_ruling_digests()
+    context = ImportContext(preload=True)
+    count = 0
+    parser = bind_report(parser, context.import_report)
+    insert_blocks_sets_from_parser(parser, context=context)
+    for set_ in Set.objects.all():
+        count += sync_cards_by_set_from_parser(set_, parser,
+                                               set_.code in stale, context)
+    context.import_report.finish()
+    context.log_report()
+    return count
+
+
+# Fields copied from parsed objects onto existing rows when updating.
+# They are the same fields the insert_* functions above update.
+SET_UPDATE_FIELDS = ['release_date', 'name', 'block']
+BLOCK_UPDATE_FIELDS = ['category']
+RULING_UPDATE_FIELDS = ['date']
+CARD_UPDATE_FIELDS = [
+    'name', 'types', 'rules', 'flavour',
+    'power', 'power_special', 'toughness', 'toughness_special',
+    'loyalty', 'loyalty_special',
+    'mana_n', 'mana_w', 'mana_u', 'mana_b', 'mana_r', 'mana_g',
+    'mana_special', 'cmc', 'multi_type',
+    'legal_vintage', 'legal_legacy', 'legal_extended', 'legal_standard',
+    'legal_classic', 'legal_commander', 'legal_modern',
+]
+EDITION_UPDATE_FIELDS = ['card', 'artist', 'rarity']
+
+# Maximum number of values in one `IN` query or one bulk write.
+# SQLite only allows 999 variables per query in older versions.
+BATCH_SIZE = 500
 
+# Prefix of the temporary tables used by `copy_insert_cards`.
+STAGE_PREFIX = 'cardbox_stage_'
 
-def insert_cards_from_parser(parser=MCIParser, update=False):
-    sets = Set.objects.all()
-    for set_ in sets:
-        insert_cards_by_set_from_parser(set_, parser, update)
 
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
-def insert_blocks_sets_cards_from_parser(parser=MCIParser, update=False):
-    insert_blocks_sets_from_parser(parser, update)
-    insert_cards_from_parser(parser, update)
+
+def _get_by_keys(model, field, keys):
+    """Return the rows of ``model`` with ``field`` in ``keys``.
+
+    :rtype: dict
+    :returns: The rows keyed by ``field``.
+
+    """
+    rows = {}
+    for chunk in _chunks(keys):
+        for obj in model.objects.filter(**{field + '__in': chunk}):
+            rows[getattr(obj, field)] = obj
+    return rows
+
+
+def _copy_changed(source, target, fields):
+    """Copy ``fields`` from ``source`` to ``target``.
+
+    :rtype: bool
+    :returns: If any of the fields changed.
+
+    """
+    changed = False
+    for field in fields:
+        # Compare foreign keys by id to avoid a query per row.
+        attname = target._meta.get_field(field).attname
+        value = getattr(source, attname)
+        if getattr(target, attname) != value:
+            setattr(target, attname, value)
+            changed = True
+    return changed
+
+
+def _bulk_update(model, objs, fields):
+    if not objs:
+        return
+    if hasattr(model.objects, 'bulk_update'):
+        model.objects.bulk_update(objs, fields, batch_size=BATCH_SIZE)
+    else:
+        # Django before 2.2 has no bulk_update.
+        for obj in objs:
+            obj.save(update_fields=fields)
+
+
+def _has_import_digest(model):
+    return any(f.name == 'import_digest' for f in model._meta.fields)
+
+
+def _set_import_digests(model, objs, fields):
+    """Set the digest of all ``objs`` if ``model`` stores one.
+
+    :rtype: list
+    :returns: The fields to update including the digest.
+
+    """
+    if not _has_import_digest(model):
+        return fields
+    for obj in objs:
+        obj.import_digest = get_import_digest(obj, fields)
+    return fields + ['import_digest']
+
+
+def _bulk_upsert(model, field, objs, update_fields, update, context=None):
+    """Create/update objects identified by the unique ``field``.
+
+    Existing rows are looked up with a few `IN` queries, new rows
+    are written with one `bulk_create` and changed rows with one
+    `bulk_update` (if ``update`` is set).  Later objects with the
+    same key win.
+
+    :rtype: dict
+    :returns: The saved rows keyed by ``field``.
+
+    """
+    objs = dict((getattr(obj, field), obj) for obj in objs)
+    update_fields = _set_import_digests(model, objs.values(), update_fields)
+    rows = _get_by_keys(model, field, objs.keys())
+
+    changed = [row for key, row in rows.items()
+               if update and _copy_changed(objs[key], row, update_fields)]
+    _bulk_update(model, changed, update_fields)
+
+    new = [obj for key, obj in objs.items() if key not in rows]
+    if new:
+        if django.VERSION >= (2, 2):
+            # Rows created by a parallel import in the meantime are
+            # skipped and looked up below.
+            model.objects.bulk_create(new, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
+        else:
+            model.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        # Not every database returns the ids of created rows.
+        rows.update(_get_by_keys(model, field, [getattr(obj, field)
+                                                for obj in new]))
+    unchanged = len(objs) - len(new) - len(changed)
+    logger.info("%s: %s created, %s updated, %s unchanged.",
+                model.__name__, len(new), len(changed), unchanged)
+    _count(context, model, 'inserted', len(new))
+    _count(context, model, 'updated', len(changed))
+    _count(context, model, 'unchanged', unchanged)
+    return rows
+
+
+def _bulk_add_relations(through, pairs, from_field, to_field,
+                        prune_ids=None):
+    """Add the ``(from_id, to_id)`` pairs missing in ``through``.
+
+    :param prune_ids: (optional) Delete the rows of these from ids
+        that are not in ``pairs``.
+
+    """
+    pairs = set(pairs)
+    if prune_ids:
+        stale = []
+        for chunk in _chunks(prune_ids):
+            stale.extend(
+                pk for pk, from_id, to_id in through.objects
+                .filter(**{from_field + '__in': chunk})
+                .values_list('pk', from_field, to_field)
+                if (from_id, to_id) not in pairs)
+        for chunk in _chunks(stale):
+            through.objects.filter(pk__in=chunk).delete()
+        if stale:
+            logger.info("%s: %s stale links deleted.",
+                        through.__name__, len(stale))
+    if not pairs:
+        return
+    objs = [through(**{from_field: from_id, to_field: to_id})
+            for from_id, to_id in sorted(pairs)]
+    if django.VERSION >= (2, 2):
+        through.objects.bulk_create(objs, batch_size=BATCH_SIZE,
+                                    ignore_conflicts=True)
+        return
+    # Django before 2.2 can't ignore conflicts.
+    existing = set()
+    from_ids = set(from_id for from_id, _ in pairs)
+    for chunk in _chunks(from_ids):
+        existing.update(through.objects
+                        .filter(**{from_field + '__in': chunk})
+                        .values_list(from_field, to_field))
+    through.objects.bulk_create(
+        [obj for obj in objs
+         if (getattr(obj, from_field), getattr(obj, to_field))
+         not in existing],
+        batch_size=BATCH_SIZE)
+
+
+def bulk_insert_blocks_sets(blocks_sets, update=False, context=None):
+    """Create/update blocks and their sets with a few queries.
+
+    :param blocks_sets: The ``(block, sets)`` tuples as returned by
+        ``parser.parse_blocks_sets``.
+
+    :type context: `cardbox.utils.context.ImportContext`
+    :param context: (optional) The context to add the sets to.
+
+    """
+    blocks_sets = list(blocks_sets)
+    blocks = _bulk_upsert(Block, 'name', [b for b, _ in blocks_sets],
+                          BLOCK_UPDATE_FIELDS, update, context)
+    sets = []
+    for block, block_sets in blocks_sets:
+        for set_ in block_sets:
+            set_.block = blocks[block.name]
+            sets.append(set_)
+    sets = _bulk_upsert(Set, 'code', sets, SET_UPDATE_FIELDS, update,
+                        context)
+    if context is not None:
+        for set_ in sets.values():
+            context.put('sets', set_)
+
+
+def bulk_insert_cards(set_, entries, update=False, context=None,
+                      prune=False):
+    """Create/update one set's worth of parsed cards.
+
+    Does the same as :func:`insert_cards_by_set_from_parser`, but
+    needs only a few queries per set instead of several per card.
+
+    :param entries: The ``(edition, card, artist, rulings)`` tuples
+        of ``set_`` in the order returned by
+        ``parser.parse_cards_by_set``.
+
+    :type context: `cardbox.utils.context.ImportContext`
+    :param context: (optional) The context to add the written rows
+        to.
+
+    :param bool prune: (optional) Delete the links of the cards that
+        disappeared from the source.
+
+    :rtype: int
+    :returns: The number of cards written.
+
+    """
+    entries = list(entries)
+    _set_ruling_digests(entries)
+    artists = _bulk_upsert(Artist, 'name', [a for _, _, a, _ in entries],
+                           [], False, context)
+    rulings = _bulk_upsert(Ruling, 'digest',
+                           [r for _, _, _, rs in entries for r in rs],
+                           RULING_UPDATE_FIELDS, update, context)
+    cards = _bulk_upsert(Card, 'name', [c for _, c, _, _ in entries],
+                         CARD_UPDATE_FIELDS, update, context)
+
+    editions = dict(((e.number, e.number_suffix), e) for e
+                    in CardEdition.objects.filter(mtgset_id=set_.id))
+    new_editions = []
+    changed_editions = []
+    update_fields = EDITION_UPDATE_FIELDS + ['import_digest']
+    for edition, card, artist, _ in entries:
+        edition.mtgset = set_
+        edition.card = cards[card.name]
+        edition.artist = artists[artist.name]
+        edition.import_digest = get_import_digest(edition,
+                                                  EDITION_UPDATE_FIELDS)
+        key = (edition.number, edition.number_suffix)
+        if key not in editions:
+            new_editions.append(edition)
+            editions[key] = edition
+        elif update and _copy_changed(edition, editions[key],
+                                      update_fields):
+            changed_editions.append(editions[key])
+    CardEdition.objects.bulk_create(new_editions, batch_size=BATCH_SIZE)
+    _bulk_update(CardEdition, changed_editions, update_fields)
+    _count(context, CardEdition, 'inserted', len(new_editions))
+    _count(context, CardEdition, 'updated', len(changed_editions))
+    _count(context, CardEdition, 'unchanged',
+           len(entries) - len(new_editions) - len(changed_editions))
+    if context is not None:
+        for name, rows in [('artists', artists), ('rulings', rulings),
+                           ('cards', cards)]:
+            for obj in rows.values():
+                context.put(name, obj)
+        # The created editions don't have an id on every database.
+        for edition in CardEdition.objects.filter(mtgset_id=set_.id):
+            context.put('editions', edition)
+    logger.info("Set '%s': %s editions created, %s updated.",
+                set_, len(new_editions), len(changed_editions))
+
+    multi_links = _get_multi_links((e, cards[c.name])
+                                   for e, c, _, _ in entries)
+    _link_cards(cards.values(),
+                [(cards[c.name].id, rulings[r.digest].id)
+                 for _, c, _, rs in entries for r in rs],
+                [(a.id, b.id) for a, b in multi_links], prune)
+    return len(entries)
+
+
+def _write_set(write, set_, parser, update, numbers, checkpoint, context,
+               prune):
+    """Parse the cards of a set and write them in one transaction.
+
+    :param write: :func:`bulk_insert_cards` or
+        :func:`copy_insert_cards`.
+
+    """
+    _start_set(context, set_)
+    entries = list(_parse_cards_by_set(set_, parser, numbers))
+    return insert_parsed_cards(set_, entries, update, checkpoint, context,
+                               prune, write)
+
+
+def insert_parsed_cards(set_, entries, update=False, checkpoint=None,
+                        context=None, prune=False, write=bulk_insert_cards):
+    """Write the parsed cards of a set in one transaction.
+
+    :param entries: The ``(edition, card, artist, rulings)`` tuples
+        of all cards of the set as yielded by
+        ``parser.parse_cards_by_set``.
+
+    :param write: (optional) :func:`bulk_insert_cards` or
+        :func:`copy_insert_cards`.
+
+    See :func:`insert_cards_by_set_from_parser` for the other
+    parameters.
+
+    :rtype: int
+    :returns: The number of cards written.
+
+    """
+    report = context.import_report if context is not None else None
+    set_savepoint = context.savepoint() if context is not None else None
+    try:
+        with timer(report, 'write', set_.code), transaction.atomic():
+            backfill_ruling_digests()
+            count = write(set_, entries, update, context, prune)
+            if checkpoint is not None:
+                transaction.on_commit(
+                    lambda: checkpoint.mark_set_done(set_.code))
+    except BaseException:
+        if context is not None:
+            context.rollback(set_savepoint)
+        raise
+    if context is not None:
+        transaction.on_commit(context.commit)
+    return count
+
+
+def bulk_insert_cards_by_set_from_parser(set_, parser=MCIParser,
+                                         update=False, numbers=None,
+                                         checkpoint=None, context=None,
+                                         prune=False):
+    """Create/update all cards of a set with :func:`bulk_insert_cards`.
+
+    See :func:`insert_cards_by_set_from_parser` for the parameters.
+    The set is written in one transaction; unlike there, any error
+    aborts the whole set.
+
+    """
+    return _write_set(bulk_insert_cards, set_, parser, update, numbers,
+                      checkpoint, context, prune)
+
+
+def _copy_value(value):
+    """Format ``value`` for the text format of `COPY`."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _copy_rows(cursor, table, columns, rows):
+    """Stream ``rows`` into ``table`` with `COPY FROM STDIN`."""
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(_copy_value(value) for value in row))
+        data.write('\n')
+    sql = 'COPY {0} ({1}) FROM STDIN'.format(table, ', '.join(columns))
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        data.seek(0)
+        raw_cursor.copy_expert(sql, data)
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(data.getvalue())
+
+
+def _stage(cursor, name, fields, rows):
+    """Create the temporary table ``name`` and copy ``rows`` into it.
+
+    :param fields: ``(column, field)`` tuples; every column gets the
+        database type of its model field.
+
+    """
+    qn = connection.ops.quote_name
+    # Never drop a regular table of the same name.
+    cursor.execute('DROP TABLE IF EXISTS pg_temp.{0}'.format(qn(name)))
+    cursor.execute('CREATE TEMPORARY TABLE {0} ({1}) ON COMMIT DROP'.format(
+        qn(name), ', '.join('{0} {1}'.format(qn(column),
+                                             field.db_type(connection))
+                            for column, field in fields)))
+    _copy_rows(cursor, qn(name), [qn(column) for column, _ in fields], rows)
+
+
+def _merge(cursor, model, columns, select, conflict, update_columns,
+           params=()):
+    """Insert the result of ``select`` into the table of ``model``.
+
+    Rows conflicting on the ``conflict`` columns are updated if
+    ``update_columns`` are given (and only if one of them changed) or
+    skipped otherwise.
+
+    :rtype: tuple
+    :returns: The number of rows inserted and updated.
+
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    sql = 'INSERT INTO {0} ({1}) {2} ON CONFLICT ({3}) '.format(
+        table, ', '.join(qn(c) for c in columns), select,
+        ', '.join(qn(c) for c in conflict))
+    if update_columns:
+        sql += ('DO UPDATE SET {0} WHERE ({1}) IS DISTINCT FROM ({2})'.format(
+            ', '.join('{0} = EXCLUDED.{0}'.format(qn(c))
+                      for c in update_columns),
+            ', '.join('{0}.{1}'.format(table, qn(c))
+                      for c in update_columns),
+            ', '.join('EXCLUDED.{0}'.format(qn(c))
+                      for c in update_columns)))
+    else:
+        sql += 'DO NOTHING'
+    # `xmax` is only set for rows that were updated.
+    sql += ' RETURNING (xmax = 0)'
+    cursor.execute(sql, params)
+    inserted = [row[0] for row in cursor.fetchall()]
+    return inserted.count(True), inserted.count(False)
+
+
+def _stage_and_merge(cursor, model, keys, objs, update_fields, update,
+                     context):
+    """Copy ``objs`` into a staging table and merge them into the
+    table of ``model`` on the unique fields ``keys``.
+
+    """
+    qn = connection.ops.quote_name
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    # Later objects with the same key win, as with `_bulk_upsert`.
+    objs = dict((tuple(getattr(obj, key) for key in keys), obj)
+                for obj in objs)
+    update_fields = _set_import_digests(model, objs.values(), update_fields)
+    stage = STAGE_PREFIX + model._meta.model_name
+    _stage(cursor, stage, [(f.column, f) for f in fields],
+           ([f.get_db_prep_save(getattr(obj, f.attname), connection)
+             for f in fields] for obj in objs.values()))
+    columns = [f.column for f in fields]
+    inserted, updated = _merge(
+        cursor, model, columns,
+        'SELECT {0} FROM {1}'.format(', '.join(qn(c) for c in columns),
+                                     qn(stage)),
+        [model._meta.get_field(key).column for key in keys],
+        [model._meta.get_field(f).column for f in update_fields]
+        if update else [])
+    unchanged = len(objs) - inserted - updated
+    logger.info("%s: %s created, %s updated, %s unchanged.",
+                model.__name__, inserted, updated, unchanged)
+    _count(context, model, 'inserted', inserted)
+    _count(context, model, 'updated', updated)
+    _count(context, model, 'unchanged', unchanged)
+
+
+def copy_insert_cards(set_, entries, update=False, context=None,
+                      prune=False):
+    """Create/update one set's worth of parsed cards with `COPY`.
+
+    Meant for populating an empty database.  The parsed artists,
+    rulings, cards, editions and links are streamed into temporary
+    staging tables with `COPY FROM STDIN` and then merged into the
+    catalog tables with one `INSERT ... ON CONFLICT` per table.
+
+    Only works on PostgreSQL; on other databases this falls back to
+    :func:`bulk_insert_cards`.  See there for the parameters.
+
+    :rtype: int
+    :returns: The number of cards written.
+
+    """
+    if connection.vendor != 'postgresql':
+        logger.info("COPY needs PostgreSQL, using bulk inserts instead.")
+        return bulk_insert_cards(set_, entries, update, context, prune)
+
+    entries = list(entries)
+    _set_ruling_digests(entries)
+    qn = connection.ops.quote_name
+    card_name = Card._meta.get_field('name')
+    ruling_digest = Ruling._meta.get_field('digest')
+    with connection.cursor() as cursor:
+        _stage_and_merge(cursor, Artist, ['name'],
+                         [a for _, _, a, _ in entries], [], False, context)
+        _stage_and_merge(cursor, Ruling, ['digest'],
+                         [r for _, _, _, rs in entries for r in rs],
+                         RULING_UPDATE_FIELDS, update, context)
+        _stage_and_merge(cursor, Card, ['name'],
+                         [c for _, c, _, _ in entries],
+                         CARD_UPDATE_FIELDS, update, context)
+
+        # The digests of the editions need the ids of their cards.
+        cards = _get_by_keys(Card, 'name', [c.name for _, c, _, _ in entries])
+        artists = _get_by_keys(Artist, 'name',
+                               [a.name for _, _, a, _ in entries])
+        for edition, card, artist, _ in entries:
+            edition.mtgset = set_
+            edition.card = cards[card.name]
+            edition.artist = artists[artist.name]
+        _stage_and_merge(cursor, CardEdition,
+                         ['number', 'number_suffix', 'mtgset_id'],
+                         [e for e, _, _, _ in entries],
+                         EDITION_UPDATE_FIELDS, update, context)
+
+        through = Card.rulings.through
+        _stage(cursor, STAGE_PREFIX + 'card_ruling',
+               [('card_name', card_name), ('digest', ruling_digest)],
+               set((c.name, r.digest) for _, c, _, rs in entries
+                   for r in rs))
+        _merge(cursor, through, ['card_id', 'ruling_id'],
+               'SELECT c.id, r.id FROM {0} s '
+               'JOIN {1} c ON c.{2} = s.card_name '
+               'JOIN {3} r ON r.{4} = s.digest'.format(
+                   qn(STAGE_PREFIX + 'card_ruling'),
+                   qn(Card._meta.db_table), qn(card_name.column),
+                   qn(Ruling._meta.db_table), qn(ruling_digest.column)),
+               ['card_id', 'ruling_id'], [])
+
+        through = Card.multi_cards.through
+        multi_links = _get_multi_links((e, c) for e, c, _, _ in entries)
+        _stage(cursor, STAGE_PREFIX + 'multi_card',
+               [('from_name', card_name), ('to_name', card_name)],
+               set((a.name, b.name) for a, b in multi_links))
+        _merge(cursor, through, ['from_card_id', 'to_card_id'],
+               'SELECT f.id, t.id FROM {0} s '
+               'JOIN {1} f ON f.{2} = s.from_name '
+               'JOIN {1} t ON t.{2} = s.to_name'.format(
+                   qn(STAGE_PREFIX + 'multi_card'),
+                   qn(Card._meta.db_table), qn(card_name.column)),
+               ['from_card_id', 'to_card_id'], [])
+
+    rulings = _get_by_keys(Ruling, 'digest',
+                           [r.digest for _, _, _, rs in entries for r in rs])
+    if prune:
+        # The links written above are ignored, only the stale links
+        # get deleted.
+        _link_cards(cards.values(),
+                    [(cards[c.name].id, rulings[r.digest].id)
+                     for _, c, _, rs in entries for r in rs],
+                    [(cards[a.name].id, cards[b.name].id)
+                     for a, b in multi_links], prune)
+    if context is not None:
+        for name, rows in [('artists', artists), ('rulings', rulings),
+                           ('cards', cards)]:
+            for obj in rows.values():
+                context.put(name, obj)
+        for edition in CardEdition.objects.filter(mtgset_id=set_.id):
+            context.put('editions', edition)
+    return len(entries)
+
+
+def copy_insert_cards_by_set_from_parser(set_, parser=MCIParser,
+                                         update=False, numbers=None,
+                                         checkpoint=None, context=None,
+                                         prune=False):
+    """Create/update all cards of a set with :func:`copy_insert_cards`.
+
+    See :func:`bulk_insert_cards_by_set_from_parser`.
+
+    """
+    return _write_set(copy_insert_cards, set_, parser, update, numbers,
+                      checkpoint, context, prune)
 
 
 def add_collection_entry(count, fcount, collection, edition):
@@ -272,6 +1355,148 @@ def add_collection_entry(count, fcount, collection, edition):
     entry.save()
 
 
+# A line of a collection text that couldn't be imported.  The line
+# numbers start at 1.
+LineError = namedtuple('LineError', 'line_number line message')
+
+
+def parse_collection_entry(count, foil_count, number, code):
+    """Convert the columns of an imported collection entry.
+
+    :rtype: tuple
+    :returns: The count, foil count, set code, number and number
+        suffix.
+
+    :raises ValueError: If a column is malformed.
+
+    """
+    try:
+        count, foil_count = int(count), int(foil_count)
+    except (TypeError, ValueError):
+        raise ValueError("The counts have to be numbers.")
+    if count < 0 or foil_count < 0:
+        raise ValueError("The counts must not be negative.")
+    try:
+        number, number_suffix = CardEdition.parse_number(str(number))
+    except ValueError:
+        raise ValueError("Invalid number '{0}'.".format(number))
+    return count, foil_count, str(code).upper(), number, number_suffix
+
+
+def _parse_collection_line(line):
+    """Parse a line of a collection text.
+
+    See :func:`parse_collection_entry`.
+
+    """
+    columns = line.split()
+    if len(columns) != 4:
+        raise ValueError("There are not exactly four columns.")
+    return parse_collection_entry(*columns)
+
+
+def _get_edition_ids(codes):
+    """Return the ids of all editions of the sets with ``codes``.
+
+    :rtype: dict
+    :returns: The ids keyed by ``(code, number, number_suffix)``.
+
+    """
+    ids = {}
+    for chunk in _chunks(codes):
+        rows = (CardEdition.objects.filter(mtgset__code__in=chunk)
+                .values_list('id', 'mtgset__code', 'number',
+                             'number_suffix'))
+        for id_, code, number, number_suffix in rows:
+            ids[(code, number, number_suffix)] = id_
+    return ids
+
+
+def add_collection_entries(collection, rows):
+    """Add parsed entries to a collection with a few queries.
+
+    The editions of all rows are looked up at once and the counts of
+    rows naming the same edition are added up.  The entries are then
+    created/updated in one transaction.
+
+    :param rows: ``(line_number, line, entry)`` tuples, ``entry``
+        as returned by :func:`parse_collection_entry`.
+
+    :rtype: list
+    :returns: A `LineError` for every row naming an unknown card.
+
+    """
+    rows = list(rows)
+    edition_ids = _get_edition_ids(set(code for _, _, (_, _, code, _, _)
+                                       in rows))
+    errors = []
+    # Edition id => [count, foil count]
+    counts = OrderedDict()
+    for line_number, line, (count, fcount, code, number,
+                            number_suffix) in rows:
+        edition_id = edition_ids.get((code, number, number_suffix))
+        if edition_id is None:
+            errors.append(LineError(
+                line_number, line, "No card '{0}{1}' in set '{2}'."
+                .format(number, number_suffix, code)))
+            continue
+        total = counts.setdefault(edition_id, [0, 0])
+        total[0] += count
+        total[1] += fcount
+
+    with transaction.atomic():
+        existing = {}
+        for chunk in _chunks(counts):
+            entries = (CollectionEntry.objects.select_for_update()
+                       .filter(collection=collection, edition_id__in=chunk))
+            existing.update((entry.edition_id, entry) for entry in entries)
+        new = []
+        for edition_id, (count, fcount) in counts.items():
+            entry = existing.get(edition_id)
+            if entry is None:
+                new.append(CollectionEntry(collection=collection,
+                                           edition_id=edition_id,
+                                           count=count, foil_count=fcount))
+            else:
+                entry.count += count
+                entry.foil_count += fcount
+        CollectionEntry.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        _bulk_update(CollectionEntry, list(existing.values()),
+                     ['count', 'foil_count'])
+    return errors
+
+
+def bulk_import_collection_from_text(collection, text):
+    """Read in a collection from plain text with a few queries.
+
+    See :func:`import_collection_from_text` for the format and
+    :func:`add_collection_entries` for how the lines are written.
+
+    Malformed lines and lines naming unknown cards are skipped.
+    Empty lines are ignored.
+
+    :rtype: list
+    :returns: A `LineError` for every line skipped.
+
+    """
+    errors = []
+    parsed = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            parsed.append((line_number, line,
+                           _parse_collection_line(line)))
+        except ValueError as e:
+            errors.append(LineError(line_number, line, str(e)))
+
+    missing = add_collection_entries(collection, parsed)
+    errors = sorted(errors + missing, key=lambda error: error.line_number)
+    logger.info("Imported %s lines into '%s', skipped %s.",
+                len(parsed) - len(missing), collection, len(errors))
+    return errors
+
+
 def import_collection_from_text(collection, text):
     """Read in a collection from plain text.
 
@@ -279,31 +1504,45 @@ def import_collection_from_text(collection, text):
     foiled count, number (with prefix) and set code (in this order)
     seperated by a whitespace.
 
+    Nothing is imported if any line is invalid; use
+    :func:`bulk_import_collection_from_text` to skip those lines
+    instead.
+
+    :raises ValueError: For the first invalid line.
+
     """
-    lines = text.split('\n')
-    for line in lines:
-        columns = line.split()
-        if len(columns) != 4:
-            # TODO(benedikt) Raise better exception
-            raise ValueError('There are not exactly four columns per line.')
-        count = columns[0]
-        fcount = columns[1]
-        number, number_suffix = CardEdition.parse_number(columns[2])
-        code = columns[3]
+    with transaction.atomic():
+        errors = bulk_import_collection_from_text(collection, text)
+        if errors:
+            raise ValueError("Line {0}: {1}".format(errors[0].line_number,
+                                                    errors[0].message))
+
 
-        set_ = Set.objects.get(code=code.upper())
-        edition = CardEdition.objects.get(mtgset=set_, number=number,
-                                          number_suffix=number_suffix)
-        add_collection_entry(count, fcount, collection, edition)
+def iter_collection_lines(collection, chunk_size=2000):
+    """Yield the lines of a collection exported as plain text.
+
+    The entries are read with one query joining their editions and
+    sets and fetched in chunks of ``chunk_size`` rows (from a server
+    side cursor on PostgreSQL), so exporting a collection of any size
+    takes constant memory.  The lines are sorted by set and number.
+
+    See :func:`import_collection_from_text` for the format.
+
+    """
+    rows = (CollectionEntry.objects.filter(collection=collection)
+            .order_by('edition__mtgset__code', 'edition__number',
+                      'edition__number_suffix')
+            .values_list('count', 'foil_count', 'edition__number',
+                         'edition__number_suffix', 'edition__mtgset__code'))
+    if django.VERSION >= (2, 0):
+        rows = rows.iterator(chunk_size=chunk_size)
+    else:
+        rows = rows.iterator()
+    for count, foil_count, number, number_suffix, code in rows:
+        yield '{0} {1} {2}{3} {4}'.format(count, foil_count, number,
+                                          number_suffix, code)
 
 
 def export_collection_as_text(collection):
     """Export a collection as plain text."""
-    lines = []
-    for entry in collection.collectionentry_set.all():
-        line = '{0} {1} {2}{3} {4}'.format(
-            entry.count, entry.foil_count, entry.edition.number,
-            entry.edition.number_suffix, entry.edition.mtgset.code)
-        lines.append(line)
-
-    return '\n'.join(lines)
+    return '\n'.join(iter_collection_lines(collection))
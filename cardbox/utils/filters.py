@@ -12,8 +12,10 @@
 
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import pyparsing as pp
+import copy
+import functools
 import re
+import string
 
 from django.db.models import Q, F
 from django.db.utils import DataError
@@ -34,30 +36,221 @@ UNOPS = {
 }
 BINOPS = ['&', '|']
 
+# Number of compiled filter strings kept by `_compile_filter`.
+FILTER_CACHE_SIZE = 1024
+
+# Characters of the words of a filter string.
+WORD_CHARS = frozenset(string.ascii_letters + string.digits + "*/{}+-'")
+# The characters skipped between the tokens.
+WHITESPACE = ' \t\n\r'
+# Escape sequences of quoted strings converted to whitespace.  Any
+# other escaped character stands for itself.
+ESCAPES = {'t': '\t', 'n': '\n', 'f': '\f', 'r': '\r'}
+
+# Regex and literal tokens.  Quoted strings end at the line's end.
+_QUOTED_RE = {
+    "'": re.compile(r"'((?:\\.|[^'\n\r\\])*)'"),
+    '"': re.compile(r'"((?:\\.|[^"\n\r\\])*)"'),
+}
+_ESCAPE_RE = re.compile(r'\\(.)')
+
+
+class FilterSyntaxError(ValueError):
+    """Raised for filter strings not starting with a valid expression."""
+
+
+class FilterNode(list):
+    """A node of a parsed filter string.
+
+    The node is the list of its tokens.  The named tokens (``not``,
+    ``binop``, ``unop``, ``word``, ``literal`` and ``regex``) are also
+    returned by `keys` and are available as attributes, e.g.
+    ``node.word``.  A nested expression is a node without names,
+    holding the nodes of its parts.
+
+    """
+    def __init__(self, tokens=(), **names):
+        super().__init__(tokens)
+        self.names = names
+
+    def keys(self):
+        return self.names.keys()
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['names'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return 'FilterNode({0}, {1})'.format(list.__repr__(self), self.names)
+
+
+def _unescape(quoted):
+    return _ESCAPE_RE.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)),
+                          quoted)
+
+
+def _scan_filter_string(fstr):
+    """Split a filter string into ``(kind, value)`` tokens.
 
-fg_not = pp.Literal(NOT).setResultsName('not')
-fg_word = pp.Word(pp.alphanums + '*/{}+-\'').setResultsName('word')
-fg_binop = pp.oneOf(BINOPS).setResultsName('binop')
-fg_unop = pp.oneOf(list(UNOPS.keys())).setResultsName('unop')
-fg_regex = pp.Or([pp.QuotedString("r'", endQuoteChar="'", escChar='\\'),
-                  pp.QuotedString('r"', endQuoteChar='"', escChar='\\')]).setResultsName('regex')
-fg_literal = pp.Or([pp.QuotedString("'", escChar='\\'),
-                    pp.QuotedString('"', escChar='\\')]).setResultsName('literal')
-fg_atom = pp.Optional(fg_unop) + (fg_regex ^ fg_literal ^ fg_word)
-fg_expr_part = pp.ZeroOrMore(pp.Group(fg_not)) + pp.Group(fg_atom) + pp.Optional(pp.Group(fg_binop))
-fg_expr = pp.OneOrMore(fg_expr_part)
-fg_nested = pp.nestedExpr(content=fg_expr)
-fg_syntax_part = pp.ZeroOrMore(pp.Group(fg_not)) + (pp.Group(fg_atom) ^ fg_nested) + pp.Optional(pp.Group(fg_binop))
-fg_syntax = pp.OneOrMore(fg_syntax_part)
+    The kinds are ``not``, ``binop``, ``unop``, ``open``, ``close``,
+    ``word``, ``literal`` and ``regex``.  Scanning stops with an
+    ``error`` token at the first character no token can start with.
+
+    Like the other tokens, words, literals (``'...'`` or ``"..."``)
+    and regexes (``r'...'`` or ``r"..."``) are matched as long as
+    possible, e.g. ``'a'b`` is a word (quotes are word characters).
+    On a tie the quoted string wins.
+
+    :rtype: list
+
+    """
+    tokens = []
+    pos = 0
+    end = len(fstr)
+    while True:
+        while pos < end and fstr[pos] in WHITESPACE:
+            pos += 1
+        if pos == end:
+            return tokens
+        char = fstr[pos]
+        if char == NOT:
+            tokens.append(('not', char))
+            pos += 1
+        elif char in BINOPS:
+            tokens.append(('binop', char))
+            pos += 1
+        elif char in '<>=':
+            if char != '=' and fstr.startswith('=', pos + 1):
+                char += '='
+            tokens.append(('unop', char))
+            pos += len(char)
+        elif char == '(':
+            tokens.append(('open', char))
+            pos += 1
+        elif char == ')':
+            tokens.append(('close', char))
+            pos += 1
+        else:
+            word_end = pos
+            while word_end < end and fstr[word_end] in WORD_CHARS:
+                word_end += 1
+            quoted = None
+            if char == 'r' and fstr[pos + 1:pos + 2] in _QUOTED_RE:
+                kind = 'regex'
+                quoted = _QUOTED_RE[fstr[pos + 1]].match(fstr, pos + 1)
+            elif char in _QUOTED_RE:
+                kind = 'literal'
+                quoted = _QUOTED_RE[char].match(fstr, pos)
+            if quoted is not None and quoted.end() >= word_end:
+                tokens.append((kind, _unescape(quoted.group(1))))
+                pos = quoted.end()
+            elif word_end > pos:
+                tokens.append(('word', fstr[pos:word_end]))
+                pos = word_end
+            else:
+                tokens.append(('error', char))
+                return tokens
+
+
+class _FilterParser:
+    """Recursive descent parser of the filter language.
+
+    The grammar of a filter string is::
+
+       expr  := part+
+       part  := '~'* (atom | '(' expr? ')') binop?
+       atom  := unop? (word | literal | regex)
+       binop := '&' | '|'
+       unop  := '<=' | '>=' | '<' | '>' | '='
+
+    Parsing stops at the first part that is not valid and the rest of
+    the string is ignored, only the first part has to be valid.
+
+    """
+    def __init__(self, fstr):
+        self.tokens = _scan_filter_string(fstr)
+        self.pos = 0
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        """Return the node of the whole expression.
+
+        :raises FilterSyntaxError: If the first part is not valid.
+
+        :rtype: FilterNode
+
+        """
+        parts = self._parse_expr()
+        if not parts:
+            raise FilterSyntaxError("Invalid filter expression.")
+        return FilterNode(parts)
+
+    def _parse_expr(self):
+        parts = []
+        while True:
+            start = self.pos
+            part = self._parse_part()
+            if part is None:
+                # Backtrack to the end of the last valid part.
+                self.pos = start
+                return parts
+            parts.extend(part)
+
+    def _parse_part(self):
+        """Return the nodes of one part or ``None`` if it's not valid."""
+        part = []
+        while self._peek() == 'not':
+            part.append(FilterNode([NOT], **{'not': NOT}))
+            self.pos += 1
+        kind = self._peek()
+        if kind == 'open':
+            self.pos += 1
+            nested = self._parse_expr()
+            if self._peek() != 'close':
+                return None
+            self.pos += 1
+            part.append(FilterNode(nested))
+        else:
+            unop = ''
+            if kind == 'unop':
+                unop = self._next()[1]
+                kind = self._peek()
+            if kind not in ('word', 'literal', 'regex'):
+                return None
+            value = self._next()[1]
+            # The unop is always named, `_build_q_atom` relies on it.
+            part.append(FilterNode([unop, value],
+                                   **{'unop': unop, kind: value}))
+        if self._peek() == 'binop':
+            binop = self._next()[1]
+            part.append(FilterNode([binop], binop=binop))
+        return part
 
 
 def _tokenise_filter_string(fstr):
+    """Parse a filter string.
+
+    :rtype: tuple
+    :returns: The `FilterNode` of the whole expression and the error
+        status.  One of them is ``None``.
+
+    """
     ftokens = None
     error = None
     try:
-        # ftokens = fg_expr.parseString(fstr)
-        ftokens = fg_syntax.parseString(fstr)
-    except (pp.ParseException, pp.ParseFatalException):
+        ftokens = _FilterParser(fstr).parse()
+    except (FilterSyntaxError, RecursionError):
         error = 'has-error'
     return ftokens, error
 
@@ -336,19 +529,64 @@ def _guess_cmc(n, w, u, b, r, g, c, tokens):
     return cmc
 
 
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _compile_filter(fstr, fieldname, q_builder, binop_default,
+                    unop_default, atoms=False):
+    """Parse a filter string and build its Q object.
+
+    The results are cached for the whole process, so paging through
+    the results of a search doesn't parse its filters again.
+
+    :param bool atoms: (optional) Build the list of ``(binop, q)``
+        atoms (see `_build_q_atom`) instead of a single Q object.
+
+    :rtype: tuple
+    :returns: The Q object (or atoms) and the error status.  One of
+        them is ``None``.
+
+    """
+    ftokens, error = _tokenise_filter_string(fstr)
+    if error is not None:
+        return None, error
+    try:
+        if atoms:
+            return list(_build_q_atom(ftokens, fieldname, q_builder,
+                                      binop_default, unop_default)), None
+        return _build_q_expr(ftokens, fieldname, q_builder,
+                             binop_default, unop_default), None
+    except (ValueError, KeyError):
+        return None, 'has-warning'
+
+
+def _get_compiled_filter(*args, **kwargs):
+    """Return a copy of the result of `_compile_filter`.
+
+    The cached Q objects are shared by all requests, so they are
+    never handed out themselves.
+
+    """
+    compiled, error = _compile_filter(*args, **kwargs)
+    return copy.deepcopy(compiled), error
+
+
+def filter_cache_info():
+    """Return the hits, misses and size of the filter cache."""
+    return _compile_filter.cache_info()
+
+
+def clear_filter_cache():
+    _compile_filter.cache_clear()
+
+
 def _filter_by_field(queryset, fstr, fieldname, q_builder,
                      binop_default='&', unop_default=''):
     """Filter cards by field."""
     if fstr is None or fstr == '':
         return queryset, None
-    ftokens, error = _tokenise_filter_string(fstr)
+    q, error = _get_compiled_filter(fstr, fieldname, q_builder,
+                                    binop_default, unop_default)
     if error is not None:
         return queryset, error
-    try:
-        q = _build_q_expr(ftokens, fieldname, q_builder,
-                          binop_default, unop_default)
-    except (ValueError, KeyError):
-        return queryset, 'has-warning'
     try:
         filtered = queryset.filter(q)
     except (ValueError, DataError):
@@ -478,17 +716,12 @@ def filter_cards_by_rarity(queryset, fstr):
     """Filter cards by rarity."""
     if fstr is None or fstr == '':
         return queryset, None
-    ftokens, error = _tokenise_filter_string(fstr)
-    if error is not None:
-        return queryset, error
     # In _q_builder_choice literal and regex inputs raise a KeyError
     # since they don't really work on a CharField of length one.
-    try:
-        q_atoms = list(_build_q_atom(
-            ftokens, 'editions__rarity', _q_builder_choice,
-            binop_default='|', unop_default='='))
-    except (KeyError, ValueError):
-        return queryset, 'has-warning'
+    q_atoms, error = _get_compiled_filter(
+        fstr, 'editions__rarity', _q_builder_choice, '|', '=', atoms=True)
+    if error is not None:
+        return queryset, error
 
     filtered = queryset
     q = Q()
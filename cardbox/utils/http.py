@@ -0,0 +1,234 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import logging
+import os
+import requests
+import tempfile
+import threading
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cardbox.utils.archive import (
+    ArchivingClient,
+    PageArchive,
+    ReplayClient,
+)
+
+from cardbox.utils.ratelimit import (
+    RateLimiter,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    """HTTP client shared by the parsers and the image downloader.
+
+    All requests go through one pooled :class:`requests.Session`, so
+    connections are kept alive between requests.  Every request has
+    a timeout and failed requests (connection errors, 429 and 5xx
+    responses) are retried with an exponential backoff.
+
+    If ``cache_dir`` is given, responses carrying an ``ETag`` or a
+    ``Last-Modified`` header are stored on disk.  Later requests for
+    the same URL are revalidated with ``If-None-Match`` and
+    ``If-Modified-Since`` and a ``304 Not Modified`` answer is served
+    from the cache.
+
+    If a :class:`cardbox.utils.ratelimit.RateLimiter` is given, every
+    request waits for it and reports back how it went.  Responses
+    with a retryable status are then retried here instead of inside
+    urllib3, so the limiter sees them and can back off.
+
+    """
+    # (connect, read) timeout in seconds.
+    TIMEOUT = (5, 30)
+    RETRIES = 3
+    BACKOFF = 0.5
+    POOL_SIZE = 20
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, cache_dir=None, timeout=None, retries=None,
+                 backoff=None, pool_size=None, limiter=None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout if timeout is not None else self.TIMEOUT
+        self.retries = retries if retries is not None else self.RETRIES
+        self.limiter = limiter
+        backoff = backoff if backoff is not None else self.BACKOFF
+        pool_size = pool_size or self.POOL_SIZE
+
+        # Return the last response once all retries are used up
+        # instead of raising, so callers can check the status code.
+        if limiter is None:
+            retry = Retry(total=self.retries, backoff_factor=backoff,
+                          status_forcelist=self.RETRY_STATUSES,
+                          raise_on_status=False)
+        else:
+            # urllib3 would retry a 429 with a Retry-After header on
+            # its own, so leave all status retries to `_send`.
+            retry = Retry(total=self.retries, backoff_factor=backoff,
+                          status_forcelist=(), raise_on_status=False,
+                          respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _cache_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read_cache(self, url):
+        """Return the cached metadata and body for ``url``."""
+        path = self._cache_path(url)
+        try:
+            with open(path + '.json', 'r') as f:
+                meta = json.load(f)
+            with open(path + '.body', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def _write_file(self, path, data):
+        """Atomically replace the file at ``path``."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_cache(self, url, response):
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': dict(response.headers),
+            'encoding': response.encoding,
+        }
+        path = self._cache_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write the body first, so a metadata file always has a
+        # complete body next to it.
+        self._write_file(path + '.body', response.content)
+        self._write_file(path + '.json', json.dumps(meta).encode('utf-8'))
+
+    @staticmethod
+    def _cached_response(url, meta, body):
+        """Build a response object from a cache entry."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers.update(meta['headers'])
+        response.encoding = meta['encoding']
+        response._content = body
+        response.from_cache = True
+        return response
+
+    def _send(self, url, headers):
+        if self.limiter is None:
+            return self.session.get(url, headers=headers,
+                                    timeout=self.timeout)
+
+        clock = self.limiter.clock
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(url)
+            start = clock()
+            try:
+                response = self.session.get(url, headers=headers,
+                                            timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                self.limiter.release(url, None, clock() - start)
+                raise
+            self.limiter.release(url, response.status_code, clock() - start,
+                                 response.headers.get('Retry-After'))
+            if response.status_code not in self.RETRY_STATUSES:
+                break
+            logger.info("Got %s for '%s' (attempt %s).",
+                        response.status_code, url, attempt + 1)
+        return response
+
+    def get(self, url):
+        """Send a GET request for ``url``.
+
+        :rtype: `requests.Response`
+        :returns: The response.  Responses served from the cache have
+            ``from_cache`` set to ``True``.
+
+        """
+        meta = body = None
+        headers = {}
+        if self.cache_dir is not None:
+            meta, body = self._read_cache(url)
+            if meta is not None:
+                if meta['etag']:
+                    headers['If-None-Match'] = meta['etag']
+                if meta['last_modified']:
+                    headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self._send(url, headers)
+        if response.status_code == 304 and meta is not None:
+            logger.debug("Not modified '%s'.", url)
+            return self._cached_response(url, meta, body)
+
+        response.from_cache = False
+        if (self.cache_dir is not None and response.status_code == 200 and
+            ('ETag' in response.headers or
+             'Last-Modified' in response.headers)):
+            self._write_cache(url, response)
+        return response
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the HTTP client shared by the whole process.
+
+    The client caches responses in ``CARDBOX_HTTP_CACHE_DIR`` if
+    that setting is defined.  If ``CARDBOX_HTTP_RATE`` is defined,
+    requests are rate limited per host starting with that many
+    requests per second.
+
+    If ``CARDBOX_HTTP_ARCHIVE_DIR`` is defined, all downloaded pages
+    are archived there.  With ``CARDBOX_HTTP_REPLAY`` set to ``True``
+    all pages are read from that archive instead of the network.
+
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            archive_dir = getattr(settings, 'CARDBOX_HTTP_ARCHIVE_DIR', None)
+            if archive_dir and getattr(settings, 'CARDBOX_HTTP_REPLAY',
+                                       False):
+                _default_client = ReplayClient(PageArchive(archive_dir))
+                return _default_client
+
+            rate = getattr(settings, 'CARDBOX_HTTP_RATE', None)
+            _default_client = HTTPClient(
+                cache_dir=getattr(settings, 'CARDBOX_HTTP_CACHE_DIR', None),
+                limiter=RateLimiter(rate=rate) if rate else None)
+            if archive_dir:
+                _default_client = ArchivingClient(_default_client,
+                                                  PageArchive(archive_dir))
+        return _default_client
@@ -14,17 +14,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 import os
-import requests
-import shutil
 
 from cardbox.models import CardEdition
 
+from cardbox.utils.http import (
+    get_client,
+)
+
 logger = logging.getLogger(__name__)
 
 
 class MCIDownloader:
     """Download images from magiccards.info."""
     URL = 'http://magiccards.info/scans/en'
+    # The `cardbox.utils.http.HTTPClient` used for all requests.
+    # Defaults to the client shared by the whole process.
+    CLIENT = None
 
     @staticmethod
     def get_card_edition_image(edition, outfile):
@@ -33,11 +38,11 @@ class MCIDownloader:
                                              edition.mtgset.code.lower(),
                                              str(edition.number) +
                                              edition.number_suffix)
-        r = requests.get(image_url, stream=True)
+        client = MCIDownloader.CLIENT or get_client()
+        r = client.get(image_url)
         if r.status_code == 200:
             with open(outfile, 'wb') as image:
-                r.raw.decode_content = True
-                shutil.copyfileobj(r.raw, image)
+                image.write(r.content)
                 logger.info("New image for '{0}'.".format(edition))
         else:
             logger.warning("No image for '{0}' at '{1}'.".format(edition,
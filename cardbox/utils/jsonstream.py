@@ -0,0 +1,140 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import codecs
+import json
+
+
+class JSONStream:
+    """Decode a JSON document piece by piece from a binary file.
+
+    Only the values that are asked for are decoded, and only as much
+    of the file is kept in memory as is needed for the current value.
+    The byte offset of the current position is tracked, so a value
+    can later be read again by seeking directly to it.
+
+    """
+    CHUNK_SIZE = 1 << 16
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, fp, offset=0, chunk_size=None):
+        self._fp = fp
+        self._fp.seek(offset)
+        self._offset = offset
+        self._chunk_size = chunk_size or self.CHUNK_SIZE
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def tell(self):
+        """Return the byte offset of the current position."""
+        return self._offset
+
+    def _read(self, size):
+        """Read at least ``size`` more characters into the buffer."""
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        wanted = len(self._buf) + size
+        while not self._eof and len(self._buf) < wanted:
+            data = self._fp.read(self._chunk_size)
+            self._eof = not data
+            self._buf += self._decoder.decode(data, final=self._eof)
+        return len(self._buf) > 0
+
+    def _advance(self, n):
+        consumed = self._buf[self._pos:self._pos + n]
+        self._offset += len(consumed.encode('utf-8'))
+        self._pos += n
+
+    def peek(self):
+        """Skip whitespace and return the next character.
+
+        Returns an empty string at the end of the file.
+
+        """
+        while True:
+            while (self._pos < len(self._buf) and
+                   self._buf[self._pos] in self.WHITESPACE):
+                self._advance(1)
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read(1):
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected '{0}' at byte {1}."
+                             .format(char, self._offset))
+        self._advance(1)
+
+    def read_value(self):
+        """Decode the string, array or object at the current position."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except ValueError:
+                # The value isn't complete yet.  Read at least as
+                # much as we already have, so a large value is only
+                # decoded a logarithmic number of times.
+                if self._eof:
+                    raise
+                self._read(max(len(self._buf) - self._pos, self._chunk_size))
+                continue
+            self._advance(end - self._pos)
+            return value
+
+    def iter_keys(self):
+        """Iterate over the keys of the object at the current position.
+
+        After each key the stream is positioned at the matching value,
+        which has to be consumed before the iteration continues.
+
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._advance(1)
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self._advance(1)
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError("Expected ',' or '}}' at byte {0}."
+                                 .format(self._offset - 1))
+
+    def iter_items(self):
+        """Decode the items of the array at the current position one
+        after the other.
+
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self._advance(1)
+            return
+        while True:
+            yield self.read_value()
+            char = self.peek()
+            self._advance(1)
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError("Expected ',' or ']' at byte {0}."
+                                 .format(self._offset - 1))
@@ -0,0 +1,355 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import bz2
+import contextlib
+import datetime
+import gzip
+import logging
+import lzma
+import re
+import shutil
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+from cardbox.models import (
+    Artist,
+    Ruling,
+    Block,
+    Set,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.jsonstream import (
+    JSONStream,
+)
+
+from cardbox.utils.report import (
+    timer,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MTGJSONParser:
+    """Bulk data engine reading an MTGJSON dump.
+
+    Reads a local ``AllPrintings.json`` style file (optionally
+    compressed with gzip, bzip2 or xz) instead of scraping a
+    website.  Both the current layout with a top-level ``data``
+    object and the older layout with the sets at the top level are
+    understood.
+
+    The file is decoded one set at a time, so even dumps of several
+    hundred megabytes never have to fit into memory.  The first call
+    reads the whole file once to remember where each set starts;
+    afterwards every set is read by seeking directly to it.  Seeking
+    in a compressed file decompresses everything before the position,
+    so compressed dumps are decompressed once into a temporary file
+    (deleted by :meth:`close`), which is read instead.
+
+    """
+    OPENERS = {
+        '.gz': gzip.open,
+        '.bz2': bz2.open,
+        '.xz': lzma.open,
+    }
+
+    CATEGORIES = {
+        'core': Block.CATEGORY_CORE_SET,
+        'expansion': Block.CATEGORY_EXPANSION,
+        'promo': Block.CATEGORY_PROMO_CARD,
+    }
+
+    RARITIES = {
+        'common': CardEdition.RARITY_COMMON,
+        'uncommon': CardEdition.RARITY_UNCOMMON,
+        'rare': CardEdition.RARITY_RARE,
+        'mythic': CardEdition.RARITY_MYTHIC_RARE,
+        'special': CardEdition.RARITY_SPECIAL,
+        'bonus': CardEdition.RARITY_SPECIAL,
+    }
+
+    LEGALITIES = {
+        'Legal': Card.LEGALITY_LEGAL,
+        'Restricted': Card.LEGALITY_RESTRICTED,
+        'Banned': Card.LEGALITY_BANNED,
+    }
+    FORMATS = ('vintage', 'legacy', 'extended', 'standard', 'classic',
+               'commander', 'modern')
+
+    SPLIT_LAYOUTS = ('split', 'aftermath')
+    FLIP_LAYOUTS = ('flip', 'transform', 'modal_dfc', 'meld', 'adventure')
+
+    RE_NUMBER = re.compile(r'\A(\d+)(\D*)\Z')
+    RE_MANA_SYMBOL = re.compile(r'\{([^}]*)\}')
+
+    # See `cardbox.utils.parser.MCIParser.REPORT`.  Reading a set from
+    # the dump counts as fetching it; no pages are downloaded.
+    REPORT = None
+
+    def __init__(self, path, chunk_size=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        # The index and the decompressed file are shared with copies
+        # of the parser, e.g. by `cardbox.utils.report.bind_report`.
+        self._shared = {
+            # Set code => (byte offset of the set, set without cards)
+            'index': None,
+            'file': None,
+            'lock': threading.Lock(),
+        }
+
+    def close(self):
+        """Delete the decompressed copy of the dump, if any."""
+        with self._shared['lock']:
+            if self._shared['file'] is not None:
+                self._shared['file'].close()
+                self._shared['file'] = None
+
+    @contextlib.contextmanager
+    def _open(self):
+        """Open the (decompressed) dump at its start."""
+        opener = None
+        for extension, compressed_opener in self.OPENERS.items():
+            if self.path.endswith(extension):
+                opener = compressed_opener
+        if opener is None:
+            with open(self.path, 'rb') as fp:
+                yield fp
+            return
+        # All reads share the temporary file, one at a time.
+        with self._shared['lock']:
+            fp = self._shared['file']
+            if fp is None:
+                fp = tempfile.TemporaryFile()
+                with opener(self.path, 'rb') as compressed:
+                    shutil.copyfileobj(compressed, fp)
+                self._shared['file'] = fp
+            fp.seek(0)
+            yield fp
+
+    def _iter_sets(self, stream):
+        """Yield the offset and the set code of every set in the dump.
+
+        The stream is positioned at the set's value after each yield.
+
+        """
+        for key in stream.iter_keys():
+            if key == 'data':
+                for code in stream.iter_keys():
+                    yield stream.tell(), code
+            elif key == 'meta':
+                stream.read_value()
+            else:
+                yield stream.tell(), key
+
+    def _build_index(self):
+        index = OrderedDict()
+        with self._open() as fp:
+            stream = JSONStream(fp, chunk_size=self.chunk_size)
+            for offset, code in self._iter_sets(stream):
+                data = stream.read_value()
+                data.pop('cards', None)
+                data.pop('tokens', None)
+                data.pop('booster', None)
+                data.pop('sealedProduct', None)
+                index[code.upper()] = (offset, data)
+        return index
+
+    def _get_index(self):
+        if self._shared['index'] is None:
+            self._shared['index'] = self._build_index()
+        return self._shared['index']
+
+    def _read_set(self, setcode):
+        """Return the full data of a single set."""
+        offset, _ = self._get_index()[setcode.upper()]
+        with self._open() as fp:
+            stream = JSONStream(fp, offset=offset,
+                                 chunk_size=self.chunk_size)
+            return stream.read_value()
+
+    @staticmethod
+    def _parse_date(date_str):
+        return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+    @classmethod
+    def _get_category(cls, data):
+        if data.get('isOnlineOnly'):
+            return Block.CATEGORY_MTGO
+        return cls.CATEGORIES.get(data.get('type'),
+                                  Block.CATEGORY_SPECIAL_SET)
+
+    def parse_blocks_sets(self):
+        """Parse all MTG blocks and their sets.
+
+        Sets that don't belong to a block are grouped into a block
+        named after their category, e.g. 'Core Sets'.
+
+        """
+        categories = dict(Block.CATEGORIES)
+        blocks = OrderedDict()
+        for code, (_, data) in self._get_index().items():
+            category = self._get_category(data)
+            name = data.get('block') or categories[category]
+            if name not in blocks:
+                blocks[name] = (Block(name=name, category=category), [])
+            block, sets = blocks[name]
+            set_ = Set(code=code, name=data['name'], block=block)
+            if data.get('releaseDate'):
+                set_.release_date = self._parse_date(data['releaseDate'])
+            sets.append(set_)
+
+        for block, sets in blocks.values():
+            yield block, sets
+
+    @classmethod
+    def _parse_number(cls, data):
+        """Return number and suffix of a card or ``(None, '')``."""
+        match = cls.RE_NUMBER.search(data.get('number', ''))
+        if match is None:
+            return None, ''
+        number_suffix = match.group(2)
+        if number_suffix == '' and data.get('side'):
+            number_suffix = data['side']
+        return int(match.group(1)), number_suffix
+
+    @classmethod
+    def _parse_mana(cls, mana_cost):
+        """Convert ``{2}{U}{B/P}`` to the ``2U{BP}`` notation."""
+        def convert(match):
+            symbol = match.group(1)
+            if symbol.isdigit() or symbol in 'WUBRGCX':
+                return symbol
+            if symbol.endswith('/P'):
+                return '{' + symbol[:-2] + 'P}'
+            return '{' + symbol + '}'
+
+        return cls.RE_MANA_SYMBOL.sub(convert, mana_cost)
+
+    @classmethod
+    def _parse_card(cls, data):
+        """Return edition, card, artist and rulings of a card."""
+        edition = CardEdition()
+        edition.number, edition.number_suffix = cls._parse_number(data)
+        if data.get('type', '').startswith('Basic Land'):
+            edition.rarity = CardEdition.RARITY_LAND
+        else:
+            edition.rarity = cls.RARITIES.get(data.get('rarity'),
+                                              CardEdition.RARITY_OTHER)
+
+        card = Card()
+        layout = data.get('layout', 'normal')
+        name = data.get('faceName') or data['name']
+        if layout in cls.SPLIT_LAYOUTS:
+            # Split cards are named like on magiccards.info, e.g.
+            # 'Alive (Alive/Well)'.
+            card.name = '{0} ({1})'.format(
+                name, data['name'].replace(' // ', '/'))
+            card.multi_type = Card.MULTI_SPLIT
+        else:
+            card.name = name
+            if layout in cls.FLIP_LAYOUTS:
+                card.multi_type = Card.MULTI_FLIP
+
+        identifiers = data.get('identifiers', {})
+        multiverseid = (identifiers.get('multiverseId') or
+                        data.get('multiverseId'))
+        card.multiverseid = int(multiverseid) if multiverseid else None
+        card.types = data.get('type', '')
+        card.rules = data.get('text', '').replace('\n', '\n\n')
+        card.flavour = data.get('flavorText', '')
+        card.set_power(data.get('power'))
+        card.set_toughness(data.get('toughness'))
+        card.set_loyalty(data.get('loyalty'))
+        card.set_mana(cls._parse_mana(data.get('manaCost', '')))
+        card.cmc = int(data.get('manaValue',
+                                data.get('convertedManaCost', 0)))
+
+        legalities = data.get('legalities', {})
+        for format_ in cls.FORMATS:
+            setattr(card, 'legal_' + format_,
+                    cls.LEGALITIES.get(legalities.get(format_),
+                                       Card.LEGALITY_NONE))
+
+        artist = Artist(name=data.get('artist', ''))
+        rulings = [Ruling(date=cls._parse_date(r['date']), ruling=r['text'])
+                   for r in data.get('rulings', [])]
+        return edition, card, artist, rulings
+
+    def parse_set_table(self, setcode):
+        """Return the editions of all cards in a set.
+
+        See :meth:`cardbox.utils.parser.MCIParser.parse_set_table`.
+
+        """
+        return [edition for edition, _, _, _
+                in self.parse_cards_by_set(setcode)]
+
+    def parse_cards_by_set(self, setcode, numbers=None):
+        """Parse all cards in a set.
+
+        The cards are yielded ordered by their number, so all parts
+        of a multi card follow each other.  Cards without a numeric
+        collector number can't be stored and are skipped.
+
+        :param numbers: (optional) Only parse the cards with these
+            numbers (including the suffix, e.g. ``'60a'``).
+
+        """
+        with timer(self.REPORT, 'fetch'):
+            cards = self._read_set(setcode).get('cards', [])
+        with timer(self.REPORT, 'parse'):
+            entries = self._parse_cards(setcode, cards, numbers)
+        yield from entries
+
+    def _parse_cards(self, setcode, cards, numbers):
+        entries = []
+        seen = set()
+        for data in cards:
+            edition, card, artist, rulings = self._parse_card(data)
+            key = (edition.number, edition.number_suffix)
+            if edition.number is None:
+                logger.warning("Skipping '%s' in '%s' without a number.",
+                               card.name, setcode)
+                continue
+            if key in seen:
+                logger.warning("Skipping duplicate number '%s%s' in '%s'.",
+                               edition.number, edition.number_suffix,
+                               setcode)
+                continue
+            seen.add(key)
+            if (numbers is not None and
+                str(edition.number) + edition.number_suffix not in numbers):
+                continue
+            entries.append((edition, card, artist, rulings))
+
+        entries.sort(key=lambda entry: (entry[0].number,
+                                        entry[0].number_suffix))
+        return entries
+
+    def parse_card(self, setcode, number):
+        """Parse a single card of a set.
+
+        See :meth:`cardbox.utils.parser.MCIParser.parse_card`.
+
+        """
+        for edition, card, artist, rulings in self.parse_cards_by_set(setcode):
+            if str(edition.number) + edition.number_suffix == str(number):
+                return card, artist, rulings
+        raise KeyError("No card '{0}' in '{1}'.".format(number, setcode))
@@ -14,11 +14,18 @@
 
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import contextlib
 import datetime
+import django
+import functools
+import os
 import re
-import requests
+import threading
+import time
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from cardbox.models import (
     Artist,
@@ -29,10 +36,127 @@ from cardbox.models import (
     CardEdition,
 )
 
+from cardbox.utils.http import (
+    get_client,
+)
+
+from cardbox.utils.report import (
+    timer,
+)
+
+try:
+    import lxml
+    FAST_HTML_PARSER = 'lxml'
+except ImportError:
+    FAST_HTML_PARSER = 'html.parser'
+
+
+# Patterns used while parsing a card page.  They are compiled once
+# instead of for every card.
+RE_TYPES = re.compile(r'\A[a-zA-Z—\- ]+')
+RE_PT = re.compile(r'([\d*+]+)/([\d*+]+)')
+RE_LOYALTY = re.compile(r'\(Loyalty: ([\d*+]+)\)')
+RE_MANA = re.compile(r'\s[\dWUBRGCPX*{}/]+(\s|\Z)')
+RE_CMC = re.compile(r'\((\d+)\)')
+RE_MULTIVERSEID = re.compile(r'=(\d+)\Z')
+RE_ARTIST = re.compile(r'\AIllus\.')
+RE_SPLIT_NAME = re.compile(r'(.*) \(.*?/?\1/?.*?\)')
+
+
+def _is_multiverseid_href(href):
+    """Return if ``href`` links to a card on gatherer."""
+    return href is not None and '?multiverseid=' in href
+
+
+def map_ordered(func, iterable, workers, executor=None):
+    """Apply ``func`` to every item of ``iterable`` using threads.
+
+    The results are yielded in the order of ``iterable``, no matter
+    in which order the calls finish.  At most ``2*workers`` calls are
+    pending at any time, so a consumer that stops early doesn't leave
+    a whole set's worth of requests running in the background.
+
+    If ``executor`` is given, the calls run on it instead of on a new
+    thread pool, e.g. on a process pool with ``workers`` processes.
+
+    """
+    if executor is None:
+        if workers <= 1:
+            yield from map(func, iterable)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from map_ordered(func, iterable, workers, executor)
+        return
+
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2*workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# Picklable result of parsing a card page in another process.  The
+# card is stored as a tuple of its `CARD_RECORD_FIELDS`, the artist
+# as its name and the rulings as ``(date, ruling)`` tuples.  The
+# seconds it took to parse the page are passed along for the report.
+CardRecord = namedtuple('CardRecord', 'card artist rulings seconds')
+CARD_RECORD_FIELDS = tuple(field.attname for field
+                           in Card._meta.concrete_fields
+                           if not field.primary_key)
+
+
+def _parse_card_record(engine, setcode, page):
+    """Parse a ``(number, html)`` card page into a `CardRecord`.
+
+    Runs in the worker processes of :class:`ProcessMCIParser`.
+
+    """
+    number, html = page
+    start = time.monotonic()
+    card, artist, rulings = engine._parse_card_html(html, setcode, number)
+    return CardRecord(
+        card=tuple(getattr(card, name) for name in CARD_RECORD_FIELDS),
+        artist=artist.name,
+        rulings=tuple((ruling.date, ruling.ruling) for ruling in rulings),
+        seconds=time.monotonic() - start)
+
+
+def _card_from_record(record):
+    """Return the card, artist and rulings of a `CardRecord`."""
+    card = Card(**dict(zip(CARD_RECORD_FIELDS, record.card)))
+    rulings = [Ruling(date=date, ruling=ruling)
+               for date, ruling in record.rulings]
+    return card, Artist(name=record.artist), rulings
+
 
 class MCIParser:
     """magiccards.info engine"""
     URL = 'http://magiccards.info'
+    # Number of card pages fetched at the same time by
+    # `parse_cards_by_set`.
+    WORKERS = 1
+    # The `cardbox.utils.http.HTTPClient` used for all requests.
+    # Defaults to the client shared by the whole process.
+    CLIENT = None
+    # The `cardbox.utils.report.ImportReport` the time spent fetching
+    # and parsing pages is added to (if any).
+    REPORT = None
+
+    @classmethod
+    def _get_html(cls, url):
+        """Return the html of the page at ``url``."""
+        client = cls.CLIENT or get_client()
+        with timer(cls.REPORT, 'fetch'):
+            html = client.get(url).text
+        if cls.REPORT is not None:
+            cls.REPORT.add_page()
+        return html
 
     @staticmethod
     def _get_category(heading):
@@ -63,10 +187,21 @@ class MCIParser:
             sets = MCIParser._parse_sets(li.ul, block)
             yield block, sets
 
+    @classmethod
+    def _sitemap_url(cls):
+        return '{0}/sitemap.html'.format(cls.URL)
+
+    @classmethod
+    def _set_url(cls, setcode):
+        return '{0}/{1}/en.html'.format(cls.URL, setcode.lower())
+
+    @classmethod
+    def _card_url(cls, setcode, number):
+        return '{0}/{1}/en/{2}.html'.format(cls.URL, setcode.lower(), number)
+
     @staticmethod
-    def parse_blocks_sets():
-        """Parse all MTG blocks and their sets."""
-        html = requests.get('{0}/sitemap.html'.format(MCIParser.URL)).text
+    def _parse_blocks_sets_html(html):
+        """Parse all MTG blocks and their sets from the sitemap."""
         soup = BeautifulSoup(html, 'html.parser')
         for h2 in soup.find_all('h2'):
             if h2.small.text == 'en':
@@ -78,6 +213,12 @@ class MCIParser:
                 yield from MCIParser._parse_block_sets(
                     h3.find_next('ul'), category)
 
+    @classmethod
+    def parse_blocks_sets(cls):
+        """Parse all MTG blocks and their sets."""
+        html = cls._get_html(cls._sitemap_url())
+        yield from cls._parse_blocks_sets_html(html)
+
     @staticmethod
     def _parse_types_stats(p):
         """Parse type, power, toughness, loyalty, mana and cmc.
@@ -93,33 +234,28 @@ class MCIParser:
 
         """
         text = ' '.join(p.stripped_strings)
-        regex_types = re.compile(r'\A[a-zA-Z—\- ]+')
-        regex_pt = re.compile(r'([\d*+]+)/([\d*+]+)')
-        regex_loyalty = re.compile(r'\(Loyalty: ([\d*+]+)\)')
-        regex_mana = re.compile(r'\s[\dWUBRGCPX*{}/]+(\s|\Z)')
-        regex_cmc = re.compile(r'\((\d+)\)')
 
-        match = regex_types.search(text)
+        match = RE_TYPES.search(text)
         types = match.group(0).strip()
         end = match.end()
 
-        match = regex_pt.search(text[end:])
+        match = RE_PT.search(text[end:])
         power = match.group(1).strip() if match else None
         toughness = match.group(2).strip() if match else None
         if match:
             end += match.end()
 
-        match = regex_loyalty.search(text[end:])
+        match = RE_LOYALTY.search(text[end:])
         loyalty = match.group(1).strip() if match else None
         if match:
             end += match.end()
 
-        match = regex_mana.search(text[end:])
+        match = RE_MANA.search(text[end:])
         mana = match.group(0).strip() if match else None
         if match:
             end += match.end()
 
-        match_cmc = regex_cmc.search(text[end:])
+        match_cmc = RE_CMC.search(text[end:])
         cmc = int(match_cmc.group(1)) if match_cmc else 0
 
         return types, power, toughness, loyalty, mana, cmc
@@ -207,30 +343,29 @@ class MCIParser:
         # Every split card has it's name repeated in parentheses
         # (along with the names of it's other parts).
         if '(' in name:
-            regex = re.compile(r'(.*) \(.*?/?\1/?.*?\)')
-            if regex.search(name) is not None:
+            if RE_SPLIT_NAME.search(name) is not None:
                 return Card.MULTI_SPLIT
         return Card.MULTI_FLIP
 
-    @staticmethod
-    def parse_card(setcode, number):
-        """Parse a card from it's detail page on magiccards.info.
+    @classmethod
+    def _card_soup(cls, html):
+        """Return the parse tree of a card page."""
+        return BeautifulSoup(html, 'html.parser')
 
-        Returns a :class:`cardbox.models.Card` object that is
-        partially filled (rarity and foreign keys are missing) as
-        well as the artist, the dual card (if any) and all rulings
-        (if any).
+    @classmethod
+    def _parse_card_html(cls, html, setcode, number):
+        """Parse a card from the html of it's detail page.
+
+        See :meth:`parse_card` for the return value.
 
         """
         card = Card()
 
-        html = requests.get('{0}/{1}/en/{2}.html'.format(
-            MCIParser.URL, setcode.lower(), number)).text
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = cls._card_soup(html)
 
-        a_multiverseid = soup.find('a', {'href': re.compile(r'.*\?multiverseid=.*')})
-        multiverseid = re.search(r'=(\d+)\Z',
-                                 a_multiverseid.attrs['href']).group(1)
+        a_multiverseid = soup.find('a', href=_is_multiverseid_href)
+        multiverseid = RE_MULTIVERSEID.search(
+            a_multiverseid.attrs['href']).group(1)
         card.multiverseid = int(multiverseid) if multiverseid else None
 
         a_name = soup.find('a', {'href':'/{0}/en/{1}.html'
@@ -252,7 +387,7 @@ class MCIParser:
         p_flavour = p_rules.find_next_sibling('p')
         card.flavour = '\n'.join(p_flavour.stripped_strings)
 
-        p_artist = soup.find('p', text=re.compile(r'\AIllus\.'))
+        p_artist = soup.find('p', text=RE_ARTIST)
         artist = MCIParser._parse_artist(p_artist)
 
         ul_rulings = p_flavour.find_next_sibling('ul')
@@ -281,6 +416,20 @@ class MCIParser:
 
         return card, artist, rulings
 
+    @classmethod
+    def parse_card(cls, setcode, number):
+        """Parse a card from it's detail page on magiccards.info.
+
+        Returns a :class:`cardbox.models.Card` object that is
+        partially filled (rarity and foreign keys are missing) as
+        well as the artist, the dual card (if any) and all rulings
+        (if any).
+
+        """
+        html = cls._get_html(cls._card_url(setcode, number))
+        with timer(cls.REPORT, 'parse'):
+            return cls._parse_card_html(html, setcode, number)
+
     @staticmethod
     def _parse_rarity(rarity_str):
         # We don't need to check for RARITY_NONE here since it's the
@@ -290,29 +439,79 @@ class MCIParser:
                 return rarity_code
         return CardEdition.RARITY_NONE
 
-    @staticmethod
-    def parse_cards_by_set(setcode):
-        """Parse all cards in a set.
+    @classmethod
+    def _set_table_soup(cls, html):
+        """Return the parse tree of a set page."""
+        return BeautifulSoup(html, 'html.parser')
 
-        Each card will be yielded along with it's edition,
-        dual_card (if any), artist and all rulings (if any).
+    @classmethod
+    def _parse_set_table_html(cls, html):
+        """Parse the table of all cards in a set.
+
+        Returns a list of ``(edition, number_str)`` tuples, one per
+        card in the order of the table.  The editions only have
+        their number and rarity set.
 
         """
-        url = '{0}/{1}/en.html'.format(MCIParser.URL, setcode.lower())
-        html = requests.get(url)
-        soup = BeautifulSoup(html.text, 'html.parser')
+        soup = cls._set_table_soup(html)
         table = soup.find('table', {'cellpadding': '3'})
+        rows = []
         # Skip the first entry since it only declares the headers.
         for tr in table.find_all('tr')[1:]:
-            card = Card()
             tds = tr.find_all('td')
             number_str = tds[0].text
             edition = CardEdition()
             edition.set_number(number_str)
             edition.rarity = MCIParser._parse_rarity(tds[4].text)
-            card, artist, rulings = MCIParser.parse_card(
-                setcode.lower(), number_str)
-            yield edition, card, artist, rulings
+            rows.append((edition, number_str))
+        return rows
+
+    @classmethod
+    def parse_set_table(cls, setcode):
+        """Parse the table of all cards in a set.
+
+        Only the set page itself is requested, none of the card
+        pages.
+
+        :rtype: list
+        :returns: The editions of the set in the order of the table
+            with only their number and rarity set.
+
+        """
+        html = cls._get_html(cls._set_url(setcode))
+        return [edition for edition, _ in cls._parse_set_table_html(html)]
+
+    @classmethod
+    def parse_cards_by_set(cls, setcode, workers=None, numbers=None):
+        """Parse all cards in a set.
+
+        Each card will be yielded along with it's edition,
+        dual_card (if any), artist and all rulings (if any).
+
+        :param int workers: (optional) The number of card pages to
+            fetch at the same time.  Defaults to ``WORKERS``.  The
+            cards are yielded in the order of the set table
+            regardless of this value.
+
+        :param numbers: (optional) Only parse the cards with these
+            numbers (including the suffix, e.g. ``'60a'``).
+
+        """
+        if workers is None:
+            workers = cls.WORKERS
+        html = cls._get_html(cls._set_url(setcode))
+        with timer(cls.REPORT, 'parse'):
+            rows = cls._parse_set_table_html(html)
+        if numbers is not None:
+            rows = [row for row in rows if row[1] in numbers]
+
+        def parse_row(row):
+            edition, number_str = row
+            card, artist, rulings = cls.parse_card(setcode.lower(),
+                                                   number_str)
+            return edition, card, artist, rulings
+
+        yield from map_ordered(parse_row, rows, workers)
 
     @staticmethod
     def parse_token():
@@ -321,3 +520,154 @@ class MCIParser:
     @staticmethod
     def parse_token_list():
         pass
+
+
+class FastMCIParser(MCIParser):
+    """magiccards.info engine tuned for parsing speed.
+
+    Produces the same results as :class:`MCIParser`, but uses lxml
+    (if installed) instead of Python's html.parser and only builds
+    the parse tree for the parts of a page that are actually read:
+    the table holding the card on a card page and the card table on
+    a set page.
+
+    """
+    HTML_PARSER = FAST_HTML_PARSER
+    CARD_STRAINER = SoupStrainer('table', attrs={'align': 'center'})
+    SET_TABLE_STRAINER = SoupStrainer('table', attrs={'cellpadding': '3'})
+
+    @classmethod
+    def _card_soup(cls, html):
+        return BeautifulSoup(html, cls.HTML_PARSER,
+                             parse_only=cls.CARD_STRAINER)
+
+    @classmethod
+    def _set_table_soup(cls, html):
+        return BeautifulSoup(html, cls.HTML_PARSER,
+                             parse_only=cls.SET_TABLE_STRAINER)
+
+
+class ProcessMCIParser(MCIParser):
+    """magiccards.info engine parsing pages in several processes.
+
+    A pool of threads downloads the card pages while a pool of
+    processes parses them, so parsing isn't limited to the one core
+    the GIL allows.  Only the html and small picklable `CardRecord`
+    tuples are passed between the processes; the models are built
+    again in the calling process in the order of the set table.
+
+    The pages are parsed with ``PARSE_ENGINE``, which has to be
+    importable from the worker processes.
+
+    The processes are started with the first set and reused for all
+    following sets (of this class and its subclasses), since starting
+    them sets up Django in every process.  Wrap a whole import run
+    in :meth:`pool` to stop them at its end::
+
+       with ProcessMCIParser.pool():
+           insert_blocks_sets_cards_from_parser(ProcessMCIParser)
+
+    Otherwise they run until :meth:`shutdown_pool` is called or the
+    interpreter exits.
+
+    """
+    WORKERS = 16
+    # Number of parsing processes.  Defaults to the number of CPUs.
+    PROCESSES = None
+    PARSE_ENGINE = FastMCIParser
+
+    # The executor shared by all sets and its number of processes.
+    _pool = {'executor': None, 'processes': None}
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def _get_executor(cls, processes=None):
+        """Return the pool of parsing processes, starting it if needed.
+
+        A running pool with another number of processes is replaced.
+
+        """
+        processes = processes or cls.PROCESSES or os.cpu_count()
+        with cls._pool_lock:
+            pool = cls._pool
+            if (pool['executor'] is not None and
+                pool['processes'] != processes):
+                pool['executor'].shutdown()
+                pool['executor'] = None
+            if pool['executor'] is None:
+                # The workers need a configured Django to import the
+                # models.
+                pool['executor'] = ProcessPoolExecutor(
+                    max_workers=processes, initializer=django.setup)
+                pool['processes'] = processes
+            return pool['executor'], processes
+
+    @classmethod
+    def shutdown_pool(cls):
+        """Stop the parsing processes.
+
+        The next set parsed starts them again.
+
+        """
+        with cls._pool_lock:
+            executor = cls._pool['executor']
+            cls._pool.update(executor=None, processes=None)
+        if executor is not None:
+            executor.shutdown()
+
+    @classmethod
+    @contextlib.contextmanager
+    def pool(cls, processes=None):
+        """Parse all sets of the ``with`` block in the same processes.
+
+        :param int processes: (optional) The number of processes.
+            Defaults to ``PROCESSES``.
+
+        """
+        cls._get_executor(processes)
+        try:
+            yield
+        finally:
+            cls.shutdown_pool()
+
+    @classmethod
+    def parse_cards_by_set(cls, setcode, workers=None, numbers=None,
+                           processes=None):
+        """Parse all cards in a set.
+
+        See :meth:`MCIParser.parse_cards_by_set`.
+
+        :param int processes: (optional) The number of processes
+            parsing pages.  Defaults to ``PROCESSES``, or to the size
+            of the pool started by :meth:`pool`.
+
+        """
+        if workers is None:
+            workers = cls.WORKERS
+        if processes is None:
+            processes = cls._pool['processes']
+        html = cls._get_html(cls._set_url(setcode))
+        with timer(cls.REPORT, 'parse'):
+            rows = cls._parse_set_table_html(html)
+        if numbers is not None:
+            rows = [row for row in rows if row[1] in numbers]
+
+        def fetch(row):
+            _, number_str = row
+            return number_str, cls._get_html(cls._card_url(setcode,
+                                                           number_str))
+
+        parse = functools.partial(_parse_card_record, cls.PARSE_ENGINE,
+                                  setcode.lower())
+        executor, processes = cls._get_executor(processes)
+        pages = map_ordered(fetch, rows, workers)
+        records = map_ordered(parse, pages, processes, executor)
+        try:
+            for (edition, _), record in zip(rows, records):
+                if cls.REPORT is not None:
+                    cls.REPORT.add_time('parse', record.seconds)
+                card, artist, rulings = _card_from_record(record)
+                yield edition, card, artist, rulings
+        finally:
+            records.close()
+            pages.close()
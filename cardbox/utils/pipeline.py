@@ -0,0 +1,331 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import queue
+import threading
+
+from cardbox.models import (
+    Set,
+)
+
+from cardbox.utils.context import (
+    ImportContext,
+)
+
+from cardbox.utils.db import (
+    backfill_ruling_digests,
+    bulk_insert_blocks_sets,
+    insert_parsed_cards,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
+    map_ordered,
+)
+
+from cardbox.utils.report import (
+    ImportReport,
+    bind_report,
+    timer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Kinds of the items passed between the stages.  Every item is a
+# ``(kind, set, payload)`` tuple.
+SET_START = 'start'
+PAGE = 'page'
+ENTRY = 'entry'
+SET_END = 'end'
+DONE = 'done'
+ERROR = 'error'
+
+
+class UnknownSetError(ValueError):
+    """Raised for set codes that are neither in the database nor in
+    the source.
+
+    """
+
+
+class ImportPipeline:
+    """Import sets in three stages running at the same time.
+
+    A fetch thread downloads the pages of the sets, a parse thread
+    turns them into models and the calling thread writes them to the
+    database, one set per transaction.  The stages are connected by
+    queues holding at most ``queue_size`` items.  A stage that gets
+    ahead blocks until the next one catches up, so no more than a
+    few sets are held in memory, no matter how many are imported.
+
+    Only parsers offering the page level methods of
+    :class:`cardbox.utils.parser.MCIParser` are split into fetch and
+    parse; the cards of other parsers (e.g. MTGJSON dumps) are
+    parsed in the fetch thread.  Those parsers time themselves, so
+    the pipeline uses a copy of them bound to its report (see
+    :func:`cardbox.utils.report.bind_report`).
+
+    """
+    # Number of card pages downloaded at the same time.
+    WORKERS = 8
+    QUEUE_SIZE = 64
+    # Seconds between two calls of the progress callback.
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, parser=MCIParser, update=False, workers=None,
+                 dry_run=False, context=None, prune=False,
+                 queue_size=None, progress=None):
+        """
+        :param bool dry_run: (optional) Fetch and parse the cards but
+            don't write anything.
+
+        :type context: `cardbox.utils.context.ImportContext`
+        :param context: (optional) The context to look up existing
+            rows in and to count the rows written in.
+
+        :param progress: (optional) Called with the pipeline every
+            ``PROGRESS_INTERVAL`` seconds and once at the end.
+
+        """
+        self.parser = parser
+        self.update = update
+        self.workers = workers or self.WORKERS
+        self.dry_run = dry_run
+        self.context = context
+        self.prune = prune
+        self.progress = progress
+        self.report = (context.import_report if context is not None
+                       else ImportReport())
+        if not self._splits_pages():
+            self.parser = bind_report(parser, self.report)
+        self.sets_total = 0
+        self.sets_done = 0
+        self.cards = 0
+        queue_size = queue_size or self.QUEUE_SIZE
+        self._pages = queue.Queue(maxsize=queue_size)
+        self._entries = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+    def _splits_pages(self):
+        return all(hasattr(self.parser, name)
+                   for name in ('_get_html', '_set_url', '_card_url',
+                                '_parse_set_table_html', '_parse_card_html'))
+
+    def _put(self, items, item):
+        """Put ``item`` into the queue unless the run was stopped.
+
+        :rtype: bool
+        :returns: Whether the item was put.
+
+        """
+        while not self._stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get_html(self, setcode, url):
+        with timer(self.report, 'fetch', setcode):
+            html = self.parser._get_html(url)
+        self.report.add_page()
+        return html
+
+    def _fetch_set(self, set_):
+        parser = self.parser
+        html = self._get_html(set_.code, parser._set_url(set_.code))
+        with timer(self.report, 'parse', set_.code):
+            rows = parser._parse_set_table_html(html)
+
+        def fetch(row):
+            edition, number_str = row
+            url = parser._card_url(set_.code, number_str)
+            return edition, number_str, self._get_html(set_.code, url)
+
+        pages = map_ordered(fetch, rows, self.workers)
+        try:
+            for page in pages:
+                if not self._put(self._pages, (PAGE, set_, page)):
+                    return
+        finally:
+            pages.close()
+
+    def _parse_set(self, set_):
+        # The parser adds its own times to the report, see `__init__`.
+        self.report.start_set(set_.code)
+        for entry in self.parser.parse_cards_by_set(set_.code):
+            if not self._put(self._pages, (ENTRY, set_, entry)):
+                return
+
+    def _fetch(self, sets):
+        """Stage 1: Download the pages of all sets."""
+        try:
+            for set_ in sets:
+                if not self._put(self._pages, (SET_START, set_, None)):
+                    return
+                if self._splits_pages():
+                    self._fetch_set(set_)
+                else:
+                    self._parse_set(set_)
+                if not self._put(self._pages, (SET_END, set_, None)):
+                    return
+            self._put(self._pages, (DONE, None, None))
+        except BaseException as e:
+            self._put(self._pages, (ERROR, None, e))
+
+    def _parse(self):
+        """Stage 2: Parse the card pages."""
+        parse_html = getattr(self.parser, '_parse_card_html', None)
+        try:
+            while not self._stop.is_set():
+                try:
+                    kind, set_, payload = self._pages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if kind == PAGE:
+                    edition, number_str, html = payload
+                    with timer(self.report, 'parse', set_.code):
+                        card, artist, rulings = parse_html(
+                            html, set_.code.lower(), number_str)
+                    payload = (edition, card, artist, rulings)
+                    kind = ENTRY
+                if not self._put(self._entries, (kind, set_, payload)):
+                    return
+                if kind in (DONE, ERROR):
+                    return
+        except BaseException as e:
+            self._put(self._entries, (ERROR, None, e))
+
+    def _write(self, set_, entries):
+        """Stage 3: Write the cards of a set."""
+        if not self.dry_run:
+            insert_parsed_cards(set_, entries, self.update,
+                                context=self.context, prune=self.prune)
+        logger.info("Set '%s' done with %s cards.", set_, len(entries))
+
+    def status(self):
+        """Return the progress of the run."""
+        elapsed = self.report.elapsed()
+        return {
+            'sets': self.sets_done,
+            'sets_total': self.sets_total,
+            'cards': self.cards,
+            'pages': self.report.pages,
+            'pages_per_second': self.report.pages_per_second(),
+            'cards_per_second': self.cards / elapsed if elapsed > 0 else 0.0,
+            'fetched': self._pages.qsize(),
+            'parsed': self._entries.qsize(),
+        }
+
+    def _report_progress(self):
+        if self.progress is not None:
+            self.progress(self)
+
+    def run(self, sets):
+        """Import the cards of ``sets``.
+
+        :rtype: `cardbox.utils.report.ImportReport`
+
+        """
+        sets = list(sets)
+        self.sets_total = len(sets)
+        threads = [
+            threading.Thread(target=self._fetch, args=(sets,),
+                             name='cardbox-fetch', daemon=True),
+            threading.Thread(target=self._parse, name='cardbox-parse',
+                             daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            entries = []
+            last_progress = self.report.clock()
+            while True:
+                try:
+                    kind, set_, payload = self._entries.get(
+                        timeout=self.PROGRESS_INTERVAL)
+                except queue.Empty:
+                    kind = None
+                if kind == SET_START:
+                    entries = []
+                elif kind == ENTRY:
+                    entries.append(payload)
+                    self.cards += 1
+                elif kind == SET_END:
+                    self._write(set_, entries)
+                    entries = []
+                    self.sets_done += 1
+                elif kind == ERROR:
+                    raise payload
+                elif kind == DONE:
+                    break
+                if (self.report.clock() - last_progress >=
+                    self.PROGRESS_INTERVAL):
+                    last_progress = self.report.clock()
+                    self._report_progress()
+        finally:
+            # Unblock the other stages if we stopped early.
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        self.report.finish()
+        self._report_progress()
+        return self.report
+
+
+def run_pipeline(parser=MCIParser, setcodes=None, update=False,
+                 workers=None, dry_run=False, prune=False, progress=None):
+    """Import blocks, sets and cards with an :class:`ImportPipeline`.
+
+    :param setcodes: (optional) Only import the cards of the sets
+        with these codes.  Defaults to all sets.
+
+    :param bool dry_run: (optional) Fetch and parse everything but
+        don't write to the database.
+
+    See :class:`ImportPipeline` for the other parameters.
+
+    :raises UnknownSetError: If one of ``setcodes`` is unknown.
+
+    :rtype: `cardbox.utils.report.ImportReport`
+
+    """
+    blocks_sets = list(parser.parse_blocks_sets())
+    if dry_run:
+        context = None
+        sets = [set_ for _, block_sets in blocks_sets for set_ in block_sets]
+    else:
+        backfill_ruling_digests()
+        context = ImportContext(preload=True)
+        bulk_insert_blocks_sets(blocks_sets, update, context)
+        sets = list(Set.objects.all())
+
+    if setcodes is not None:
+        setcodes = set(code.upper() for code in setcodes)
+        sets = [set_ for set_ in sets if set_.code.upper() in setcodes]
+        missing = setcodes - set(set_.code.upper() for set_ in sets)
+        if missing:
+            raise UnknownSetError("Unknown sets: {0}."
+                                  .format(', '.join(sorted(missing))))
+
+    pipeline = ImportPipeline(parser, update, workers, dry_run, context,
+                              prune, progress=progress)
+    report = pipeline.run(sets)
+    if context is not None:
+        context.log_report()
+    else:
+        report.log()
+    return report
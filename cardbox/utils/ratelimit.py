@@ -0,0 +1,240 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket handing out ``rate`` tokens per second.
+
+    At most ``burst`` tokens are saved up while the bucket isn't
+    used.  Taking a token never blocks, instead the time to wait for
+    it is returned, so the caller decides how to wait.
+
+    """
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self._last = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self):
+        """Take a token.
+
+        :rtype: float
+        :returns: The number of seconds to wait before using it.
+
+        """
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+    def pause(self, seconds):
+        """Don't hand out any tokens for the next ``seconds``."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def drain(self):
+        """Throw away all saved up tokens."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Host:
+    """Scheduling state of a single host."""
+    def __init__(self, limiter):
+        self.bucket = TokenBucket(limiter.rate, limiter.burst,
+                                  limiter.clock)
+        self.concurrency = limiter.concurrency
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.last_backoff = None
+        self.condition = threading.Condition()
+
+
+class RateLimiter:
+    """Adaptive per-host rate limiter for the HTTP client.
+
+    Every host gets its own token bucket and its own limit of
+    requests in flight.  Both grow additively while requests succeed
+    and the latency stays close to the lowest latency seen so far,
+    and are cut in half on a 429 or 5xx response, a connection error
+    or when the latency rises (AIMD, like TCP congestion control).
+    A ``Retry-After`` header pauses the host for the given time.
+
+    ``clock`` and ``sleep`` can be replaced to run the limiter
+    deterministically in tests.
+
+    """
+    RATE = 10.0
+    MIN_RATE = 0.5
+    MAX_RATE = 100.0
+    BURST = 5
+    CONCURRENCY = 4
+    MAX_CONCURRENCY = 32
+    # Multiplicative decrease on errors.
+    DECREASE = 0.5
+    # Back off if the (smoothed) latency exceeds the lowest latency
+    # by this factor plus the slack in seconds.
+    LATENCY_FACTOR = 2.0
+    LATENCY_SLACK = 0.05
+    LATENCY_SMOOTHING = 0.3
+    # Back off at most once per this many seconds, since the
+    # responses to requests sent before a backoff still come in.
+    COOLDOWN = 1.0
+    BACKOFF_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate=None, burst=None, concurrency=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate or self.RATE
+        self.burst = burst or self.BURST
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.clock = clock
+        self.sleep = sleep
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(self)
+            return self._hosts[host]
+
+    def acquire(self, url):
+        """Wait until a request to ``url`` may be sent."""
+        host = self._get_host(url)
+        with host.condition:
+            while host.in_flight >= host.concurrency:
+                host.condition.wait()
+            host.in_flight += 1
+            wait = host.bucket.take()
+        if wait > 0:
+            self.sleep(wait)
+
+    def release(self, url, status_code, latency, retry_after=None):
+        """Report the outcome of a request sent after :meth:`acquire`.
+
+        :param status_code: The status code of the response or
+            ``None`` if the request failed.
+
+        :param float latency: The time the request took in seconds.
+
+        :param retry_after: (optional) The value of the response's
+            ``Retry-After`` header.
+
+        """
+        host = self._get_host(url)
+        with host.condition:
+            host.in_flight -= 1
+            if status_code is not None:
+                self._update_latency(host, latency)
+
+            if (status_code is None or
+                status_code in self.BACKOFF_STATUSES or
+                self._is_congested(host)):
+                self._decrease(host, url)
+            elif status_code < 400:
+                self._increase(host)
+
+            seconds = self._parse_retry_after(retry_after)
+            if seconds:
+                logger.info("Pausing '%s' for %s seconds.",
+                            urlsplit(url).netloc, seconds)
+                host.bucket.pause(seconds)
+            host.condition.notify_all()
+
+    def _update_latency(self, host, latency):
+        if host.latency is None:
+            host.latency = latency
+        else:
+            host.latency += self.LATENCY_SMOOTHING * (latency - host.latency)
+        if host.min_latency is None or latency < host.min_latency:
+            host.min_latency = latency
+
+    def _is_congested(self, host):
+        return (host.latency is not None and
+                host.latency > (host.min_latency * self.LATENCY_FACTOR +
+                                self.LATENCY_SLACK))
+
+    def _increase(self, host):
+        # Grow by about one request per second (and one request in
+        # flight) per round of requests.
+        rate = min(self.MAX_RATE, host.bucket.rate + 1 / host.bucket.rate)
+        host.bucket.set_rate(rate)
+        host.concurrency = min(self.MAX_CONCURRENCY,
+                               host.concurrency + 1 / host.concurrency)
+
+    def _decrease(self, host, url):
+        now = self.clock()
+        if (host.last_backoff is not None and
+            now - host.last_backoff < self.COOLDOWN):
+            return
+        host.last_backoff = now
+        rate = max(self.MIN_RATE, host.bucket.rate * self.DECREASE)
+        host.bucket.set_rate(rate)
+        host.bucket.drain()
+        host.concurrency = max(1, host.concurrency * self.DECREASE)
+        logger.info("Backing off '%s' to %.2f requests per second.",
+                    urlsplit(url).netloc, rate)
+
+    @staticmethod
+    def _parse_retry_after(retry_after):
+        # Only the delay in seconds is supported, not a HTTP date.
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def get_rate(self, url):
+        """Return the current requests per second for the host of
+        ``url``.
+
+        """
+        return self._get_host(url).bucket.rate
+
+    def report(self):
+        """Return the current state of all hosts.
+
+        :rtype: dict
+        :returns: A dict with ``rate``, ``concurrency``, ``in_flight``
+            and ``latency`` keyed by host.
+
+        """
+        with self._lock:
+            hosts = list(self._hosts.items())
+        return dict((name, {
+            'rate': host.bucket.rate,
+            'concurrency': int(host.concurrency),
+            'in_flight': host.in_flight,
+            'latency': host.latency,
+        }) for name, host in hosts)
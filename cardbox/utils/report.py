@@ -0,0 +1,188 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import copy
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ImportReport:
+    """Summary of one import run.
+
+    Counts the rows inserted, updated and left unchanged per table,
+    the pages downloaded and the time spent fetching, parsing and
+    writing each set.  The phases of the sets are attributed to the
+    set started last with :meth:`start_set`.
+
+    Pages fetched and parsed by several threads or processes at once
+    add up their times, so the phases of a set can take longer than
+    the set itself.  They still show where the time goes.
+
+    """
+    OUTCOMES = ('inserted', 'updated', 'unchanged')
+    PHASES = ('fetch', 'parse', 'write')
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.finished = None
+        self.counts = OrderedDict()
+        self.sets = OrderedDict()
+        self.pages = 0
+        self.current_set = None
+        self._lock = threading.Lock()
+
+    def add(self, table, outcome, count=1):
+        """Count ``count`` rows of ``table`` with the given outcome."""
+        if outcome not in self.OUTCOMES:
+            raise ValueError("Unknown outcome '{0}'.".format(outcome))
+        with self._lock:
+            if table not in self.counts:
+                self.counts[table] = OrderedDict((o, 0)
+                                                 for o in self.OUTCOMES)
+            self.counts[table][outcome] += count
+
+    def start_set(self, setcode):
+        """Attribute the following phases to the set ``setcode``."""
+        self.current_set = setcode
+
+    def add_time(self, phase, seconds, setcode=None):
+        """Add ``seconds`` spent in ``phase`` to a set.
+
+        :param setcode: (optional) Defaults to the current set.
+
+        """
+        if phase not in self.PHASES:
+            raise ValueError("Unknown phase '{0}'.".format(phase))
+        setcode = setcode or self.current_set or ''
+        with self._lock:
+            if setcode not in self.sets:
+                self.sets[setcode] = OrderedDict((p, 0.0)
+                                                 for p in self.PHASES)
+            self.sets[setcode][phase] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, phase, setcode=None):
+        """Add the time spent in the ``with`` block to ``phase``.
+
+        :param setcode: (optional) Defaults to the current set.
+
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_time(phase, self.clock() - start, setcode)
+
+    def add_page(self):
+        with self._lock:
+            self.pages += 1
+
+    def finish(self):
+        """Stop the clock of the run."""
+        self.finished = self.clock()
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else self.clock()
+        return end - self.started
+
+    def get(self, table, outcome):
+        return self.counts.get(table, {}).get(outcome, 0)
+
+    def totals(self):
+        """Return the counts of all tables added up."""
+        return OrderedDict((outcome,
+                            sum(c[outcome] for c in self.counts.values()))
+                           for outcome in self.OUTCOMES)
+
+    def phase_totals(self):
+        """Return the times of all sets added up."""
+        return OrderedDict((phase,
+                            sum(s[phase] for s in self.sets.values()))
+                           for phase in self.PHASES)
+
+    def pages_per_second(self):
+        elapsed = self.elapsed()
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return OrderedDict([
+            ('elapsed', self.elapsed()),
+            ('pages', self.pages),
+            ('pages_per_second', self.pages_per_second()),
+            ('rows', OrderedDict((table, dict(counts))
+                                 for table, counts in self.counts.items())),
+            ('phases', self.phase_totals()),
+            ('sets', OrderedDict((setcode, dict(phases))
+                                 for setcode, phases in self.sets.items())),
+        ])
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def merge(self, report):
+        """Add the counts, times and pages of another report.
+
+        :type report: dict
+        :param report: The other report as returned by
+            :meth:`as_dict`, e.g. from a worker process.
+
+        """
+        for table, counts in report['rows'].items():
+            for outcome, count in counts.items():
+                self.add(table, outcome, count)
+        for setcode, phases in report['sets'].items():
+            for phase, seconds in phases.items():
+                self.add_time(phase, seconds, setcode)
+        with self._lock:
+            self.pages += report['pages']
+
+    def log(self):
+        for table, counts in self.counts.items():
+            logger.info("%s: %d inserted, %d updated, %d unchanged.",
+                        table, counts['inserted'], counts['updated'],
+                        counts['unchanged'])
+        phases = self.phase_totals()
+        logger.info("%d pages in %.1fs (%.1f pages/s); fetch %.1fs, "
+                    "parse %.1fs, write %.1fs.", self.pages, self.elapsed(),
+                    self.pages_per_second(), phases['fetch'],
+                    phases['parse'], phases['write'])
+
+
+def timer(report, phase, setcode=None):
+    """Return :meth:`ImportReport.timer` or a no-op without a report."""
+    if report is None:
+        return contextlib.nullcontext()
+    return report.timer(phase, setcode)
+
+
+def bind_report(parser, report):
+    """Return ``parser`` adding its fetch and parse times to ``report``.
+
+    Parser classes are subclassed and parser instances copied, so
+    other runs using ``parser`` at the same time keep their reports.
+
+    """
+    if isinstance(parser, type):
+        return type(parser.__name__, (parser,), {'REPORT': report})
+    bound = copy.copy(parser)
+    bound.REPORT = report
+    return bound
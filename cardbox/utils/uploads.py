@@ -0,0 +1,311 @@
+# django-cardbox -- A collection manager for Magic: The Gathering
+# Copyright (C) 2016 Benedikt Rascher-Friesenhausen
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import csv
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cardbox.models import (
+    CollectionImport,
+)
+
+from cardbox.utils.db import (
+    LineError,
+    add_collection_entries,
+    parse_collection_entry,
+)
+
+from cardbox.utils.jsonstream import (
+    JSONStream,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of rows written in one transaction.
+CHUNK_SIZE = 2000
+# Number of errors stored with an import.
+MAX_ERRORS = 100
+# Time after which an unfinished import without progress is considered
+# dead, e.g. because the process running its thread was recycled.
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+# Accepted names of the columns (CSV) or keys (JSON) of an entry.
+COLUMNS = {
+    'count': ('count', 'quantity', 'qty'),
+    'foil_count': ('foil_count', 'foil', 'foils'),
+    'number': ('number', 'collector_number'),
+    'set': ('set', 'set_code', 'code'),
+}
+
+
+def _get_column_names(names):
+    """Map the entry fields to the given column names.
+
+    :raises ValueError: If a required column is missing.
+
+    """
+    lower = dict((name.strip().lower(), name) for name in names if name)
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in lower:
+                columns[field] = lower[alias]
+                break
+    missing = [field for field in ('count', 'number', 'set')
+               if field not in columns]
+    if missing:
+        raise ValueError("Missing columns: {0}.".format(', '.join(missing)))
+    return columns
+
+
+def _parse_row(line_number, line, values, columns):
+    """Return a row for `add_collection_entries` or a `LineError`."""
+    foil_count = values.get(columns.get('foil_count'))
+    try:
+        entry = parse_collection_entry(
+            values.get(columns['count']),
+            foil_count if foil_count not in (None, '') else 0,
+            values.get(columns['number']), values.get(columns['set']))
+    except ValueError as e:
+        return LineError(line_number, line, str(e))
+    return line_number, line, entry
+
+
+def iter_csv_rows(fp):
+    """Parse the entries of a CSV file with a header row.
+
+    The columns ``count``, ``number`` and ``set`` are required,
+    ``foil_count`` is optional (see ``COLUMNS`` for other accepted
+    names).
+
+    :param fp: The file opened in binary mode.
+
+    :returns: A generator of rows for :func:`add_collection_entries`
+        and `LineError` tuples for malformed rows.
+
+    """
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        columns = _get_column_names(reader.fieldnames or [])
+        for values in reader:
+            line = ','.join(value for value in values.values()
+                            if isinstance(value, str))
+            yield _parse_row(reader.line_num, line, values, columns)
+    finally:
+        # Don't close ``fp`` with the wrapper.
+        text.detach()
+
+
+def iter_json_rows(fp):
+    """Parse the entries of a JSON file holding an array of objects.
+
+    The objects are decoded one at a time, so the file never has to
+    fit into memory.  See :func:`iter_csv_rows` for the keys and the
+    rows returned; the line numbers are the positions in the array.
+
+    """
+    columns = None
+    for number, item in enumerate(JSONStream(fp).iter_items(), 1):
+        line = json.dumps(item)
+        if not isinstance(item, dict):
+            yield LineError(number, line, "Not an object.")
+            continue
+        if columns is None:
+            columns = _get_column_names(item)
+        yield _parse_row(number, line, item, columns)
+
+
+READERS = {
+    '.csv': iter_csv_rows,
+    '.json': iter_json_rows,
+}
+
+
+def get_reader(filename):
+    """Return the reader for the file ``filename``.
+
+    :raises ValueError: If the format is not supported.
+
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        return READERS[extension]
+    except KeyError:
+        raise ValueError("Only {0} files can be imported."
+                         .format(' and '.join(sorted(READERS))))
+
+
+def _add_errors(job, errors):
+    job.error_count += len(errors)
+    stored = job.errors.count('\n') + bool(job.errors)
+    lines = ['Line {0}: {1}'.format(e.line_number, e.message)
+             for e in errors[:max(0, MAX_ERRORS - stored)]]
+    if lines:
+        job.errors = '\n'.join(([job.errors] if job.errors else []) + lines)
+
+
+def run_collection_import(job, path):
+    """Import the file at ``path`` into the collection of ``job``.
+
+    The rows are written in chunks of ``CHUNK_SIZE``, each in its own
+    transaction, and the progress is saved to ``job`` after every
+    chunk.  The file is deleted afterwards.
+
+    :type job: `cardbox.models.CollectionImport`
+
+    """
+    job.status = CollectionImport.STATUS_RUNNING
+    job.save(update_fields=['status', 'date_updated'])
+    try:
+        reader = get_reader(job.filename)
+        with open(path, 'rb') as fp:
+            rows = reader(fp)
+            while True:
+                chunk = list(itertools.islice(rows, CHUNK_SIZE))
+                if not chunk:
+                    break
+                errors = [row for row in chunk if isinstance(row, LineError)]
+                parsed = [row for row in chunk
+                          if not isinstance(row, LineError)]
+                missing = add_collection_entries(job.collection, parsed)
+                job.rows_done += len(chunk)
+                job.rows_imported += len(parsed) - len(missing)
+                job.bytes_done = fp.tell()
+                _add_errors(job, sorted(errors + missing,
+                                        key=lambda e: e.line_number))
+                job.save(update_fields=['rows_done', 'rows_imported',
+                                        'bytes_done', 'error_count',
+                                        'errors', 'date_updated'])
+        job.status = CollectionImport.STATUS_DONE
+    except Exception as e:
+        logger.exception("Import of '%s' failed.", job)
+        job.status = CollectionImport.STATUS_FAILED
+        _add_errors(job, [LineError(job.rows_done + 1, '', str(e))])
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+    job.date_finished = timezone.now()
+    job.save()
+    logger.info("Imported %s of %s rows of '%s'.", job.rows_imported,
+                job.rows_done, job)
+
+
+def _run_in_thread(job, path):
+    try:
+        run_collection_import(job, path)
+    finally:
+        # The thread has its own database connection.
+        connection.close()
+
+
+def _save_upload(upload):
+    """Copy ``upload`` to a temporary file in chunks.
+
+    :rtype: str
+    :returns: The path of the file.
+
+    """
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(upload.name)[1])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in upload.chunks():
+                f.write(data)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        raise
+    return path
+
+
+def _start_thread(job, upload):
+    try:
+        path = _save_upload(upload)
+    except OSError as e:
+        logger.exception("Saving the upload of '%s' failed.", job)
+        job.status = CollectionImport.STATUS_FAILED
+        _add_errors(job, [LineError(1, '', str(e))])
+        job.date_finished = timezone.now()
+        job.save()
+        return
+    thread = threading.Thread(target=_run_in_thread, args=(job, path),
+                              name='cardbox-import-{0}'.format(job.id),
+                              daemon=True)
+    thread.start()
+
+
+def start_collection_import(collection, user, upload):
+    """Import an uploaded file into ``collection`` in the background.
+
+    Once the import is committed, the upload is copied to a temporary
+    file in chunks, which is then imported by a thread of its own, so
+    the request returns right away.  Nothing is written if the
+    transaction is rolled back.
+
+    :type upload: `django.core.files.uploadedfile.UploadedFile`
+
+    :raises ValueError: If the format of the file is not supported.
+
+    :rtype: `cardbox.models.CollectionImport`
+    :returns: The import to poll the progress of.
+
+    """
+    get_reader(upload.name)
+    job = CollectionImport.objects.create(collection=collection, user=user,
+                                          filename=upload.name,
+                                          size=upload.size)
+    # The thread can only see the import once it is committed.
+    transaction.on_commit(lambda: _start_thread(job, upload))
+    return job
+
+
+def fail_stale_imports(imports):
+    """Mark the unfinished imports without progress as failed.
+
+    The thread of an import dies with the process running it, which
+    would leave the import running forever.  An import counts as dead
+    once it has not been saved for ``STALE_AFTER``.
+
+    :param imports: The imports to check.
+    :type imports: `django.db.models.QuerySet` of
+        `cardbox.models.CollectionImport`
+
+    :rtype: int
+    :returns: The number of imports marked as failed.
+
+    """
+    now = timezone.now()
+    stale = imports.filter(status__in=(CollectionImport.STATUS_PENDING,
+                                       CollectionImport.STATUS_RUNNING),
+                           date_updated__lt=now - STALE_AFTER)
+    count = 0
+    for job in stale:
+        logger.warning("Import of '%s' stopped making progress.", job)
+        job.status = CollectionImport.STATUS_FAILED
+        _add_errors(job, [LineError(job.rows_done + 1, '',
+                                    "The import was interrupted.")])
+        job.date_finished = now
+        job.save()
+        count += 1
+    return count
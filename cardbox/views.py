@@ -20,9 +20,15 @@ from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.db.models import F
 from django.db.utils import IntegrityError
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, get_list_or_404, render
 from django.utils import timezone
+from django.utils.text import slugify
 from django_ajax.decorators import ajax
 from pure_pagination import Paginator, EmptyPage, PageNotAnInteger
 
@@ -32,6 +38,7 @@ from cardbox.models import (
     CardEdition,
     Collection,
     CollectionEntry,
+    CollectionImport,
 )
 
 from cardbox.utils.auth import (
@@ -39,6 +46,15 @@ from cardbox.utils.auth import (
     can_view_collection,
 )
 
+from cardbox.utils.db import (
+    iter_collection_lines,
+)
+
+from cardbox.utils.uploads import (
+    fail_stale_imports,
+    start_collection_import,
+)
+
 from cardbox.utils.filters import (
     filter_cards_by_name,
     filter_cards_by_types,
@@ -239,6 +255,27 @@ def collection(request, collection_id):
     })
 
 
+@login_required
+def export_collection(request, collection_id):
+    """Download a collection as plain text.
+
+    The text is streamed while it is read from the database, so even
+    huge collections don't have to fit into memory.
+
+    """
+    collection = get_object_or_404(Collection, pk=collection_id)
+    if not can_view_collection(request.user, collection):
+        raise PermissionDenied
+
+    lines = (line + '\n' for line in iter_collection_lines(collection))
+    response = StreamingHttpResponse(lines,
+                                     content_type='text/plain; charset=utf-8')
+    filename = '{0}.txt'.format(slugify(collection.name) or 'collection')
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+        filename)
+    return response
+
+
 @login_required
 def edit_collection(request, collection_id=None):
     """Update or create a collection.
@@ -400,6 +437,60 @@ def add_collection_entry(request, collection_id):
                                             args=[collection.id]))
 
 
+@login_required
+def upload_collection(request, collection_id):
+    """Upload a CSV or JSON file to be imported in the background."""
+    collection = get_object_or_404(Collection, pk=collection_id)
+    if not can_edit_collection(request.user, collection):
+        raise PermissionDenied("You don't have permission to edit this collection.")
+
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.add_message(request, messages.WARNING,
+                                 "Please choose a file.")
+        else:
+            try:
+                start_collection_import(collection, request.user, upload)
+            except ValueError as e:
+                messages.add_message(request, messages.WARNING, str(e))
+            else:
+                messages.add_message(request, messages.SUCCESS,
+                                     "Importing '{0}' into '{1}'."
+                                     .format(upload.name, collection))
+                return HttpResponseRedirect(
+                    reverse('cardbox:upload_collection',
+                            args=[collection.id]))
+
+    imports = CollectionImport.objects.filter(collection=collection)
+    fail_stale_imports(imports)
+    imports = imports[:10]
+    return render(request, 'cardbox/upload_collection.html', {
+        'collection': collection,
+        'imports': imports,
+    })
+
+
+@ajax
+@login_required
+def collection_import_status(request, import_id):
+    """Return the progress of a background import."""
+    job = get_object_or_404(CollectionImport, pk=import_id)
+    if not can_view_collection(request.user, job.collection):
+        raise PermissionDenied
+    if fail_stale_imports(CollectionImport.objects.filter(pk=job.pk)):
+        job.refresh_from_db()
+    return {
+        'status': job.get_status_display(),
+        'finished': job.is_finished(),
+        'progress': job.get_progress(),
+        'rows_done': job.rows_done,
+        'rows_imported': job.rows_imported,
+        'error_count': job.error_count,
+        'errors': job.errors,
+    }
+
+
 @ajax
 @login_required
 def update_collection_entries(request, collection_id):
@@ -133,3 +133,17 @@ PAGINATION_SETTINGS = {
     'MARGIN_PAGES_DISPLAYED': 1,
     'SHOW_FIRST_PAGE_WHEN_INVALID': True,
 }
+
+# Cardbox
+# Responses from magiccards.info are cached here and revalidated on
+# later imports.  Set to None to disable the cache.
+CARDBOX_HTTP_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'http')
+# Requests per second to start crawling magiccards.info with.  The
+# rate adapts to the server's responses.  Set to None to disable the
+# rate limit.
+CARDBOX_HTTP_RATE = 10
+# Every page downloaded from magiccards.info is archived here.  Set
+# CARDBOX_HTTP_REPLAY to True to parse the archived pages again
+# without any network access.
+CARDBOX_HTTP_ARCHIVE_DIR = os.path.join(BASE_DIR, 'cache', 'archive')
+CARDBOX_HTTP_REPLAY = False
@@ -0,0 +1,53 @@
+import contextlib
+import functools
+import os
+import pytest
+import threading
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+class _PageHandler(SimpleHTTPRequestHandler):
+    """Serve the recorded magiccards.info pages in ``tests/pages``."""
+    extensions_map = {'.html': 'text/html; charset=utf-8'}
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _serve(handler):
+    """Serve requests with ``handler`` on a local port.
+
+    :returns: The base URL of the server.
+
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://{0}:{1}'.format(*server.server_address)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope='session')
+def serve():
+    """Return a context manager serving a handler class locally.
+
+    Use as ``with serve(Handler) as url: ...``.
+
+    """
+    return _serve
+
+
+@pytest.fixture(scope='session')
+def mci_url():
+    """Base URL of a local stand-in for magiccards.info."""
+    with _serve(functools.partial(_PageHandler,
+                                  directory=PAGES_DIR)) as url:
+        yield url
@@ -0,0 +1,114 @@
+# coding: utf-8
+import os
+import pytest
+
+from cardbox.models import (
+    Card,
+    CardEdition,
+    Set,
+)
+
+from cardbox.utils.archive import (
+    ArchivingClient,
+    PageArchive,
+    ReplayClient,
+)
+
+from cardbox.utils.http import (
+    HTTPClient,
+)
+
+from cardbox.utils.images import (
+    MCIDownloader,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+
+def _objects(path):
+    return [name for _, _, names in os.walk(os.path.join(path, 'objects'))
+            for name in names]
+
+
+class TestPageArchive:
+    def test_put_get(self, tmpdir):
+        archive = PageArchive(str(tmpdir))
+        archive.put('http://a/1.html', 'Æther'.encode('utf-8'), 'utf-8')
+        assert archive.get('http://a/1.html') == ('Æther'.encode('utf-8'),
+                                                  'utf-8')
+        assert 'http://a/1.html' in archive
+        with pytest.raises(KeyError):
+            archive.get('http://a/2.html')
+
+    def test_content_addressed(self, tmpdir):
+        archive = PageArchive(str(tmpdir))
+        digest = archive.put('http://a/1.html', b'same')
+        assert archive.put('http://a/2.html', b'same') == digest
+        assert _objects(str(tmpdir)) == [digest + '.gz']
+
+    def test_reload(self, tmpdir):
+        archive = PageArchive(str(tmpdir))
+        archive.put('http://a/1.html', b'old')
+        archive.put('http://a/1.html', b'old')
+        archive.put('http://a/1.html', b'new')
+        # An unchanged page doesn't add an index line.
+        assert len(tmpdir.join('index.jsonl').readlines()) == 2
+        # The last line of an interrupted run is skipped.
+        with open(str(tmpdir.join('index.jsonl')), 'a') as f:
+            f.write('{"url": "http://a/2.ht')
+
+        archive = PageArchive(str(tmpdir))
+        assert archive.urls() == ['http://a/1.html']
+        assert archive.get('http://a/1.html') == (b'new', None)
+
+
+def test_replay_missing_page(tmpdir):
+    client = ReplayClient(PageArchive(str(tmpdir)))
+    response = client.get('http://a/1.html')
+    assert response.status_code == 404
+    assert response.content == b''
+
+
+def test_replay_missing_image(tmpdir, monkeypatch):
+    monkeypatch.setattr(MCIDownloader, 'CLIENT',
+                        ReplayClient(PageArchive(str(tmpdir.mkdir('pages')))))
+    edition = CardEdition(mtgset=Set(code='ORI'), number=80,
+                          card=Card(name='Tower Geist'))
+    outfile = tmpdir.join('80.jpg')
+    MCIDownloader.get_card_edition_image(edition, str(outfile))
+    assert not outfile.exists()
+
+
+def test_archive_and_replay(mci_url, tmpdir):
+    """A set crawled once can be parsed again offline."""
+    archive = PageArchive(str(tmpdir))
+
+    class Parser(MCIParser):
+        URL = mci_url
+        CLIENT = ArchivingClient(HTTPClient(), archive)
+
+    def parse(parser):
+        return [(e.number, e.number_suffix, c.name, c.types, a.name,
+                 [r.ruling for r in rulings])
+                for e, c, a, rulings in parser.parse_cards_by_set('ori')]
+
+    crawled = parse(Parser)
+    assert len(archive) == 5
+
+    class ReplayParser(MCIParser):
+        URL = mci_url
+        CLIENT = ReplayClient(PageArchive(str(tmpdir)))
+
+    assert parse(ReplayParser) == crawled
+    sitemap = ReplayParser.CLIENT.get(mci_url + '/sitemap.html')
+    assert sitemap.status_code == 404
+
+
+def test_archive_content_types(mci_url, tmpdir):
+    archive = PageArchive(str(tmpdir))
+    client = ArchivingClient(HTTPClient(), archive,
+                             content_types=('image/jpeg',))
+    assert client.get(mci_url + '/sitemap.html').status_code == 200
+    assert len(archive) == 0
@@ -0,0 +1,94 @@
+# coding: utf-8
+import asyncio
+import pytest
+
+from cardbox.models import (
+    Block,
+    Set,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.db import (
+    insert_blocks_sets_cards_from_parser,
+)
+
+from cardbox.utils.asyncparser import (
+    AsyncMCIParser,
+    SyncMCIParser,
+)
+
+
+def _run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+async def _parse_set(url, setcode):
+    async with AsyncMCIParser(url=url) as parser:
+        return [entry async for entry in parser.parse_cards_by_set(setcode)]
+
+
+class TestAsyncMCIParser:
+    def test_parse_blocks_sets(self, mci_url):
+        async def parse():
+            async with AsyncMCIParser(url=mci_url) as parser:
+                return [bs async for bs in parser.parse_blocks_sets()]
+
+        blocksets = _run(parse())
+        assert [b.name for b, _ in blocksets] == [
+            'Magic Origins', 'Return to Ravnica', 'Core Sets', 'Magic Online']
+        block, sets = blocksets[1]
+        assert block.category == Block.CATEGORY_EXPANSION
+        assert [s.code for s in sets] == ['DGM', 'GTC']
+
+    def test_parse_card(self, mci_url):
+        async def parse():
+            async with AsyncMCIParser(url=mci_url) as parser:
+                return await parser.parse_card('ori', '60a')
+
+        card, artist, rulings = _run(parse())
+        assert card.multiverseid == 398434
+        assert card.name == "Jace, Vryn's Prodigy"
+        assert card.types == 'Legendary Creature — Human Wizard'
+        assert card.multi_type == Card.MULTI_FLIP
+        assert artist.name == 'Jaime Jones'
+        assert len(rulings) == 2
+
+    def test_parse_cards_by_set_order(self, mci_url):
+        entries = _run(_parse_set(mci_url, 'ori'))
+        assert [(e.number, e.number_suffix, c.name)
+                for e, c, *_ in entries] == [
+            (60, 'a', "Jace, Vryn's Prodigy"),
+            (60, 'b', 'Jace, Telepath Unbound'),
+            (80, '', 'Tower Geist'),
+            (261, '', 'Swamp'),
+        ]
+        assert entries[0][0].rarity == CardEdition.RARITY_MYTHIC_RARE
+
+    def test_parse_sets(self, mci_url):
+        async def parse():
+            async with AsyncMCIParser(url=mci_url, concurrency=2) as parser:
+                return await parser.parse_sets(['ori', 'dgm', 'gtc'])
+
+        results = _run(parse())
+        assert len(results['ori']) == 4
+        assert [c.name for _, c, *_ in results['dgm']] == [
+            'Alive (Alive/Well)', 'Well (Alive/Well)']
+        assert results['gtc'] == []
+
+
+@pytest.mark.django_db
+class TestSyncMCIParser:
+    def test_insert_blocks_sets_cards(self, mci_url):
+        parser = SyncMCIParser(AsyncMCIParser(url=mci_url))
+        try:
+            insert_blocks_sets_cards_from_parser(parser=parser)
+        finally:
+            parser.close()
+
+        assert Set.objects.count() == 5
+        card_alive = Card.objects.get(name='Alive (Alive/Well)')
+        card_well = Card.objects.get(name='Well (Alive/Well)')
+        assert card_alive.multi_cards.all()[0].id == card_well.id
+        assert card_alive.rulings.count() == 2
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
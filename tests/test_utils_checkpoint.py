@@ -0,0 +1,31 @@
+# coding: utf-8
+import os
+
+from cardbox.utils.checkpoint import (
+    Checkpoint,
+)
+
+
+class TestCheckpoint:
+    def test_empty(self, tmpdir):
+        checkpoint = Checkpoint(str(tmpdir.join('checkpoint.json')))
+        assert not checkpoint.is_set_done('ORI')
+
+    def test_save_load(self, tmpdir):
+        path = str(tmpdir.join('checkpoint.json'))
+        checkpoint = Checkpoint(path)
+        checkpoint.mark_set_done('DGM')
+
+        checkpoint = Checkpoint(path)
+        assert checkpoint.is_set_done('DGM')
+        assert not checkpoint.is_set_done('ORI')
+        assert os.listdir(str(tmpdir)) == ['checkpoint.json']
+
+    def test_clear(self, tmpdir):
+        path = str(tmpdir.join('checkpoint.json'))
+        checkpoint = Checkpoint(path)
+        checkpoint.mark_set_done('DGM')
+        checkpoint.clear()
+        assert not checkpoint.is_set_done('DGM')
+        assert not os.path.exists(path)
+        checkpoint.clear()
@@ -0,0 +1,127 @@
+# coding: utf-8
+import datetime
+import pytest
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cardbox.models import (
+    Artist,
+    Ruling,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.context import (
+    IdentityMap,
+    ImportContext,
+)
+
+from cardbox.utils.db import (
+    insert_artist,
+    insert_ruling,
+    insert_blocks_sets_cards_from_parser,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+
+class TestIdentityMap:
+    def test_lru(self):
+        identity_map = IdentityMap(max_size=2)
+        identity_map.complete = True
+        identity_map.put('a', 1)
+        identity_map.put('b', 2)
+        assert identity_map.get('a') == 1
+        identity_map.put('c', 3)
+        # 'b' was used least recently.
+        assert identity_map.get('b') is None
+        assert identity_map.get('a') == 1
+        assert not identity_map.complete
+        assert identity_map.stats() == {
+            'size': 2, 'hits': 2, 'misses': 1, 'hit_rate': 2/3}
+
+    def test_discard(self):
+        identity_map = IdentityMap(max_size=2)
+        identity_map.complete = True
+        identity_map.put('a', 1)
+        identity_map.discard('a')
+        assert identity_map.get('a') is None
+        assert not identity_map.complete
+
+
+@pytest.mark.django_db
+class TestImportContext:
+    def test_preload(self):
+        Artist.objects.create(name='Jaime Jones')
+        context = ImportContext(preload=True)
+        with CaptureQueriesContext(connection) as queries:
+            artist = insert_artist(Artist(name='Jaime Jones'),
+                                   context=context)
+            # The preloaded map is complete, so new artists don't
+            # need a lookup either.
+            with pytest.raises(Artist.DoesNotExist):
+                context.get('artists', 'Nobody', name='Nobody')
+        assert artist.id is not None
+        assert len(queries) == 0
+        assert context.report()['artists']['hits'] == 1
+        assert context.report()['artists']['misses'] == 1
+
+    def test_fallback(self):
+        Artist.objects.create(name='Jaime Jones')
+        context = ImportContext()
+        assert context.get('artists', 'Jaime Jones',
+                           name='Jaime Jones').name == 'Jaime Jones'
+        with pytest.raises(Artist.DoesNotExist):
+            context.get('artists', 'Nobody', name='Nobody')
+        assert context.get('artists', 'Jaime Jones', name='Jaime Jones')
+        assert context.report()['artists']['hits'] == 1
+
+    def test_rollback_existing(self):
+        """Rows that existed before aren't forgotten by a rollback."""
+        Artist.objects.create(name='Jaime Jones')
+        context = ImportContext(preload=True)
+        savepoint = context.savepoint()
+        context.put('artists', Artist.objects.get(name='Jaime Jones'))
+        context.rollback(savepoint)
+        assert context.get('artists', 'Jaime Jones',
+                           name='Jaime Jones').name == 'Jaime Jones'
+
+    def test_rollback_update(self):
+        """Updates rolled back are written again by a retry."""
+        old, new = datetime.date(2016, 1, 1), datetime.date(2017, 1, 1)
+        insert_ruling(Ruling(ruling='Draw a card.', date=old))
+        context = ImportContext(preload=True)
+        savepoint = context.savepoint()
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                insert_ruling(Ruling(ruling='Draw a card.', date=new),
+                              update=True, context=context)
+                raise RuntimeError('Connection lost.')
+        context.rollback(savepoint)
+        assert Ruling.objects.get().date == old
+
+        insert_ruling(Ruling(ruling='Draw a card.', date=new),
+                      update=True, context=context)
+        assert Ruling.objects.get().date == new
+        assert context.import_report.get('Ruling', 'updated') == 2
+
+    @pytest.mark.parametrize('max_size', [1, 3, None])
+    def test_import(self, mci_url, max_size):
+        """The import is the same no matter how much is cached."""
+        class Parser(MCIParser):
+            URL = mci_url
+
+        context = ImportContext(max_size=max_size, preload=True)
+        insert_blocks_sets_cards_from_parser(Parser, context=context)
+        insert_blocks_sets_cards_from_parser(Parser, context=context)
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        alive = Card.objects.get(name='Alive (Alive/Well)')
+        assert alive.multi_cards.count() == 1
+        report = context.report()
+        assert report['cards']['size'] <= context.max_size
+        if max_size is None:
+            # Every card of the second run is known.
+            assert report['cards']['hits'] >= 6
@@ -1,6 +1,11 @@
 import datetime
+import json
 import pytest
 
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from cardbox.models import (
     Artist,
     Ruling,
@@ -8,6 +13,8 @@ from cardbox.models import (
     Set,
     Card,
     CardEdition,
+    Collection,
+    CollectionEntry,
 )
 
 from cardbox.utils.db import (
@@ -20,6 +27,37 @@ from cardbox.utils.db import (
     insert_blocks_sets_from_parser,
     insert_cards_by_set_from_parser,
     insert_cards_from_parser,
+    insert_blocks_sets_cards_from_parser,
+    sync_cards_from_parser,
+    backfill_ruling_digests,
+    get_import_digest,
+    CARD_UPDATE_FIELDS,
+    bulk_insert_cards_by_set_from_parser,
+    copy_insert_cards_by_set_from_parser,
+    import_collection_from_text,
+    bulk_import_collection_from_text,
+    export_collection_as_text,
+    iter_collection_lines,
+)
+
+from cardbox.utils.checkpoint import (
+    Checkpoint,
+)
+
+from cardbox.utils.context import (
+    ImportContext,
+)
+
+from cardbox.utils.http import (
+    HTTPClient,
+)
+
+from cardbox.utils.report import (
+    ImportReport,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
 )
 
 
@@ -206,6 +244,30 @@ class TestInsertRuling:
         assert r.date == new_ruling.date
         assert r.ruling == ruling.ruling
 
+    def test_long_ruling(self):
+        """Test that long rulings are looked up by their digest."""
+        text = 'A very long ruling. ' * 1000
+        ruling = insert_ruling(Ruling(ruling=text,
+                                      date=datetime.date(1, 1, 1)))
+        assert ruling.digest == Ruling.get_digest(text)
+        assert len(ruling.digest) == 64
+        with CaptureQueriesContext(connection) as queries:
+            r = insert_ruling(Ruling(ruling=text,
+                                     date=datetime.date(1, 1, 1)))
+        assert r.id == ruling.id
+        assert text not in queries[0]['sql']
+
+    def test_backfill(self):
+        for ruling in self.rulings:
+            Ruling(ruling=ruling.ruling, date=ruling.date).save()
+        Ruling.objects.update(digest=None)
+        assert backfill_ruling_digests() == 3
+        assert backfill_ruling_digests() == 0
+        r = insert_ruling(Ruling(ruling='You win!',
+                                 date=datetime.date(1, 1, 1)))
+        assert r.date == datetime.date(1999, 5, 27)
+        assert Ruling.objects.count() == 3
+
 
 @pytest.mark.django_db
 class TestInsertBlock:
@@ -494,6 +556,83 @@ class TestInsertCardsBySetFromParser:
         card_doomgape = Card.objects.get(name='Doomgape')
         assert card_doomgape.mana_special == '{B/G}{B/G}{B/G}'
 
+    def test_skip_bad_card(self):
+        """Test that a card the database refuses doesn't abort the set."""
+        class Parser(MockParser):
+            def parse_cards_by_set(setcode):
+                for number, name, types in [(1, 'Good card', 'Instant'),
+                                            # Cards need types.
+                                            (2, 'Broken card', None),
+                                            (3, 'Other card', 'Instant')]:
+                    yield (CardEdition(number=number, number_suffix='',
+                                       rarity=CardEdition.RARITY_COMMON),
+                           Card(name=name, types=types),
+                           Artist(name=name + ' Artist'),
+                           [Ruling(ruling=name + ' rules!',
+                                   date=datetime.date(1, 1, 1))])
+
+        insert_blocks_sets_from_parser(parser=MockParser)
+        set_ = Set.objects.get(code='FBS')
+        assert insert_cards_by_set_from_parser(set_, parser=Parser) == 3
+
+        assert CardEdition.objects.filter(mtgset=set_).count() == 2
+        assert not Card.objects.filter(name='Broken card').exists()
+        assert not Ruling.objects.filter(ruling='Broken card rules!').exists()
+        assert Card.objects.get(name='Other card').rulings.count() == 1
+
+    def test_rollback_set(self):
+        """Test that a failing set is rolled back completely."""
+        class Parser(MockParser):
+            def parse_cards_by_set(setcode):
+                yield from MockParser.setentries['SMS'][:3]
+                raise RuntimeError('Connection lost.')
+
+        insert_blocks_sets_from_parser(parser=MockParser)
+        set_ = Set.objects.get(code='SMS')
+        context = ImportContext()
+        with pytest.raises(RuntimeError):
+            insert_cards_by_set_from_parser(set_, parser=Parser,
+                                            context=context)
+
+        assert CardEdition.objects.filter(mtgset=set_).count() == 0
+        assert Card.objects.count() == 0
+        assert Ruling.objects.count() == 0
+        # The context doesn't remember the rolled back rows either.
+        insert_cards_by_set_from_parser(set_, parser=MockParser,
+                                        context=context)
+        assert CardEdition.objects.filter(mtgset=set_).count() == 5
+
+    @pytest.mark.parametrize('insert_by_set', [
+        insert_cards_by_set_from_parser,
+        bulk_insert_cards_by_set_from_parser,
+    ])
+    def test_ruling_without_digest(self, insert_by_set):
+        """Rulings saved before their digest existed are reused."""
+        insert_blocks_sets_from_parser(parser=MockParser)
+        set_ = Set.objects.get(code='SMS')
+        insert_by_set(set_, parser=MockParser)
+        Ruling.objects.update(digest=None)
+
+        insert_by_set(set_, parser=MockParser)
+        assert Ruling.objects.count() == 2
+        assert not Ruling.objects.filter(digest__isnull=True).exists()
+
+    def test_parse_before_transaction(self):
+        """Test that no transaction is open while the cards are parsed."""
+        depths = []
+
+        class Parser(MockParser):
+            def parse_cards_by_set(setcode):
+                for entry in MockParser.setentries[setcode]:
+                    depths.append(len(connection.savepoint_ids))
+                    yield entry
+
+        insert_blocks_sets_from_parser(parser=MockParser)
+        set_ = Set.objects.get(code='SMS')
+        depth = len(connection.savepoint_ids)
+        insert_cards_by_set_from_parser(set_, parser=Parser)
+        assert depths == [depth] * 5
+
 
 @pytest.mark.django_db
 class TestInsertCardsFromParser:
@@ -511,3 +650,450 @@ class TestInsertCardsFromParser:
 
         assert len(card_ice.editions.all()) == 1
         assert len(card_mult.editions.all()) == 3
+
+
+@pytest.mark.django_db
+class TestImportDigest:
+    """Tests for skipping unchanged rows by their import digest."""
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        return Parser
+
+    def test_digest(self):
+        card = Card(name='Some card', types='Instant', cmc=2)
+        digest = get_import_digest(card, CARD_UPDATE_FIELDS)
+        assert len(digest) == 40
+        assert digest == get_import_digest(
+            Card(name='Some card', types='Instant', cmc=2),
+            CARD_UPDATE_FIELDS)
+        card.cmc = 3
+        assert digest != get_import_digest(card, CARD_UPDATE_FIELDS)
+
+    def test_reimport(self, parser):
+        context = ImportContext()
+        insert_blocks_sets_cards_from_parser(parser, context=context)
+        assert context.import_report.get('Card', 'inserted') == 6
+        assert Card.objects.filter(import_digest='').count() == 0
+
+        context = ImportContext()
+        with CaptureQueriesContext(connection) as queries:
+            insert_blocks_sets_cards_from_parser(parser, update=True,
+                                                 context=context)
+        assert not [q for q in queries if q['sql'].startswith('UPDATE')]
+        report = context.import_report
+        assert report.get('Card', 'unchanged') == 6
+        assert report.get('CardEdition', 'unchanged') == 6
+        assert report.totals()['updated'] == 0
+
+    def test_changed(self, parser):
+        insert_blocks_sets_cards_from_parser(parser)
+        Card.objects.filter(name='Tower Geist').update(
+            types='Changed', import_digest='outdated')
+
+        context = ImportContext()
+        insert_blocks_sets_cards_from_parser(parser, update=True,
+                                             context=context)
+        assert Card.objects.get(name='Tower Geist').types == (
+            'Creature — Spirit')
+        assert context.import_report.get('Card', 'updated') == 1
+        assert context.import_report.get('Card', 'unchanged') == 5
+
+
+@pytest.mark.django_db
+class TestImportReport:
+    """Tests for the report returned by an import run."""
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+            CLIENT = CountingClient()
+        return Parser
+
+    @pytest.mark.parametrize('bulk', [False, True])
+    def test_report(self, parser, bulk):
+        report = insert_blocks_sets_cards_from_parser(parser, bulk=bulk)
+        assert report.pages == len(parser.CLIENT.urls)
+        assert report.get('Card', 'inserted') == 6
+        assert set(report.sets) >= {'ORI', 'DGM'}
+        for phase in ImportReport.PHASES:
+            assert report.sets['ORI'][phase] > 0
+        data = json.loads(report.to_json())
+        assert data['rows']['CardEdition']['inserted'] == 6
+        assert data['pages'] == report.pages
+        assert parser.REPORT is None
+
+
+@pytest.mark.django_db
+class TestLinkCards:
+    """Tests for writing the links to rulings and multi card parts in
+    bulk.
+
+    """
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        return Parser
+
+    def test_one_insert_per_table(self, parser):
+        insert_blocks_sets_from_parser(parser)
+        set_ = Set.objects.get(code='ORI')
+        with CaptureQueriesContext(connection) as queries:
+            insert_cards_by_set_from_parser(set_, parser)
+        tables = [Card.rulings.through._meta.db_table,
+                  Card.multi_cards.through._meta.db_table]
+        inserts = [q['sql'] for q in queries
+                   if q['sql'].startswith('INSERT') and
+                   any('"{0}"'.format(t) in q['sql'] for t in tables)]
+        assert len(inserts) == 2
+        jace = Card.objects.get(name="Jace, Vryn's Prodigy")
+        assert jace.multi_cards.count() == 1
+        assert jace.rulings.count() > 1
+
+    @pytest.mark.parametrize('bulk', [False, True])
+    @pytest.mark.parametrize('prune', [False, True])
+    def test_prune(self, parser, bulk, prune):
+        insert_blocks_sets_cards_from_parser(parser, bulk=bulk)
+        geist = Card.objects.get(name='Tower Geist')
+        swamp = Card.objects.get(name='Swamp')
+        geist.rulings.add(Ruling.objects.create(
+            ruling='Gone from the source.', date=datetime.date(1, 1, 1)))
+        geist.multi_cards.add(swamp)
+        rulings = Card.rulings.through.objects.count()
+
+        insert_blocks_sets_cards_from_parser(parser, bulk=bulk, prune=prune)
+        assert (geist.rulings.filter(ruling='Gone from the source.')
+                .exists()) != prune
+        assert geist.multi_cards.exists() != prune
+        assert swamp.multi_cards.exists() != prune
+        expected = rulings - 1 if prune else rulings
+        assert Card.rulings.through.objects.count() == expected
+
+
+@pytest.mark.django_db
+class TestParallelImport:
+    """Tests for importing sets in several processes."""
+    def test_lost_race(self):
+        """A row created by another process after the lookup is used
+        instead of failing on the unique index.
+
+        """
+        context = ImportContext(preload=True)
+        card = Card.objects.create(name='Raced card', types='Instant')
+        c = insert_card(Card(name='Raced card', types='Instant'),
+                        context=context)
+        assert c.id == card.id
+        assert context.import_report.get('Card', 'inserted') == 0
+
+    def test_in_transaction(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+
+        with pytest.raises(RuntimeError):
+            insert_cards_from_parser(Parser, workers=2)
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.skipif(connection.vendor == 'sqlite',
+                        reason='The workers need a database server')
+    @pytest.mark.parametrize('bulk', [False, True])
+    def test_same_as_serial(self, mci_url, bulk):
+        class Parser(MCIParser):
+            URL = mci_url
+
+        insert_blocks_sets_cards_from_parser(Parser)
+        expected = _snapshot()
+        for model in [Card, CardEdition, Artist, Ruling]:
+            model.objects.all().delete()
+
+        insert_blocks_sets_cards_from_parser(Parser, bulk=bulk, workers=4)
+        assert _snapshot() == expected
+
+
+class CountingClient(HTTPClient):
+    """HTTP client remembering all requested URLs."""
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return super().get(url)
+
+    def card_pages(self):
+        return sorted(url.rsplit('/', 1)[1] for url in self.urls
+                      if '/en/' in url)
+
+
+@pytest.mark.django_db
+class TestSyncCardsFromParser:
+    """All tests for :func:`cardbox.utils.db.sync_cards_from_parser`."""
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+            CLIENT = CountingClient()
+        return Parser
+
+    def test_empty_database(self, parser):
+        assert sync_cards_from_parser(parser) == 6
+        assert parser.CLIENT.card_pages() == [
+            '121a.html', '121b.html', '261.html', '60a.html', '60b.html',
+            '80.html']
+        alive = Card.objects.get(name='Alive (Alive/Well)')
+        assert alive.multi_cards.count() == 1
+
+    def test_complete_sets(self, parser):
+        sync_cards_from_parser(parser)
+        parser.CLIENT.urls = []
+        assert sync_cards_from_parser(parser) == 0
+        assert parser.CLIENT.card_pages() == []
+
+    def test_missing_editions(self, parser):
+        """Missing multi cards are parsed with all their parts."""
+        sync_cards_from_parser(parser)
+        CardEdition.objects.filter(mtgset__code='ORI',
+                                   number__in=[60, 80],
+                                   number_suffix__in=['', 'b']).delete()
+        parser.CLIENT.urls = []
+        assert sync_cards_from_parser(parser) == 3
+        assert parser.CLIENT.card_pages() == [
+            '60a.html', '60b.html', '80.html']
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        jace = Card.objects.get(name="Jace, Vryn's Prodigy")
+        assert jace.multi_cards.count() == 1
+
+    def test_stale_sets(self, parser):
+        sync_cards_from_parser(parser)
+        # Rows without a digest were imported before digests existed.
+        Card.objects.filter(name='Well (Alive/Well)').update(
+            types='', import_digest='')
+        parser.CLIENT.urls = []
+        assert sync_cards_from_parser(parser, stale=['dgm']) == 2
+        assert parser.CLIENT.card_pages() == ['121a.html', '121b.html']
+        assert Card.objects.get(name='Well (Alive/Well)').types == 'Sorcery'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestResumeFromCheckpoint:
+    """Tests for resuming an import with a
+    :class:`cardbox.utils.checkpoint.Checkpoint`.
+
+    """
+    def test_resume(self, mci_url, tmpdir):
+        class Parser(MCIParser):
+            URL = mci_url
+            CLIENT = CountingClient()
+            fail = True
+
+            @classmethod
+            def parse_card(cls, setcode, number):
+                if cls.fail and setcode == 'dgm' and number == '121b':
+                    raise RuntimeError('Connection lost.')
+                return super().parse_card(setcode, number)
+
+        path = str(tmpdir.join('checkpoint.json'))
+        with pytest.raises(RuntimeError):
+            insert_blocks_sets_cards_from_parser(Parser,
+                                                 checkpoint=Checkpoint(path))
+        # The failed set was rolled back as a whole.
+        assert Checkpoint(path).is_set_done('ORI')
+        assert not Checkpoint(path).is_set_done('DGM')
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        assert CardEdition.objects.filter(mtgset__code='DGM').count() == 0
+
+        Parser.fail = False
+        Parser.CLIENT.urls = []
+        insert_blocks_sets_cards_from_parser(Parser,
+                                             checkpoint=Checkpoint(path))
+        assert Parser.CLIENT.card_pages() == ['121a.html', '121b.html']
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        assert CardEdition.objects.filter(mtgset__code='DGM').count() == 2
+        assert not tmpdir.join('checkpoint.json').exists()
+
+
+def _snapshot():
+    """Return the imported catalog in a comparable form."""
+    cards = set(Card.objects.values_list(
+        'name', 'types', 'rules', 'mana_n', 'mana_u', 'mana_special',
+        'power', 'toughness', 'loyalty', 'multi_type', 'legal_vintage'))
+    editions = set(CardEdition.objects.values_list(
+        'mtgset__code', 'number', 'number_suffix', 'rarity', 'card__name',
+        'artist__name'))
+    rulings = set(Card.rulings.through.objects.values_list(
+        'card__name', 'ruling__ruling', 'ruling__date'))
+    multi = set(Card.multi_cards.through.objects.values_list(
+        'from_card__name', 'to_card__name'))
+    sets = set(Set.objects.values_list('code', 'name', 'block__name'))
+    return cards, editions, rulings, multi, sets
+
+
+@pytest.mark.django_db
+class TestBulkInsert:
+    """All tests for :func:`cardbox.utils.db.bulk_insert_cards` and the
+    ``bulk`` import mode.
+
+    """
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        return Parser
+
+    def test_same_as_insert(self, parser):
+        insert_blocks_sets_cards_from_parser(parser)
+        expected = _snapshot()
+        for model in [Card, CardEdition, Artist, Ruling, Set, Block]:
+            model.objects.all().delete()
+
+        insert_blocks_sets_cards_from_parser(parser, bulk=True)
+        assert _snapshot() == expected
+        assert len(expected[3]) == 4
+
+    def test_query_count(self, parser):
+        insert_blocks_sets_cards_from_parser(parser, bulk=True)
+        CardEdition.objects.all().delete()
+        set_ = Set.objects.get(code='ORI')
+        with CaptureQueriesContext(connection) as queries:
+            bulk_insert_cards_by_set_from_parser(set_, parser)
+        # Independent of the number of cards in the set.
+        assert len(queries) <= 15
+
+    def test_rerun(self, parser):
+        insert_blocks_sets_cards_from_parser(parser, bulk=True)
+        expected = _snapshot()
+        insert_blocks_sets_cards_from_parser(parser, bulk=True)
+        assert _snapshot() == expected
+
+    @pytest.mark.parametrize('update', [False, True])
+    def test_update(self, parser, update):
+        insert_blocks_sets_cards_from_parser(parser, bulk=True)
+        Card.objects.filter(name='Tower Geist').update(types='Changed')
+        CardEdition.objects.filter(card__name='Tower Geist').update(
+            rarity=CardEdition.RARITY_SPECIAL)
+        Set.objects.filter(code='DGM').update(name='Changed')
+
+        insert_blocks_sets_cards_from_parser(parser, update=update,
+                                             bulk=True)
+        card = Card.objects.get(name='Tower Geist')
+        edition = card.editions.get()
+        set_ = Set.objects.get(code='DGM')
+        if update:
+            assert card.types == 'Creature — Spirit'
+            assert edition.rarity == CardEdition.RARITY_UNCOMMON
+            assert set_.name == "Dragon's Maze"
+        else:
+            assert card.types == 'Changed'
+            assert edition.rarity == CardEdition.RARITY_SPECIAL
+            assert set_.name == 'Changed'
+
+
+@pytest.mark.django_db
+class TestCopyInsert:
+    """All tests for :func:`cardbox.utils.db.copy_insert_cards` and the
+    ``copy`` import mode.
+
+    """
+    @pytest.fixture
+    def parser(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        return Parser
+
+    def test_same_as_insert(self, parser):
+        insert_blocks_sets_cards_from_parser(parser)
+        expected = _snapshot()
+        for model in [Card, CardEdition, Artist, Ruling, Set, Block]:
+            model.objects.all().delete()
+
+        insert_blocks_sets_cards_from_parser(parser, copy=True)
+        assert _snapshot() == expected
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql',
+                        reason='COPY needs PostgreSQL')
+    def test_query_count(self, parser):
+        insert_blocks_sets_cards_from_parser(parser, copy=True)
+        CardEdition.objects.all().delete()
+        set_ = Set.objects.get(code='ORI')
+        with CaptureQueriesContext(connection) as queries:
+            copy_insert_cards_by_set_from_parser(set_, parser)
+        # Independent of the number of cards in the set.
+        assert len(queries) <= 25
+
+    def test_rerun(self, parser):
+        insert_blocks_sets_cards_from_parser(parser, copy=True)
+        expected = _snapshot()
+        insert_blocks_sets_cards_from_parser(parser, copy=True)
+        assert _snapshot() == expected
+
+    @pytest.mark.parametrize('update', [False, True])
+    def test_update(self, parser, update):
+        insert_blocks_sets_cards_from_parser(parser, copy=True)
+        Card.objects.filter(name='Tower Geist').update(types='Changed')
+        CardEdition.objects.filter(card__name='Tower Geist').update(
+            rarity=CardEdition.RARITY_SPECIAL)
+
+        insert_blocks_sets_cards_from_parser(parser, update=update,
+                                             copy=True)
+        card = Card.objects.get(name='Tower Geist')
+        edition = card.editions.get()
+        if update:
+            assert card.types == 'Creature — Spirit'
+            assert edition.rarity == CardEdition.RARITY_UNCOMMON
+        else:
+            assert card.types == 'Changed'
+            assert edition.rarity == CardEdition.RARITY_SPECIAL
+
+
+@pytest.mark.django_db
+class TestCollectionImport:
+    """Tests for importing a collection from text."""
+    @pytest.fixture
+    def collection(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        insert_blocks_sets_cards_from_parser(Parser)
+        owner = User.objects.create(username='owner')
+        return Collection.objects.create(name='Binder', owner=owner,
+                                         date_created=datetime.date.today())
+
+    def test_import(self, collection):
+        text = '2 1 60a ori\n\n1 0 80 ORI\n1 2 60a ORI\n'
+        with CaptureQueriesContext(connection) as queries:
+            assert bulk_import_collection_from_text(collection, text) == []
+        # Independent of the number of lines.
+        assert len(queries) <= 6
+        entry = CollectionEntry.objects.get(collection=collection,
+                                            edition__number=60,
+                                            edition__number_suffix='a')
+        assert (entry.count, entry.foil_count) == (3, 3)
+
+        bulk_import_collection_from_text(collection, '1 1 60a ORI')
+        entry.refresh_from_db()
+        assert (entry.count, entry.foil_count) == (4, 4)
+        assert CollectionEntry.objects.count() == 2
+
+    def test_errors(self, collection):
+        text = '\n'.join(['1 0 80 ORI', '1 0 80', 'x 0 80 ORI',
+                           '1 -1 80 ORI', '1 0 999 ORI', '1 0 1 XXX',
+                           '1 0 6x0 ORI'])
+        errors = bulk_import_collection_from_text(collection, text)
+        assert [e.line_number for e in errors] == [2, 3, 4, 5, 6, 7]
+        assert errors[3].line == '1 0 999 ORI'
+        assert 'ORI' in errors[3].message
+        assert CollectionEntry.objects.get().count == 1
+
+    def test_all_or_nothing(self, collection):
+        with pytest.raises(ValueError):
+            import_collection_from_text(collection, '1 0 80 ORI\n1 0 1 XXX')
+        assert not CollectionEntry.objects.exists()
+
+    def test_export(self, collection):
+        text = '2 1 60a ORI\n1 0 80 ORI\n0 1 121b DGM'
+        import_collection_from_text(collection, text)
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(iter_collection_lines(collection, chunk_size=1))
+        assert len(queries) == 1
+        assert lines == ['0 1 121b DGM', '2 1 60a ORI', '1 0 80 ORI']
+        assert export_collection_as_text(collection) == '\n'.join(lines)
@@ -0,0 +1,31 @@
+# coding: utf-8
+import pytest
+
+from django.db.models import Q
+
+from cardbox.utils.filters import (
+    _tokenise_filter_string,
+    _build_q_expr,
+    _q_builder_default,
+)
+
+
+@pytest.mark.parametrize("fstr,q_e", [
+    # The rest of the string is ignored after the first invalid part.
+    ('Sphinx (Pro', Q(name__icontains='Sphinx')),
+    # Quotes are word characters, the longest token wins.
+    ("'Sphinx's", Q(name__icontains="'Sphinx's")),
+    (r"r'^Sph.*x$' | ~'x\'y'", Q(name__regex='^Sph.*x$') | ~Q(name__contains="x'y")),
+    ('(~(Sphinx) | ("Pro"))', ~Q(name__icontains='Sphinx') | Q(name__contains='Pro')),
+    ('(', None),
+    ('<>Sphinx', None),
+    ('  ', None),
+])
+def test__tokenise_filter_string(fstr, q_e):
+    ftokens, error = _tokenise_filter_string(fstr)
+    if q_e is None:
+        assert error == 'has-error'
+        return
+    assert error is None
+    q = _build_q_expr(ftokens, 'name', _q_builder_default)
+    assert str(q) == str(q_e)
@@ -24,8 +24,14 @@ from cardbox.utils.filters import (
     _q_builder_choice,
     _q_builder_ptl,
     filter_cards_by_mana,
+    filter_cards_by_name,
+    filter_cards_by_rarity,
+    filter_cache_info,
+    clear_filter_cache,
 )
 
+from cardbox.utils import filters
+
 
 class MockParser:
     blocks = [
@@ -151,6 +157,32 @@ def test__guess_cmc(mana, cmc):
     assert _guess_cmc(n, w, u , b, r, g, c, tokens) == cmc
 
 
+@pytest.mark.django_db
+def test_filter_cache(monkeypatch):
+    calls = []
+    tokenise = filters._tokenise_filter_string
+
+    def counting_tokenise(fstr):
+        calls.append(fstr)
+        return tokenise(fstr)
+
+    monkeypatch.setattr(filters, '_tokenise_filter_string',
+                        counting_tokenise)
+    clear_filter_cache()
+    queryset = Card.objects.all()
+    first, error = filter_cards_by_name(queryset, 'Sphinx | ~Pro')
+    assert error is None
+    second, error = filter_cards_by_name(queryset, 'Sphinx | ~Pro')
+    assert str(first.query) == str(second.query)
+    assert filter_cards_by_name(queryset, '(Sphinx')[1] == 'has-error'
+    assert filter_cards_by_name(queryset, '(Sphinx')[1] == 'has-error'
+    assert filter_cards_by_rarity(queryset, "'M'")[1] == 'has-warning'
+    assert filter_cards_by_rarity(queryset, "'M'")[1] == 'has-warning'
+    assert calls == ['Sphinx | ~Pro', '(Sphinx', "'M'"]
+    info = filter_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (3, 3, 3)
+
+
 # @pytest.mark.django_db
 # @pytest.mark.parametrize("mana,op,count", [
 #     ('1UB', '>=', 2),
@@ -0,0 +1,131 @@
+# coding: utf-8
+import pytest
+import requests
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+
+from cardbox.utils.http import (
+    HTTPClient,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = Counter()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        _Handler.hits[self.path] += 1
+        if self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self._send(304)
+            else:
+                self._send(200, 'Cached page'.encode('utf-8'),
+                           [('ETag', '"v1"'),
+                            ('Content-Type', 'text/html; charset=utf-8')])
+        elif self.path == '/nocache':
+            self._send(200, b'Fresh page')
+        elif self.path == '/flaky':
+            if _Handler.hits[self.path] < 3:
+                self._send(503)
+            else:
+                self._send(200, b'Finally')
+        elif self.path == '/slow':
+            time.sleep(1)
+            try:
+                self._send(200, b'Too late')
+            except (BrokenPipeError, ConnectionResetError):
+                # The client has given up already.
+                pass
+        else:
+            self._send(404)
+
+
+@pytest.fixture(scope='module')
+def server_url(serve):
+    with serve(_Handler) as url:
+        yield url
+
+
+@pytest.fixture(autouse=True)
+def reset_hits():
+    _Handler.hits.clear()
+
+
+class TestHTTPClient:
+    def test_cache_revalidation(self, server_url, tmpdir):
+        client = HTTPClient(cache_dir=str(tmpdir))
+        first = client.get(server_url + '/etag')
+        assert first.status_code == 200
+        assert not first.from_cache
+
+        # A new client only has the cache on disk in common.
+        second = HTTPClient(cache_dir=str(tmpdir)).get(server_url + '/etag')
+        assert second.status_code == 200
+        assert second.from_cache
+        assert second.text == 'Cached page'
+        assert _Handler.hits['/etag'] == 2
+
+    def test_no_validator_not_cached(self, server_url, tmpdir):
+        client = HTTPClient(cache_dir=str(tmpdir))
+        client.get(server_url + '/nocache')
+        response = client.get(server_url + '/nocache')
+        assert not response.from_cache
+        assert tmpdir.listdir() == []
+
+    def test_without_cache(self, server_url):
+        client = HTTPClient()
+        client.get(server_url + '/etag')
+        response = client.get(server_url + '/etag')
+        assert not response.from_cache
+        assert response.text == 'Cached page'
+
+    def test_retry(self, server_url):
+        client = HTTPClient(retries=3, backoff=0)
+        response = client.get(server_url + '/flaky')
+        assert response.status_code == 200
+        assert response.text == 'Finally'
+        assert _Handler.hits['/flaky'] == 3
+
+    def test_retries_exhausted(self, server_url):
+        client = HTTPClient(retries=1, backoff=0)
+        response = client.get(server_url + '/flaky')
+        assert response.status_code == 503
+
+    def test_no_retry_on_404(self, server_url):
+        client = HTTPClient(retries=3, backoff=0)
+        response = client.get(server_url + '/missing')
+        assert response.status_code == 404
+        assert _Handler.hits['/missing'] == 1
+
+    def test_timeout(self, server_url):
+        client = HTTPClient(timeout=0.2, retries=0)
+        with pytest.raises(requests.exceptions.RequestException):
+            client.get(server_url + '/slow')
+
+
+def test_mci_parser_revalidates(mci_url, tmpdir):
+    """Parsing a page a second time only costs a 304."""
+    class Parser(MCIParser):
+        URL = mci_url
+        CLIENT = HTTPClient(cache_dir=str(tmpdir))
+
+    card, *_ = Parser.parse_card('ori', '60a')
+    cached, *_ = Parser.parse_card('ori', '60a')
+    assert cached.name == card.name == "Jace, Vryn's Prodigy"
+    assert Parser.CLIENT.get(Parser._card_url('ori', '60a')).from_cache
@@ -0,0 +1,30 @@
+# coding: utf-8
+import io
+import pytest
+
+from cardbox.utils.jsonstream import (
+    JSONStream,
+)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64, 1 << 16])
+def test_json_stream(chunk_size):
+    data = '{"a": [1, 2], "ü": {"b": "Æther"}, "c": {}}'.encode('utf-8')
+    stream = JSONStream(io.BytesIO(data), chunk_size=chunk_size)
+    items = []
+    offsets = {}
+    for key in stream.iter_keys():
+        offsets[key] = stream.tell()
+        items.append((key, stream.read_value()))
+    assert items == [('a', [1, 2]), ('ü', {'b': 'Æther'}), ('c', {})]
+    # The offsets point to the values in the encoded file.
+    stream = JSONStream(io.BytesIO(data), offset=offsets['ü'],
+                         chunk_size=chunk_size)
+    assert stream.read_value() == {'b': 'Æther'}
+
+
+def test_json_stream_invalid():
+    stream = JSONStream(io.BytesIO(b'{"a": 1 "b": 2}'))
+    with pytest.raises(ValueError):
+        for key in stream.iter_keys():
+            stream.read_value()
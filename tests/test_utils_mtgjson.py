@@ -0,0 +1,204 @@
+# coding: utf-8
+import datetime
+import gzip
+import json
+import pytest
+
+from cardbox.models import (
+    Block,
+    Set,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.db import (
+    insert_blocks_sets_cards_from_parser,
+)
+
+from cardbox.utils.mtgjson import (
+    MTGJSONParser,
+)
+
+
+def _card(name, number, **kwargs):
+    card = {
+        'name': name,
+        'number': number,
+        'artist': 'Some Artist',
+        'type': 'Creature — Human',
+        'rarity': 'common',
+        'layout': 'normal',
+        'manaCost': '{1}{W}',
+        'manaValue': 2.0,
+        'legalities': {'vintage': 'Legal', 'modern': 'Banned'},
+        'rulings': [],
+        'identifiers': {},
+    }
+    card.update(kwargs)
+    return card
+
+
+DUMP = {
+    'meta': {'date': '2016-07-01', 'version': '5.0.0'},
+    'data': {
+        'ORI': {
+            'name': 'Magic Origins',
+            'code': 'ORI',
+            'type': 'core',
+            'releaseDate': '2015-07-17',
+            'cards': [
+                _card('Tower Geist', '80', manaCost='{3}{U}', manaValue=4,
+                      identifiers={'multiverseId': '398441'},
+                      text='Flying\nWhen Tower Geist enters the '
+                           'battlefield, draw a card.'),
+                _card("Jace, Vryn's Prodigy // Jace, Telepath Unbound", '60',
+                      side='a', layout='transform',
+                      faceName="Jace, Vryn's Prodigy",
+                      type='Legendary Creature — Human Wizard',
+                      rarity='mythic', power='0', toughness='2',
+                      rulings=[{'date': '2015-06-22',
+                                'text': 'Jace transforms.'}]),
+                _card("Jace, Vryn's Prodigy // Jace, Telepath Unbound", '60',
+                      side='b', layout='transform',
+                      faceName='Jace, Telepath Unbound', manaCost='',
+                      type='Legendary Planeswalker — Jace',
+                      rarity='mythic', loyalty='5'),
+                _card('Swamp', '261', type='Basic Land — Swamp',
+                      manaCost=''),
+                _card('Promo Swamp', 'S1', type='Basic Land — Swamp'),
+            ],
+        },
+        'DGM': {
+            'name': "Dragon's Maze",
+            'code': 'DGM',
+            'type': 'expansion',
+            'block': 'Return to Ravnica',
+            'releaseDate': '2013-05-03',
+            'cards': [
+                _card('Alive // Well', '121', side='a', layout='split',
+                      faceName='Alive', manaCost='{3}{G}',
+                      type='Sorcery'),
+                _card('Alive // Well', '121', side='b', layout='split',
+                      faceName='Well', manaCost='{W}', type='Sorcery'),
+                _card('Æther Vial', '1', manaCost='{1}{B/P}{W/U}',
+                      type='Artifact', rarity='uncommon'),
+            ],
+        },
+        'ME4': {
+            'name': 'Masters Edition IV',
+            'code': 'ME4',
+            'type': 'masters',
+            'isOnlineOnly': True,
+            'releaseDate': '2011-01-10',
+            'cards': [],
+        },
+    },
+}
+
+
+@pytest.fixture(params=['plain', 'gzip', 'legacy'])
+def dump_path(request, tmpdir):
+    if request.param == 'legacy':
+        # The sets used to be at the top level of the file.
+        data = json.dumps(DUMP['data'], ensure_ascii=False, indent=2)
+    else:
+        data = json.dumps(DUMP, ensure_ascii=False, indent=2)
+    if request.param == 'gzip':
+        path = tmpdir.join('AllPrintings.json.gz')
+        with gzip.open(str(path), 'wb') as f:
+            f.write(data.encode('utf-8'))
+    else:
+        path = tmpdir.join('AllPrintings.json')
+        path.write_binary(data.encode('utf-8'))
+    return str(path)
+
+
+class TestMTGJSONParser:
+    def test_parse_blocks_sets(self, dump_path):
+        blocksets = list(MTGJSONParser(dump_path).parse_blocks_sets())
+        assert [(b.name, b.category, [s.code for s in sets])
+                for b, sets in blocksets] == [
+            ('Core Sets', Block.CATEGORY_CORE_SET, ['ORI']),
+            ('Return to Ravnica', Block.CATEGORY_EXPANSION, ['DGM']),
+            ('MTGO', Block.CATEGORY_MTGO, ['ME4']),
+        ]
+        set_ = blocksets[1][1][0]
+        assert set_.name == "Dragon's Maze"
+        assert set_.release_date == datetime.date(2013, 5, 3)
+
+    def test_parse_cards_by_set(self, dump_path):
+        entries = list(MTGJSONParser(dump_path, chunk_size=16)
+                       .parse_cards_by_set('ori'))
+        # Sorted by number and without the card lacking one.
+        assert [(e.number, e.number_suffix, c.name)
+                for e, c, *_ in entries] == [
+            (60, 'a', "Jace, Vryn's Prodigy"),
+            (60, 'b', 'Jace, Telepath Unbound'),
+            (80, '', 'Tower Geist'),
+            (261, '', 'Swamp'),
+        ]
+        edition, card, artist, rulings = entries[0]
+        assert edition.rarity == CardEdition.RARITY_MYTHIC_RARE
+        assert card.multi_type == Card.MULTI_FLIP
+        assert card.power == 0 and card.toughness == 2
+        assert artist.name == 'Some Artist'
+        assert [(r.date, r.ruling) for r in rulings] == [
+            (datetime.date(2015, 6, 22), 'Jace transforms.')]
+        assert entries[1][1].loyalty == 5
+        assert entries[3][0].rarity == CardEdition.RARITY_LAND
+
+        card = entries[2][1]
+        assert card.multiverseid == 398441
+        assert card.get_mana() == '3U'
+        assert card.cmc == 4
+        assert card.rules == ('Flying\n\nWhen Tower Geist enters the '
+                              'battlefield, draw a card.')
+        assert card.legal_vintage == Card.LEGALITY_LEGAL
+        assert card.legal_modern == Card.LEGALITY_BANNED
+        assert card.legal_legacy == Card.LEGALITY_NONE
+
+    def test_parse_set_table(self, dump_path):
+        parser = MTGJSONParser(dump_path)
+        assert [(e.number, e.number_suffix)
+                for e in parser.parse_set_table('DGM')] == [
+            (1, ''), (121, 'a'), (121, 'b')]
+        entries = parser.parse_cards_by_set('DGM', numbers={'121b', '1'})
+        assert [c.name for _, c, _, _ in entries] == [
+            'Æther Vial', 'Well (Alive/Well)']
+
+    def test_parse_card(self, dump_path):
+        parser = MTGJSONParser(dump_path)
+        card, artist, rulings = parser.parse_card('DGM', '121b')
+        assert card.name == 'Well (Alive/Well)'
+        assert card.multi_type == Card.MULTI_SPLIT
+        card, _, _ = parser.parse_card('DGM', '1')
+        assert card.name == 'Æther Vial'
+        assert card.get_mana() == '1{BP}{W/U}'
+        with pytest.raises(KeyError):
+            parser.parse_card('DGM', '2')
+
+    @pytest.mark.django_db
+    def test_insert_from_parser(self, dump_path):
+        insert_blocks_sets_cards_from_parser(parser=MTGJSONParser(dump_path))
+        assert Set.objects.count() == 3
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        alive = Card.objects.get(name='Alive (Alive/Well)')
+        assert ([c.name for c in alive.multi_cards.all()] ==
+                ['Well (Alive/Well)'])
+        jace = Card.objects.get(name="Jace, Vryn's Prodigy")
+        assert jace.rulings.count() == 1
+
+    @pytest.mark.django_db
+    def test_decompress_once(self, dump_path, monkeypatch):
+        opened = []
+
+        def gzip_open(*args):
+            opened.append(args)
+            return gzip.open(*args)
+
+        monkeypatch.setitem(MTGJSONParser.OPENERS, '.gz', gzip_open)
+        parser = MTGJSONParser(dump_path)
+        insert_blocks_sets_cards_from_parser(parser=parser)
+        assert CardEdition.objects.count() == 7
+        assert len(opened) == (1 if dump_path.endswith('.gz') else 0)
+        parser.close()
@@ -1,6 +1,9 @@
 # coding: utf-8
 import datetime
+import glob
+import os
 import pytest
+import time
 
 from bs4 import BeautifulSoup
 from django.test import TestCase
@@ -15,9 +18,14 @@ from cardbox.models import (
 )
 
 from cardbox.utils.parser import (
+    map_ordered,
     MCIParser,
+    FastMCIParser,
+    ProcessMCIParser,
 )
 
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
 @pytest.fixture(scope='module')
 def blockset():
     blocks = []
@@ -759,3 +767,107 @@ Allosaurus Rider's power and toughness are each equal to 1 plus the number of la
             # Speed up the process a little bit by not loading all cards.
             if i >= max_index:
                 break
+
+    def test_parse_set_pro_workers(self):
+        """Fetching several cards at once keeps the order of the set."""
+        sequential = [(e.number, e.number_suffix, c.name) for e, c, *_ in
+                      MCIParser.parse_cards_by_set('pro', workers=1)]
+        parallel = [(e.number, e.number_suffix, c.name) for e, c, *_ in
+                    MCIParser.parse_cards_by_set('pro', workers=8)]
+        assert parallel == sequential
+
+
+@pytest.mark.parametrize('workers', [1, 2, 8])
+def test_map_ordered(workers):
+    def slow_square(i):
+        # Later items finish first when run concurrently.
+        time.sleep((10 - i)/1000)
+        return i*i
+
+    results = list(map_ordered(slow_square, range(10), workers))
+    assert results == [i*i for i in range(10)]
+
+
+def _card_page_paths():
+    return sorted(glob.glob(os.path.join(PAGES_DIR, '*', 'en', '*.html')))
+
+
+def _parsed_fields(parser, path):
+    """Return everything the parser extracts from a recorded page."""
+    setcode = os.path.basename(os.path.dirname(os.path.dirname(path)))
+    number = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+    card, artist, rulings = parser._parse_card_html(html, setcode, number)
+    fields = {f.attname: getattr(card, f.attname)
+              for f in Card._meta.concrete_fields}
+    return (fields, artist.name,
+            [(ruling.date, ruling.ruling) for ruling in rulings])
+
+
+@pytest.mark.parametrize('path', _card_page_paths())
+def test_fast_mci_parser_card(path):
+    """The fast engine parses card pages exactly like the default one."""
+    assert (_parsed_fields(FastMCIParser, path) ==
+            _parsed_fields(MCIParser, path))
+
+
+@pytest.mark.parametrize('setcode', ['ori', 'dgm'])
+def test_fast_mci_parser_set_table(setcode):
+    with open(os.path.join(PAGES_DIR, setcode, 'en.html'),
+              encoding='utf-8') as f:
+        html = f.read()
+    rows = [(e.number, e.number_suffix, e.rarity, number_str) for
+            e, number_str in MCIParser._parse_set_table_html(html)]
+    fast_rows = [(e.number, e.number_suffix, e.rarity, number_str) for
+                 e, number_str in FastMCIParser._parse_set_table_html(html)]
+    assert len(rows) > 0
+    assert fast_rows == rows
+
+
+@pytest.mark.parametrize('setcode', ['ori', 'dgm'])
+def test_process_mci_parser(mci_url, setcode):
+    """Parsing in other processes returns the same cards in order."""
+    class Parser(MCIParser):
+        URL = mci_url
+
+    class ProcessParser(ProcessMCIParser):
+        URL = mci_url
+
+    def entries(parser, **kwargs):
+        return [(e.number, e.number_suffix, e.rarity,
+                 {f.attname: getattr(c, f.attname)
+                  for f in Card._meta.concrete_fields},
+                 a.name, [(r.date, r.ruling) for r in rulings])
+                for e, c, a, rulings
+                in parser.parse_cards_by_set(setcode, **kwargs)]
+
+    expected = entries(Parser)
+    assert len(expected) > 0
+    with ProcessParser.pool():
+        assert entries(ProcessParser, workers=4, processes=2) == expected
+        last = '{0}{1}'.format(*expected[-1][:2])
+        assert entries(ProcessParser, numbers={last}) == expected[-1:]
+
+
+def test_process_mci_parser_pool(mci_url, monkeypatch):
+    """The processes are started once for all sets of a run."""
+    class ProcessParser(ProcessMCIParser):
+        URL = mci_url
+
+    started = []
+    get_executor = ProcessMCIParser._get_executor.__func__
+
+    def counting_get_executor(cls, processes=None):
+        executor, processes = get_executor(cls, processes)
+        started.append(executor)
+        return executor, processes
+
+    monkeypatch.setattr(ProcessMCIParser, '_get_executor',
+                        classmethod(counting_get_executor))
+    with ProcessParser.pool(processes=2):
+        for setcode in ['ori', 'dgm']:
+            assert list(ProcessParser.parse_cards_by_set(setcode))
+    assert len(started) == 3
+    assert len(set(started)) == 1
+    assert ProcessMCIParser._pool['executor'] is None
@@ -0,0 +1,102 @@
+# coding: utf-8
+import json
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from cardbox.models import (
+    Set,
+    Card,
+    CardEdition,
+)
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+from cardbox.utils.pipeline import (
+    ImportPipeline,
+    UnknownSetError,
+    run_pipeline,
+)
+
+from cardbox.management.commands.cardbox_import import (
+    Command,
+)
+
+
+@pytest.fixture
+def parser(mci_url):
+    class Parser(MCIParser):
+        URL = mci_url
+    return Parser
+
+
+@pytest.mark.django_db
+class TestRunPipeline:
+    def test_import(self, parser):
+        statuses = []
+        report = run_pipeline(parser, workers=4,
+                              progress=lambda p: statuses.append(p.status()))
+        assert Card.objects.count() == 6
+        assert CardEdition.objects.count() == 6
+        jace = Card.objects.get(name="Jace, Vryn's Prodigy")
+        assert jace.multi_cards.count() == 1
+        assert report.get('CardEdition', 'inserted') == 6
+        assert report.sets['ORI']['fetch'] > 0
+        assert report.sets['ORI']['write'] > 0
+        assert statuses[-1]['cards'] == 6
+        assert statuses[-1]['sets'] == statuses[-1]['sets_total']
+
+        report = run_pipeline(parser, update=True)
+        assert report.get('CardEdition', 'unchanged') == 6
+        assert report.totals()['inserted'] == 0
+
+    def test_small_queues(self, parser, monkeypatch):
+        """A slow writer holds up the other stages."""
+        monkeypatch.setattr(ImportPipeline, 'QUEUE_SIZE', 1)
+        run_pipeline(parser, workers=1)
+        assert CardEdition.objects.count() == 6
+
+    def test_dry_run(self, parser):
+        report = run_pipeline(parser, dry_run=True)
+        assert report.pages > 6
+        assert Set.objects.count() == 0
+        assert Card.objects.count() == 0
+
+    def test_sets(self, parser):
+        run_pipeline(parser, setcodes=['ori'])
+        assert CardEdition.objects.filter(mtgset__code='ORI').count() == 4
+        assert CardEdition.objects.exclude(mtgset__code='ORI').count() == 0
+        with pytest.raises(UnknownSetError):
+            run_pipeline(parser, setcodes=['ORI', 'XXX'])
+
+    def test_fetch_error(self, parser):
+        class Parser(parser):
+            @classmethod
+            def _card_url(cls, setcode, number):
+                if number == '80':
+                    raise KeyError(number)
+                return super()._card_url(setcode, number)
+
+        with pytest.raises(KeyError):
+            run_pipeline(Parser, setcodes=['ORI'])
+        assert CardEdition.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestImportCommand:
+    def test_command(self, parser, monkeypatch, tmpdir):
+        monkeypatch.setattr(Command, 'PARSER', parser)
+        path = str(tmpdir.join('report.json'))
+        call_command('cardbox_import', sets=['DGM'], report=path,
+                     verbosity=0)
+        assert CardEdition.objects.filter(mtgset__code='DGM').count() == 2
+        with open(path) as f:
+            assert json.load(f)['rows']['Card']['inserted'] == 2
+
+    def test_unknown_set(self, parser, monkeypatch):
+        monkeypatch.setattr(Command, 'PARSER', parser)
+        with pytest.raises(CommandError):
+            call_command('cardbox_import', sets=['XXX'], verbosity=0)
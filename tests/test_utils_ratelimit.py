@@ -0,0 +1,187 @@
+# coding: utf-8
+import pytest
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+
+from cardbox.utils.http import (
+    HTTPClient,
+)
+
+from cardbox.utils.ratelimit import (
+    TokenBucket,
+    RateLimiter,
+)
+
+URL = 'http://example.com/page'
+
+
+class FakeClock:
+    """Clock that only moves when sleeping."""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _limiter(clock, **kwargs):
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+    # Disable the cooldown unless a test needs it.
+    limiter.COOLDOWN = 0
+    return limiter
+
+
+def _request(limiter, clock, status_code=200, latency=0.1,
+             retry_after=None):
+    limiter.acquire(URL)
+    clock.now += latency
+    limiter.release(URL, status_code, latency, retry_after)
+
+
+class TestTokenBucket:
+    def test_take(self, clock):
+        bucket = TokenBucket(rate=2, burst=1, clock=clock)
+        assert bucket.take() == 0
+        assert bucket.take() == 0.5
+        assert bucket.take() == 1.0
+        clock.now += 1.0
+        assert bucket.take() == 0.5
+
+    def test_burst(self, clock):
+        bucket = TokenBucket(rate=1, burst=3, clock=clock)
+        clock.now += 100
+        assert [bucket.take() for _ in range(4)] == [0, 0, 0, 1.0]
+
+    def test_pause(self, clock):
+        bucket = TokenBucket(rate=1, burst=3, clock=clock)
+        bucket.pause(10)
+        assert bucket.take() == 11.0
+
+
+class TestRateLimiter:
+    def test_increase(self, clock):
+        limiter = _limiter(clock, rate=2, concurrency=1)
+        for _ in range(20):
+            _request(limiter, clock)
+        assert limiter.get_rate(URL) > 6
+        assert limiter.report()['example.com']['concurrency'] > 1
+        assert limiter.report()['example.com']['in_flight'] == 0
+
+    def test_rate_is_kept(self, clock):
+        """Requests never start faster than the current rate."""
+        limiter = _limiter(clock, rate=4, burst=1, concurrency=10)
+        for _ in range(9):
+            limiter.acquire(URL)
+        assert clock.now == 2.0
+
+    @pytest.mark.parametrize('status_code', [429, 503, None])
+    def test_decrease(self, clock, status_code):
+        limiter = _limiter(clock, rate=8, concurrency=4)
+        _request(limiter, clock, status_code=status_code)
+        assert limiter.get_rate(URL) == 4
+        assert limiter.report()['example.com']['concurrency'] == 2
+
+    def test_minimum_rate(self, clock):
+        limiter = _limiter(clock, rate=1)
+        for _ in range(5):
+            _request(limiter, clock, status_code=503)
+        assert limiter.get_rate(URL) == RateLimiter.MIN_RATE
+        assert limiter.report()['example.com']['concurrency'] == 1
+
+    def test_no_decrease_on_404(self, clock):
+        limiter = _limiter(clock, rate=8)
+        _request(limiter, clock, status_code=404)
+        assert limiter.get_rate(URL) == 8
+
+    def test_rising_latency(self, clock):
+        limiter = _limiter(clock, rate=8)
+        _request(limiter, clock, latency=0.1)
+        rate = limiter.get_rate(URL)
+        for _ in range(3):
+            _request(limiter, clock, latency=2.0)
+        assert limiter.get_rate(URL) < rate / 2
+
+    def test_cooldown(self, clock):
+        limiter = _limiter(clock, rate=8)
+        limiter.COOLDOWN = 10
+        # Responses to requests sent before the backoff only count
+        # once.
+        for _ in range(3):
+            _request(limiter, clock, status_code=503, latency=0)
+        assert limiter.get_rate(URL) == 4
+
+    def test_retry_after(self, clock):
+        limiter = _limiter(clock, rate=8)
+        _request(limiter, clock, status_code=429, latency=0,
+                 retry_after='30')
+        limiter.acquire(URL)
+        assert clock.sleeps[-1] >= 30
+
+    def test_hosts_are_independent(self, clock):
+        limiter = _limiter(clock, rate=8)
+        _request(limiter, clock, status_code=503)
+        assert limiter.get_rate('http://example.org/') == 8
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = Counter()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        _Handler.hits[self.path] += 1
+        if self.path == '/limited' and _Handler.hits[self.path] <= 2:
+            self.send_response(429)
+            self.send_header('Retry-After', '5')
+            body = b''
+        else:
+            self.send_response(200)
+            body = b'Hello'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server_url(serve):
+    _Handler.hits.clear()
+    with serve(_Handler) as url:
+        yield url
+
+
+class TestHTTPClientWithLimiter:
+    def test_backs_off_on_429(self, server_url, clock):
+        limiter = _limiter(clock, rate=8)
+        client = HTTPClient(retries=3, limiter=limiter)
+        response = client.get(server_url + '/limited')
+        assert response.status_code == 200
+        assert _Handler.hits['/limited'] == 3
+        # Two backoffs and both Retry-After pauses were waited for.
+        assert limiter.get_rate(server_url) < 8 / 2
+        assert sum(clock.sleeps) >= 10
+
+    def test_retries_exhausted(self, server_url, clock):
+        client = HTTPClient(retries=1, limiter=_limiter(clock))
+        response = client.get(server_url + '/limited')
+        assert response.status_code == 429
+        assert _Handler.hits['/limited'] == 2
+
+    def test_steady(self, server_url, clock):
+        limiter = _limiter(clock, rate=5, burst=1)
+        client = HTTPClient(limiter=limiter)
+        for _ in range(11):
+            assert client.get(server_url + '/page').status_code == 200
+        assert limiter.get_rate(server_url) > 5
+        assert limiter.report()[server_url.split('//')[1]]['in_flight'] == 0
@@ -0,0 +1,103 @@
+# coding: utf-8
+import json
+import pytest
+
+from cardbox.utils.report import (
+    ImportReport,
+    bind_report,
+    timer,
+)
+
+
+class FakeClock:
+    """Clock that only moves when told to."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestImportReport:
+    def test_counts(self, clock):
+        report = ImportReport(clock=clock)
+        report.add('Card', 'inserted', 3)
+        report.add('Card', 'unchanged')
+        report.add('Artist', 'updated', 2)
+        assert report.get('Card', 'inserted') == 3
+        assert report.get('Ruling', 'inserted') == 0
+        assert report.totals() == {'inserted': 3, 'updated': 2,
+                                   'unchanged': 1}
+        with pytest.raises(ValueError):
+            report.add('Card', 'deleted')
+
+    def test_timer(self, clock):
+        report = ImportReport(clock=clock)
+        report.start_set('ORI')
+        with report.timer('fetch'):
+            clock.now += 2
+        with report.timer('parse'):
+            clock.now += 1
+        report.start_set('DGM')
+        with pytest.raises(KeyError):
+            with report.timer('write'):
+                clock.now += 0.5
+                raise KeyError()
+        assert report.sets['ORI'] == {'fetch': 2, 'parse': 1, 'write': 0}
+        assert report.sets['DGM']['write'] == 0.5
+        assert report.phase_totals() == {'fetch': 2, 'parse': 1,
+                                         'write': 0.5}
+        with pytest.raises(ValueError):
+            report.add_time('sleep', 1)
+
+    def test_pages_per_second(self, clock):
+        report = ImportReport(clock=clock)
+        for _ in range(10):
+            report.add_page()
+        clock.now += 4
+        report.finish()
+        clock.now += 100
+        assert report.elapsed() == 4
+        assert report.pages_per_second() == 2.5
+
+    def test_merge(self, clock):
+        report = ImportReport(clock=clock)
+        report.add('Card', 'inserted')
+        report.add_time('write', 1, 'ORI')
+        other = ImportReport(clock=clock)
+        other.add('Card', 'inserted', 2)
+        other.add_time('write', 3, 'DGM')
+        other.add_page()
+        # As returned by a worker process.
+        report.merge(json.loads(other.to_json()))
+        assert report.get('Card', 'inserted') == 3
+        assert report.pages == 1
+        assert list(report.sets) == ['ORI', 'DGM']
+
+    def test_no_report(self):
+        with timer(None, 'fetch'):
+            pass
+
+
+class TestBindReport:
+    class Parser:
+        REPORT = None
+
+    def test_class(self):
+        report = ImportReport()
+        bound = bind_report(self.Parser, report)
+        assert bound.REPORT is report
+        assert issubclass(bound, self.Parser)
+        assert self.Parser.REPORT is None
+
+    def test_instance(self):
+        parser = self.Parser()
+        first = bind_report(parser, ImportReport())
+        second = bind_report(parser, ImportReport())
+        assert first.REPORT is not second.REPORT
+        assert parser.REPORT is None
@@ -0,0 +1,184 @@
+# coding: utf-8
+import datetime
+import io
+import json
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+from cardbox.models import (
+    Collection,
+    CollectionEntry,
+    CollectionImport,
+)
+
+from cardbox.utils.db import (
+    LineError,
+    insert_blocks_sets_cards_from_parser,
+)
+
+from cardbox.utils import uploads
+
+from cardbox.utils.parser import (
+    MCIParser,
+)
+
+CSV = ('Count,Foil,Number,Set\n'
+       '2,1,60a,ori\n'
+       '1,,80,ORI\n'
+       'x,0,80,ORI\n'
+       '1,0,999,ORI\n'
+       '1,1,60a,ORI\n')
+
+JSON = json.dumps([
+    {'count': 2, 'foil_count': 1, 'number': '60a', 'set': 'ORI'},
+    {'count': 1, 'number': 80, 'set': 'ori'},
+    {'count': 'x', 'number': 80, 'set': 'ORI'},
+    {'count': 1, 'number': 999, 'set': 'ORI'},
+    {'count': 1, 'foil_count': 1, 'number': '60a', 'set': 'ORI'},
+])
+
+
+class TestReaders:
+    def test_csv(self):
+        rows = list(uploads.iter_csv_rows(io.BytesIO(CSV.encode())))
+        assert rows[0] == (2, '2,1,60a,ori', (2, 1, 'ORI', 60, 'a'))
+        assert rows[1][2] == (1, 0, 'ORI', 80, '')
+        assert isinstance(rows[2], LineError)
+        assert rows[2].line_number == 4
+        assert len(rows) == 5
+
+    def test_csv_missing_column(self):
+        with pytest.raises(ValueError):
+            list(uploads.iter_csv_rows(io.BytesIO(b'count,set\n1,ORI\n')))
+
+    def test_json(self):
+        rows = list(uploads.iter_json_rows(io.BytesIO(JSON.encode())))
+        assert rows[0][2] == (2, 1, 'ORI', 60, 'a')
+        assert rows[1][2] == (1, 0, 'ORI', 80, '')
+        assert isinstance(rows[2], LineError)
+        assert rows[2].line_number == 3
+        assert list(uploads.iter_json_rows(io.BytesIO(b' [ ] '))) == []
+
+    def test_get_reader(self):
+        assert uploads.get_reader('Inventory.CSV') is uploads.iter_csv_rows
+        with pytest.raises(ValueError):
+            uploads.get_reader('inventory.txt')
+
+
+@pytest.mark.django_db
+class TestRunCollectionImport:
+    @pytest.fixture
+    def job(self, mci_url):
+        class Parser(MCIParser):
+            URL = mci_url
+        insert_blocks_sets_cards_from_parser(Parser)
+        owner = User.objects.create(username='owner')
+        collection = Collection.objects.create(
+            name='Binder', owner=owner, date_created=datetime.date.today())
+        return CollectionImport(collection=collection, user=owner)
+
+    @pytest.mark.parametrize('filename,content', [
+        ('inventory.csv', CSV),
+        ('inventory.json', JSON),
+    ])
+    def test_import(self, job, tmpdir, monkeypatch, filename, content):
+        monkeypatch.setattr(uploads, 'CHUNK_SIZE', 2)
+        path = tmpdir.join(filename)
+        path.write(content)
+        job.filename = filename
+        job.size = path.size()
+        job.save()
+
+        uploads.run_collection_import(job, str(path))
+        job.refresh_from_db()
+        assert job.status == CollectionImport.STATUS_DONE
+        assert job.get_progress() == 100
+        assert job.bytes_done == job.size
+        assert (job.rows_done, job.rows_imported) == (5, 3)
+        assert job.error_count == 2
+        assert len(job.errors.split('\n')) == 2
+        assert not path.exists()
+        entry = CollectionEntry.objects.get(edition__number=60,
+                                            edition__number_suffix='a')
+        assert (entry.count, entry.foil_count) == (3, 2)
+        assert CollectionEntry.objects.count() == 2
+
+    def test_failed(self, job, tmpdir):
+        path = tmpdir.join('inventory.json')
+        path.write('{"count": 1}')
+        job.filename = 'inventory.json'
+        job.save()
+
+        uploads.run_collection_import(job, str(path))
+        job.refresh_from_db()
+        assert job.status == CollectionImport.STATUS_FAILED
+        assert job.is_finished()
+        assert job.error_count == 1
+
+    def test_missing_file(self, job, tmpdir):
+        job.filename = 'inventory.csv'
+        job.save()
+
+        uploads.run_collection_import(job, str(tmpdir.join('inventory.csv')))
+        job.refresh_from_db()
+        assert job.status == CollectionImport.STATUS_FAILED
+        assert job.date_finished is not None
+
+    def test_fail_stale_imports(self, job):
+        job.save()
+        running = CollectionImport.objects.create(
+            collection=job.collection, user=job.user,
+            status=CollectionImport.STATUS_RUNNING)
+        done = CollectionImport.objects.create(
+            collection=job.collection, user=job.user,
+            status=CollectionImport.STATUS_DONE)
+        imports = CollectionImport.objects.all()
+        assert uploads.fail_stale_imports(imports) == 0
+
+        CollectionImport.objects.update(
+            date_updated=timezone.now() - uploads.STALE_AFTER
+            - datetime.timedelta(seconds=1))
+        assert uploads.fail_stale_imports(imports) == 2
+        for stale in (job, running):
+            stale.refresh_from_db()
+            assert stale.status == CollectionImport.STATUS_FAILED
+            assert stale.is_finished()
+            assert stale.error_count == 1
+        done.refresh_from_db()
+        assert done.status == CollectionImport.STATUS_DONE
+
+
+@pytest.mark.django_db(transaction=True)
+class TestStartCollectionImport:
+    @pytest.fixture
+    def collection(self):
+        owner = User.objects.create(username='owner')
+        return Collection.objects.create(
+            name='Binder', owner=owner, date_created=datetime.date.today())
+
+    def test_rollback(self, collection, monkeypatch):
+        saved = []
+        monkeypatch.setattr(uploads, '_save_upload', saved.append)
+        upload = SimpleUploadedFile('inventory.csv', CSV.encode())
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                uploads.start_collection_import(collection, collection.owner,
+                                                upload)
+                raise RuntimeError
+        assert saved == []
+        assert not CollectionImport.objects.exists()
+
+    def test_save_failed(self, collection, monkeypatch):
+        def save_upload(upload):
+            raise OSError("No space left on device")
+        monkeypatch.setattr(uploads, '_save_upload', save_upload)
+        upload = SimpleUploadedFile('inventory.csv', CSV.encode())
+        job = uploads.start_collection_import(collection, collection.owner,
+                                              upload)
+        job.refresh_from_db()
+        assert job.status == CollectionImport.STATUS_FAILED
+        assert 'No space left' in job.errors
@@ -0,0 +1,50 @@
+# coding: utf-8
+import datetime
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import Client
+from django.utils import timezone
+
+from cardbox.models import (
+    Collection,
+    CollectionImport,
+)
+
+from cardbox.utils import uploads
+
+
+@pytest.mark.django_db
+class TestCollectionImportStatus:
+    """All tests for :func:`cardbox.views.collection_import_status`."""
+    @pytest.fixture
+    def job(self):
+        owner = User.objects.create(username='owner')
+        collection = Collection.objects.create(
+            name='Binder', owner=owner, date_created=datetime.date.today())
+        job = CollectionImport.objects.create(
+            collection=collection, user=owner, filename='inventory.csv',
+            status=CollectionImport.STATUS_RUNNING)
+        # Without progress for longer than an import may take.
+        CollectionImport.objects.update(
+            date_updated=timezone.now() - uploads.STALE_AFTER
+            - datetime.timedelta(seconds=1))
+        return job
+
+    def _get(self, user, job, **extra):
+        client = Client()
+        client.force_login(user)
+        return client.get(reverse('cardbox:collection_import_status',
+                                  args=[job.id]), **extra)
+
+    def test_stale(self, job):
+        self._get(job.user, job, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        job.refresh_from_db()
+        assert job.status == CollectionImport.STATUS_FAILED
+
+    def test_no_permission(self, job):
+        before = CollectionImport.objects.values().get(pk=job.pk)
+        response = self._get(User.objects.create(username='other'), job)
+        assert response.status_code == 403
+        assert CollectionImport.objects.values().get(pk=job.pk) == before